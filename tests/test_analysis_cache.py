@@ -0,0 +1,66 @@
+# test_analysis_cache.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""AnalysisCache with an AnalysisStore used in an executor tests."""
+
+import asyncio
+import os
+import sqlite3
+import tempfile
+import unittest
+from concurrent.futures import ThreadPoolExecutor
+
+from uci_net.analysis_cache import AnalysisCache
+from uci_net.analysis_store import AnalysisStore
+from uci_net.fen import STARTPOS_FEN
+
+LINES = ["info depth 5 score cp 20 pv e2e4", "bestmove e2e4"]
+
+
+class AnalysisCacheExecutor(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.directory.name, "analysis.db")
+        self.cache = AnalysisCache(
+            10,
+            store=AnalysisStore(self.path, engine="test", timeout=0.05),
+            executor=ThreadPoolExecutor(max_workers=1),
+        )
+        self.loop = asyncio.new_event_loop()
+
+    def tearDown(self):
+        self.cache.close()
+        self.loop.close()
+        self.directory.cleanup()
+
+    def fetch(self, cache):
+        return self.loop.run_until_complete(cache.fetch(STARTPOS_FEN, 1, 5))
+
+    def test_put_is_written_through(self):
+        self.cache.put(STARTPOS_FEN, 1, 5, LINES)
+        self.cache.executor.shutdown(wait=True)
+        cache = AnalysisCache(
+            10,
+            store=self.cache.store,
+            executor=ThreadPoolExecutor(max_workers=1),
+        )
+        self.assertEqual(self.fetch(cache), LINES)
+        self.assertEqual(cache.hits, 1)
+        cache.executor.shutdown(wait=True)
+
+    def test_locked_store_write_is_dropped(self):
+        blocker = sqlite3.connect(self.path, isolation_level=None)
+        blocker.execute("BEGIN EXCLUSIVE")
+        try:
+            self.cache.put(STARTPOS_FEN, 1, 5, LINES)
+            self.cache.executor.shutdown(wait=True)
+        finally:
+            blocker.close()
+        self.assertEqual(self.cache.store_errors, 1)
+        self.assertEqual(self.fetch(self.cache), LINES)
+        self.assertFalse(self.cache.store.contains(STARTPOS_FEN, 1, 5))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+# test_batch.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""UCIServer.reply_to_batch tests with engines which are not started."""
+
+import asyncio
+import unittest
+
+from uci_net.fen import STARTPOS_FEN
+from uci_net.tcp_protocol import decode_frame
+from uci_net.tcp_server import UCIServer, EngineProcess
+
+
+class FakeEngine(EngineProcess):
+    """Reply to commands at once rather than from a run_driver process."""
+
+    def __init__(self, loop):
+        super().__init__("engine", "", "engine")
+        self.replies = asyncio.Queue()
+        self.loop = loop
+        self.resets = 0
+        self.searches = 0
+
+    def put(self, command):
+        word = command.split(maxsplit=1)[0]
+        if word == "ucinewgame":
+            self.resets += 1
+        elif word == "isready":
+            self.replies.put_nowait(("engine", ["readyok"]))
+        elif word == "go":
+            self.searches += 1
+            self.replies.put_nowait(
+                ("engine", ["info depth 1 pv e2e4", "bestmove e2e4"])
+            )
+
+
+class FakeWriter:
+    def __init__(self):
+        self.frames = []
+
+    def write(self, data):
+        self.frames.extend(data.splitlines())
+
+    async def drain(self):
+        pass
+
+
+class ReplyToBatch(unittest.TestCase):
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        self.server = UCIServer(engines=2)
+        self.server.engine_name = "engine"
+        self.server.engine_processes = [
+            FakeEngine(self.loop) for _ in range(self.server.engines)
+        ]
+
+    def tearDown(self):
+        self.loop.close()
+
+    def batch(self, options):
+        writer = FakeWriter()
+        self.loop.run_until_complete(
+            self.server.reply_to_batch(options, writer)
+        )
+        return [decode_frame(frame) for frame in writer.frames]
+
+    def test_one_reset_per_engine(self):
+        replies = self.batch({"jobs": [(STARTPOS_FEN, 5, 1)] * 6})
+        engines = self.server.engine_processes
+        self.assertEqual(sum(e.searches for e in engines), 6)
+        self.assertLessEqual(sum(e.resets for e in engines), len(engines))
+        self.assertEqual(len(replies), 7)
+        self.assertTrue(all(e.session is None for e in engines))
+
+    def test_invalid_jobs(self):
+        replies = self.batch({"jobs": 3})
+        self.assertEqual(len(replies), 1)
+        self.assertEqual(
+            replies[0]["lines"], ["info string invalid jobs", "bestmove 0000"]
+        )
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,31 @@
+# test_engine.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Engine.engine_results tests."""
+
+import unittest
+
+from uci_net.engine import Engine
+
+
+class EngineResults(unittest.TestCase):
+    def test_busy_reply(self):
+        results = Engine().engine_results(
+            ["info string busy, retry after 500 ms", "bestmove 0000"]
+        )
+        self.assertEqual(
+            results.lines,
+            ["info string busy, retry after 500 ms", "bestmove 0000"],
+        )
+
+    def test_info_with_pv_not_in_lines(self):
+        results = Engine().engine_results(
+            ["info depth 5 score cp 20 pv e2e4 e7e5", "bestmove e2e4"]
+        )
+        self.assertEqual(results.lines, ["bestmove e2e4"])
+        self.assertEqual(len(results.pvs), 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
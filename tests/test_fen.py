@@ -0,0 +1,32 @@
+# test_fen.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""fen_from_position_command tests."""
+
+import unittest
+
+from uci_net.fen import fen_from_position_command, STARTPOS_FEN
+
+
+class FenFromPositionCommand(unittest.TestCase):
+    def test_startpos(self):
+        self.assertEqual(
+            fen_from_position_command("position startpos"), STARTPOS_FEN
+        )
+
+    def test_startpos_moves(self):
+        self.assertEqual(
+            fen_from_position_command("position startpos moves e2e4"),
+            "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1",
+        )
+
+    def test_moves_without_position(self):
+        self.assertIsNone(fen_from_position_command("position moves e2e4"))
+
+    def test_position_only(self):
+        self.assertIsNone(fen_from_position_command("position"))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,64 @@
+# test_tcp_client.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""request_options and ServerList tests."""
+
+import socket
+import threading
+import unittest
+from urllib.parse import urlsplit
+
+from uci_net.tcp_client import request_options, ServerList
+
+
+class RequestOptions(unittest.TestCase):
+    def test_integer_options(self):
+        options, ignored = request_options(
+            urlsplit("//h:1?name=e&compress=1024&deadline=500")
+        )
+        self.assertEqual(options["compress"], 1024)
+        self.assertEqual(options["deadline"], 500)
+        self.assertEqual(ignored, [])
+
+    def test_bad_integer_option_ignored(self):
+        options, ignored = request_options(
+            urlsplit("//h:1?name=e&compress=big&deadline=500")
+        )
+        self.assertNotIn("compress", options)
+        self.assertEqual(options["deadline"], 500)
+        self.assertEqual(ignored, [("compress", "big")])
+
+
+
+class ServerListNoReply(unittest.TestCase):
+    def setUp(self):
+        self.listener = socket.socket()
+        self.listener.bind(("127.0.0.1", 0))
+        self.listener.listen(5)
+        self.closer = threading.Thread(target=self.close_connections)
+        self.closer.daemon = True
+        self.closer.start()
+
+    def tearDown(self):
+        self.listener.close()
+
+    def close_connections(self):
+        try:
+            while True:
+                connection = self.listener.accept()[0]
+                connection.recv(65536)
+                connection.close()
+        except OSError:
+            pass
+
+    def test_every_server_closes_without_reply(self):
+        address = self.listener.getsockname()
+        servers = ServerList([address, address])
+        with self.assertRaises(ConnectionError):
+            list(servers.iter_reply("['isready']"))
+        self.assertTrue(all(s.unavailable_until for s in servers.servers))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,62 @@
+# test_tcp_protocol.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""tcp_protocol tests."""
+
+import unittest
+
+from uci_net.tcp_protocol import decode_request, failure_lines
+
+
+class FailureLines(unittest.TestCase):
+    def test_go(self):
+        self.assertEqual(
+            failure_lines(
+                ["position startpos", "go depth 5"], "connection\nrefused"
+            ),
+            ["info string connection refused", "bestmove 0000"],
+        )
+
+    def test_isready(self):
+        self.assertEqual(
+            failure_lines(["ucinewgame", "isready"], "reset"),
+            ["info string reset", "readyok"],
+        )
+
+    def test_uci(self):
+        self.assertEqual(
+            failure_lines(["uci"], "reset"), ["info string reset", "uciok"]
+        )
+
+    def test_no_reply_awaited(self):
+        self.assertEqual(
+            failure_lines(["stats"], "reset"), ["info string reset"]
+        )
+
+
+
+class DecodeRequest(unittest.TestCase):
+    def test_list(self):
+        self.assertEqual(decode_request("['isready']"), (["isready"], {}))
+
+    def test_dict(self):
+        self.assertEqual(
+            decode_request("{'commands': ['isready'], 'stream': 'pv'}"),
+            (["isready"], {"stream": "pv"}),
+        )
+
+    def test_invalid(self):
+        for message in (
+            "[]",
+            "{'stream': 'pv'}",
+            "{'commands': 3}",
+            "[1]",
+            "3",
+            "not python",
+        ):
+            self.assertIsNone(decode_request(message), msg=message)
+
+
+if __name__ == "__main__":
+    unittest.main()
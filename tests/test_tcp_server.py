@@ -0,0 +1,56 @@
+# test_tcp_server.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""search_progress and speculative_positions tests."""
+
+import unittest
+
+from uci_net.fen import STARTPOS_FEN
+from uci_net.tcp_server import search_progress, speculative_positions
+
+
+class SearchProgress(unittest.TestCase):
+    def test_depth_and_nps(self):
+        lines = ["info depth 5 nps 1000 pv e2e4", "bestmove e2e4"]
+        self.assertEqual(search_progress(lines), ("5", "1000"))
+
+    def test_nps_last_word(self):
+        self.assertEqual(search_progress(["info depth 5 nps"]), ("5", None))
+
+    def test_depth_last_word(self):
+        self.assertEqual(
+            search_progress(["info depth 4 nps 9", "info depth "]), ("4", "9")
+        )
+
+    def test_no_depth(self):
+        self.assertEqual(search_progress(["bestmove e2e4"]), (None, None))
+
+
+
+class SpeculativePositions(unittest.TestCase):
+    def test_pv(self):
+        positions = speculative_positions(
+            STARTPOS_FEN, ["info depth 5 pv e2e4 e7e5", "bestmove e2e4"], 2
+        )
+        self.assertEqual(len(positions), 2)
+
+    def test_second_multipv_ignored(self):
+        lines = ["info depth 5 multipv 1 pv e2e4", "info multipv 2 pv d2d4"]
+        self.assertEqual(len(speculative_positions(STARTPOS_FEN, lines, 2)), 1)
+
+    def test_truncated_multipv(self):
+        self.assertEqual(
+            speculative_positions(STARTPOS_FEN, ["info multipv"], 2), []
+        )
+
+    def test_info_string_ignored(self):
+        lines = ["info depth 5 pv e2e4", "info string no pv d2d4 here"]
+        positions = speculative_positions(STARTPOS_FEN, lines, 1)
+        self.assertEqual(len(positions), 1)
+        self.assertIn(" b ", positions[0])
+        self.assertIn("4P3", positions[0])
+
+
+if __name__ == "__main__":
+    unittest.main()
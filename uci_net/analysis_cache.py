@@ -0,0 +1,169 @@
+# analysis_cache.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Keep recent analysis of positions for reuse by later requests.
+
+Analysis is keyed by the position_hash() of the position's FEN and the
+MultiPV value, so positions which differ only in move counters, or in
+castling rights and en passant squares which cannot be used, share an entry.
+
+An entry satisfies a request for the same or a smaller depth.
+
+An AnalysisStore can be put behind the cache, as a second level cache which
+survives restarts of the server.
+
+"""
+
+import asyncio
+import sqlite3
+from collections import OrderedDict
+
+from .fen import position_hash
+
+
+class AnalysisCache:
+    """Keep the lines from engine for up to size analysed positions.
+
+    The least recently used entry is dropped when the cache is full.
+
+    If store is not None, it is an AnalysisStore which is searched for
+    analysis not in the cache, and to which analysis put in the cache is
+    added.
+
+    If executor is not None, it is a concurrent.futures.Executor with one
+    worker in which the store is used, so the database does not block an
+    event loop.  The fetch() and store_contains() coroutines search the
+    store, and put() queues the write without waiting for it.  Failed reads
+    are misses and failed writes are dropped, and both are counted in
+    store_errors.
+
+    """
+
+    def __init__(self, size, store=None, executor=None):
+        """Initialise empty cache for size positions."""
+        self.size = size
+        self.store = store
+        self.executor = executor
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.store_errors = 0
+
+    def __len__(self):
+        """Return number of positions in cache."""
+        return len(self.entries)
+
+    def get(self, fen, multipv, depth):
+        """Return lines for fen with multipv to at least depth, or None."""
+        key = (position_hash(fen), multipv)
+        lines = self._get_entry(key, depth)
+        if lines is None and self.store is not None and key[0] is not None:
+            lines = self.store.get(fen, multipv, depth)
+            if lines is not None:
+                self._put_entry(key, depth, lines)
+        return self._count(lines)
+
+    async def fetch(self, fen, multipv, depth):
+        """Return lines like get() but search the store in the executor."""
+        key = (position_hash(fen), multipv)
+        lines = self._get_entry(key, depth)
+        if lines is None and self.store is not None and key[0] is not None:
+            try:
+                lines = await asyncio.get_event_loop().run_in_executor(
+                    self.executor, self.store.get, fen, multipv, depth
+                )
+            except sqlite3.Error:
+                self.store_errors += 1
+            if lines is not None:
+
+                # The entry for the key may have been put while waiting.
+                self._put_entry(key, depth, lines)
+                lines = self._get_entry(key, depth)
+        return self._count(lines)
+
+    def contains(self, fen, multipv, depth):
+        """Return True if analysis of fen to at least depth is in cache.
+
+        The store is not searched if it has an executor.  The hit and miss
+        counts are not changed.
+
+        """
+        entry = self.entries.get((position_hash(fen), multipv))
+        if entry is not None and entry[0] >= depth:
+            return True
+        if self.store is None or self.executor is not None:
+            return False
+        return self.store.contains(fen, multipv, depth)
+
+    async def store_contains(self, fen, multipv, depth):
+        """Return True if analysis of fen to at least depth is in store."""
+        if self.store is None:
+            return False
+        try:
+            return await asyncio.get_event_loop().run_in_executor(
+                self.executor, self.store.contains, fen, multipv, depth
+            )
+        except sqlite3.Error:
+            self.store_errors += 1
+            return False
+
+    def put(self, fen, multipv, depth, lines):
+        """Add lines from analysis of fen to depth with multipv to cache.
+
+        Analysis to a greater depth already in the cache is kept.
+
+        """
+        key = (position_hash(fen), multipv)
+        if key[0] is None:
+            return
+        self._put_entry(key, depth, lines)
+        if self.store is None:
+            return
+        if self.executor is None:
+            self.store.put(fen, multipv, depth, lines)
+            return
+        self.executor.submit(self._put_in_store, fen, multipv, depth, lines)
+
+    def _put_in_store(self, fen, multipv, depth, lines):
+        """Add analysis to store, counting a failure in store_errors."""
+        try:
+            self.store.put(fen, multipv, depth, lines)
+        except sqlite3.Error:
+            self.store_errors += 1
+
+    def _get_entry(self, key, depth):
+        """Return lines in entry for key to at least depth, or None."""
+        entry = self.entries.get(key)
+        if entry is None or entry[0] < depth:
+            return None
+        self.entries.move_to_end(key)
+        return entry[1]
+
+    def _count(self, lines):
+        """Count a hit, or a miss if lines is None, and return lines."""
+        if lines is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return lines
+
+    def _put_entry(self, key, depth, lines):
+        """Add entry for key unless it holds analysis to a greater depth."""
+        entry = self.entries.get(key)
+        if entry is None or entry[0] <= depth:
+            self.entries[key] = (depth, lines)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.size:
+            self.entries.popitem(last=False)
+
+    def close(self):
+        """Close the store behind the cache, if any.
+
+        Writes queued in the executor are finished first.
+
+        """
+        if self.executor is not None:
+            self.executor.shutdown(wait=True)
+        if self.store is not None:
+            self.store.close()
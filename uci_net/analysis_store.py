@@ -0,0 +1,325 @@
+# analysis_store.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Keep analysis of positions in a sqlite3 database across server restarts.
+
+Usage:
+
+python -m uci_net.analysis_store import <database> <epdfile> <engine>
+python -m uci_net.analysis_store export <database> <epdfile> <engine>
+python -m uci_net.analysis_store compact <database>
+
+Analysis is keyed by the canonical_fen() of the position, the engine name,
+the MultiPV value, and the depth.  An entry satisfies a request for the
+same or a smaller depth, and the deepest entry is used.
+
+'import' adds the EPD records in epdfile with 'acd' and 'pv' operations,
+and optionally 'ce', as analysis by engine with MultiPV 1.  The 'pv' moves
+must be in UCI long algebraic notation.  'export' writes the deepest
+analysis by engine with MultiPV 1 of each position to epdfile with 'acd',
+'pv', and 'ce' operations.  'compact' deletes analysis made obsolete by
+deeper analysis of the same position and reclaims the space.
+
+A tcp_server started with '--analysis-store=<database>' uses the database
+as a second level cache behind it's analysis cache.
+
+"""
+
+import sys
+import sqlite3
+import time
+
+from .engine import (
+    CommandsFromEngine,
+    InfoParameters,
+    ScoreInfoValueNames,
+)
+from .epd import (
+    read_epd_file,
+    format_epd,
+    ANALYSIS_COUNT_DEPTH,
+    CENTIPAWN_EVALUATION,
+    PREDICTED_VARIATION,
+)
+from .fen import canonical_fen, is_uci_move
+
+# Seconds a connection waits, by default, for another process' write to
+# finish.
+LOCK_TIMEOUT = 10
+
+# The primary key is the index used to find the deepest analysis.
+_SCHEMA = """CREATE TABLE IF NOT EXISTS analysis (
+    position TEXT NOT NULL,
+    engine TEXT NOT NULL,
+    multipv INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    lines TEXT NOT NULL,
+    stored REAL NOT NULL,
+    PRIMARY KEY (position, engine, multipv, depth)
+) WITHOUT ROWID"""
+
+_SELECT = """SELECT lines FROM analysis
+    WHERE position = ? AND engine = ? AND multipv = ? AND depth >= ?
+    ORDER BY depth DESC LIMIT 1"""
+
+_CONTAINS = """SELECT 1 FROM analysis
+    WHERE position = ? AND engine = ? AND multipv = ? AND depth >= ?
+    LIMIT 1"""
+
+_INSERT = """INSERT OR REPLACE INTO analysis
+    (position, engine, multipv, depth, lines, stored)
+    VALUES (?, ?, ?, ?, ?, ?)"""
+
+_DEEPEST = """SELECT position, depth, lines FROM analysis AS a
+    WHERE engine = ? AND multipv = ? AND depth = (
+        SELECT MAX(depth) FROM analysis AS b
+        WHERE b.position = a.position
+        AND b.engine = a.engine
+        AND b.multipv = a.multipv
+    )
+    ORDER BY position"""
+
+_OBSOLETE = """DELETE FROM analysis WHERE EXISTS (
+    SELECT 1 FROM analysis AS deeper
+    WHERE deeper.position = analysis.position
+    AND deeper.engine = analysis.engine
+    AND deeper.multipv = analysis.multipv
+    AND deeper.depth > analysis.depth
+)"""
+
+_SEPARATOR = "\n"
+
+
+def analysis_operations(lines):
+    """Return dict of EPD 'acd', 'ce', and 'pv' operations from lines.
+
+    The operations are from the latest 'info' line with a 'pv' for the first
+    variation.  'ce' is omitted for mate scores, and an empty dict is
+    returned if no line has a 'pv'.
+
+    """
+    ips = InfoParameters
+    for line in reversed(lines):
+        if not line.startswith(CommandsFromEngine.info):
+            continue
+        info = ips.parse_info(line)
+        if ips.pv not in info or ips.depth not in info:
+            continue
+        if info.get(ips.multipv, "1") != "1":
+            continue
+        operations = {
+            ANALYSIS_COUNT_DEPTH: [info[ips.depth]],
+            PREDICTED_VARIATION: " ".join(info[ips.pv]).split(),
+        }
+        score = info.get(ips.score, {}).get(ScoreInfoValueNames.cp)
+        if score is not None:
+            cp = score.split(maxsplit=1)[0]
+            if cp.lstrip("-").isdigit():
+                operations[CENTIPAWN_EVALUATION] = [cp]
+        return operations
+    return {}
+
+
+def analysis_lines(operations):
+    """Return (depth, lines from engine) made from EPD operations, or None.
+
+    None is returned unless operations has an 'acd' depth and a 'pv' of
+    moves in UCI long algebraic notation.
+
+    """
+    depth = operations.get(ANALYSIS_COUNT_DEPTH, [])
+    pv = operations.get(PREDICTED_VARIATION, [])
+    if len(depth) != 1 or not depth[0].isdigit() or not pv:
+        return None
+    if not all(is_uci_move(move) for move in pv):
+        return None
+    info = [CommandsFromEngine.info, InfoParameters.depth, depth[0]]
+    ce = operations.get(CENTIPAWN_EVALUATION, [])
+    if len(ce) == 1 and ce[0].lstrip("-").isdigit():
+        info.extend((InfoParameters.score, ScoreInfoValueNames.cp, ce[0]))
+    info.append(InfoParameters.pv)
+    info.extend(pv)
+    return int(depth[0]), [
+        " ".join(info),
+        " ".join((CommandsFromEngine.bestmove, pv[0])),
+    ]
+
+
+class AnalysisStore:
+    """Keep the lines from engines for analysed positions in a database.
+
+    The get(), contains(), and put() methods, like those of AnalysisCache,
+    use the analysis by engine.  Writes by put() are committed at once,
+    while put_many() adds many entries in one transaction.
+
+    """
+
+    def __init__(self, path, engine=None, timeout=LOCK_TIMEOUT):
+        """Open, creating if necessary, database at path for engine.
+
+        timeout is the seconds to wait for another process' write to finish
+        before sqlite3.OperationalError is raised.  The store may be used
+        from a thread other than the one which opened it, but not from two
+        threads at once.
+
+        """
+        self.path = path
+        self.engine = engine
+        self.connection = sqlite3.connect(
+            path, timeout=timeout, check_same_thread=False
+        )
+
+        # Readers do not block the writer, and a commit need not wait for
+        # the data to reach the disk.  A crash may lose the latest analysis
+        # but does not corrupt the database.
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        with self.connection:
+            self.connection.execute(_SCHEMA)
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        """Return number of entries in database."""
+        return self.connection.execute(
+            "SELECT COUNT(*) FROM analysis"
+        ).fetchone()[0]
+
+    def get(self, fen, multipv, depth):
+        """Return lines for fen with multipv to at least depth, or None."""
+        position = canonical_fen(fen)
+        row = None
+        if position is not None:
+            row = self.connection.execute(
+                _SELECT, (position, self.engine, multipv, depth)
+            ).fetchone()
+        if row is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return row[0].split(_SEPARATOR)
+
+    def contains(self, fen, multipv, depth):
+        """Return True if analysis of fen to at least depth is in database.
+
+        The hit and miss counts are not changed.
+
+        """
+        position = canonical_fen(fen)
+        if position is None:
+            return False
+        return (
+            self.connection.execute(
+                _CONTAINS, (position, self.engine, multipv, depth)
+            ).fetchone()
+            is not None
+        )
+
+    def put(self, fen, multipv, depth, lines):
+        """Add lines from analysis of fen to depth with multipv to database.
+
+        Analysis to the same depth already in the database is replaced.
+
+        """
+        self.put_many([(fen, multipv, depth, lines)])
+
+    def put_many(self, entries, engine=None):
+        """Add entries, (fen, multipv, depth, lines), in one transaction.
+
+        The analysis is by engine, default the store's engine.  Entries with
+        an invalid fen are ignored.  Return the number of entries added.
+
+        """
+        if engine is None:
+            engine = self.engine
+        stored = time.time()
+        rows = []
+        for fen, multipv, depth, lines in entries:
+            position = canonical_fen(fen)
+            if position is not None:
+                rows.append(
+                    (
+                        position,
+                        engine,
+                        multipv,
+                        depth,
+                        _SEPARATOR.join(lines),
+                        stored,
+                    )
+                )
+        with self.connection:
+            self.connection.executemany(_INSERT, rows)
+        return len(rows)
+
+    def import_epd(self, path, engine=None):
+        """Add analysis in EPD records in file path and return number added.
+
+        Records without 'acd' and 'pv' operations are ignored.  The analysis
+        is by engine, default the store's engine, with MultiPV 1.
+
+        """
+        entries = []
+        for fen, operations in read_epd_file(path):
+            analysis = analysis_lines(operations)
+            if analysis is not None:
+                entries.append((fen, 1, analysis[0], analysis[1]))
+        return self.put_many(entries, engine=engine)
+
+    def export_epd(self, path, engine=None):
+        """Write deepest analysis of each position to file path as EPD.
+
+        The analysis is by engine, default the store's engine, with MultiPV
+        1.  Return the number of records written.
+
+        """
+        if engine is None:
+            engine = self.engine
+        count = 0
+        with open(path, "w", encoding="utf-8") as epdfile:
+            for position, depth, lines in self.connection.execute(
+                _DEEPEST, (engine, 1)
+            ):
+                operations = analysis_operations(lines.split(_SEPARATOR))
+                operations[ANALYSIS_COUNT_DEPTH] = [str(depth)]
+                epdfile.write(format_epd(position, operations))
+                epdfile.write("\n")
+                count += 1
+        return count
+
+    def compact(self):
+        """Delete analysis superseded by deeper analysis and reclaim space.
+
+        Return the number of entries deleted.
+
+        """
+        with self.connection:
+            deleted = self.connection.execute(_OBSOLETE).rowcount
+        self.connection.execute("VACUUM")
+        return deleted
+
+    def close(self):
+        """Close the database."""
+        self.connection.close()
+
+
+if __name__ == "__main__":
+
+    arguments = sys.argv[1:]
+    if arguments[:1] == ["import"] and len(arguments) == 4:
+        store = AnalysisStore(arguments[1], engine=arguments[3])
+        sys.stdout.write(
+            str(store.import_epd(arguments[2])) + " positions imported\n"
+        )
+    elif arguments[:1] == ["export"] and len(arguments) == 4:
+        store = AnalysisStore(arguments[1], engine=arguments[3])
+        sys.stdout.write(
+            str(store.export_epd(arguments[2])) + " positions exported\n"
+        )
+    elif arguments[:1] == ["compact"] and len(arguments) == 2:
+        store = AnalysisStore(arguments[1])
+        sys.stdout.write(str(store.compact()) + " entries deleted\n")
+    else:
+        sys.stdout.write(__doc__)
+        sys.exit()
+    store.close()
@@ -0,0 +1,318 @@
+# bench.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Benchmark chess engines on a suite of positions without a user interface.
+
+Usage:
+
+python -m uci_net.bench [options] epdfile engine [engine ...]
+
+where epdfile contains the positions as EPD records, and each engine is the
+command to run a local engine, with it's arguments, or a url like
+'//<host>:<port>?name=<engine name>' for an engine on a tcp_server.
+
+The options are:
+
+--depth=<n>          search depth for each position, default 12
+--multipv=<n>        MultiPV value, default 1
+--threads=<n>        value of the Threads option of local engines
+--hash=<n>           value of the Hash option of local engines
+--timeout=<seconds>  longest wait for a reply, default 300
+--csv=<file>         write the results to file in CSV format
+--json=<file>        write the results to file in JSON format
+
+The engines are run one after another, each analysing all the positions,
+so the results are not affected by engines competing for processors.  For
+each position the time the engine reports to reach the depth, the seconds
+from sending the 'go' command to receiving the 'bestmove', the nodes, nps,
+score, and bestmove are recorded.  The difference between the two times
+shows the overhead of using an engine over a network.
+
+Servers do not allow the Threads and Hash options to be set by clients so
+these options apply to local engines only.
+
+"""
+
+import sys
+import csv
+import json
+import time
+from queue import Empty
+from urllib.parse import urlsplit
+
+# Use the multiprocessing API for threading
+from multiprocessing import dummy
+
+from .engine import (
+    CommandsFromEngine,
+    CommandsToEngine,
+    InfoParameters,
+    ScoreInfoValueNames,
+    BestmoveParameters,
+    ReservedOptionNames,
+)
+from .epd import read_epd_file, ID, BEST_MOVE
+from .tcp_client import server_addresses
+from .tcp_protocol import go_commands, split_server_options
+from .uci_driver_over_tcp import UCIDriverOverTCP
+
+DEFAULT_DEPTH = 12
+DEFAULT_MULTIPV = 1
+DEFAULT_TIMEOUT = 300
+
+# The columns of the CSV file, and the keys of each result in the JSON file.
+FIELDS = (
+    "engine",
+    "position",
+    "fen",
+    "depth",
+    "time_ms",
+    "wall_seconds",
+    "nodes",
+    "nps",
+    "score_cp",
+    "score_mate",
+    "bestmove",
+    "expected",
+    "error",
+)
+
+
+class BenchEngine:
+    """Drive an engine with UCIDriverOverTCP and wait for it's replies."""
+
+    def __init__(self, engine, timeout=DEFAULT_TIMEOUT):
+        """Start engine, a command line or url, and wait for 'uciok'."""
+        self.engine = engine
+        self.timeout = timeout
+        self.replies = dummy.Queue()
+        self.driver = UCIDriverOverTCP(self.replies, engine, in_process=True)
+        self.remote = bool(server_addresses(urlsplit(engine)))
+        if self.remote:
+            self.driver.start_engine(engine, None)
+        else:
+            path, *args = engine.split(maxsplit=1)
+            self.driver.start_engine(path, args[0] if args else None)
+        self.send([CommandsToEngine.uci], CommandsFromEngine.uciok)
+
+    def send(self, commands, terminator):
+        """Send commands and return lines received up to terminator line.
+
+        queue.Empty is raised if a reply is not received within timeout
+        seconds.
+
+        """
+        for command in commands:
+            self.driver.send_to_engine(command)
+        lines = []
+        while True:
+            name, response = self.replies.get(timeout=self.timeout)
+            del name
+            lines.extend(response)
+            for line in response:
+                if line.split(maxsplit=1)[:1] == [terminator]:
+                    return lines
+
+    def set_options(self, options):
+        """Set options, a dict of name: value, and wait for 'readyok'."""
+        self.send(
+            [
+                " ".join(("setoption name", name, "value", str(value)))
+                for name, value in options.items()
+            ]
+            + [CommandsToEngine.isready],
+            CommandsFromEngine.readyok,
+        )
+
+    def analyse(self, fen, depth, multipv):
+        """Return (lines, seconds) for analysis of fen to depth."""
+        start = time.perf_counter()
+        lines = self.send(
+            go_commands(fen, depth, multipv=multipv),
+            CommandsFromEngine.bestmove,
+        )
+        return lines, time.perf_counter() - start
+
+    def stop(self):
+        """Stop the search and discard the reply."""
+        try:
+            self.send([CommandsToEngine.stop], CommandsFromEngine.bestmove)
+        except Empty:
+            pass
+
+    def quit(self):
+        """Quit the engine."""
+        self.driver.quit_engine()
+
+
+def analysis_result(lines):
+    """Return dict of result items found in lines from engine.
+
+    The depth, time, and score are from the latest 'info' line for the first
+    pv, and nodes and nps from the latest 'info' line with them.
+
+    """
+    ips = InfoParameters
+    result = {}
+    for line in reversed(lines):
+        words = line.split(maxsplit=1)
+        if not words:
+            continue
+        if words[0] == CommandsFromEngine.bestmove:
+            if "bestmove" not in result:
+                bestmove = BestmoveParameters.parse_bestmove(line)
+                result["bestmove"] = bestmove.get(CommandsFromEngine.bestmove)
+            continue
+        if words[0] != CommandsFromEngine.info:
+            continue
+        info = ips.parse_info(line)
+        if ips.nodes in info and "nodes" not in result:
+            result["nodes"] = int(info[ips.nodes])
+            if ips.nps in info:
+                result["nps"] = int(info[ips.nps])
+        if ips.pv not in info or "depth" in result:
+            continue
+        if info.get(ips.multipv, "1") != "1":
+            continue
+        if ips.depth in info:
+            result["depth"] = int(info[ips.depth])
+        if ips.time in info:
+            result["time_ms"] = int(info[ips.time])
+        score = info.get(ips.score, {})
+        if ScoreInfoValueNames.cp in score:
+            result["score_cp"] = int(score[ScoreInfoValueNames.cp])
+        if ScoreInfoValueNames.mate in score:
+            result["score_mate"] = int(score[ScoreInfoValueNames.mate])
+    return result
+
+
+def run_bench(
+    engines, positions, depth, multipv, options=None, timeout=None
+):
+    """Return list of result dicts for engines analysing positions.
+
+    positions is a list of (fen, operations) from read_epd_file(), and
+    options a dict of option name: value set in local engines.
+
+    """
+    results = []
+    for engine in engines:
+        try:
+            bench = BenchEngine(engine, timeout=timeout or DEFAULT_TIMEOUT)
+        except Exception as exc:
+            results.append(
+                {"engine": engine, "error": "start failed: " + str(exc)}
+            )
+            continue
+        try:
+            if options and not bench.remote:
+                bench.set_options(options)
+            for number, (fen, operations) in enumerate(positions):
+                result = {
+                    "engine": engine,
+                    "position": " ".join(
+                        operations.get(ID, [str(number + 1)])
+                    ),
+                    "fen": fen,
+                    "expected": " ".join(operations.get(BEST_MOVE, [])),
+                }
+                try:
+                    lines, seconds = bench.analyse(fen, depth, multipv)
+                except Empty:
+                    result["error"] = "timeout"
+                    results.append(result)
+                    bench.stop()
+                    continue
+                result.update(analysis_result(lines))
+                result["wall_seconds"] = round(seconds, 6)
+                results.append(result)
+        except Empty:
+            results.append({"engine": engine, "error": "timeout"})
+        finally:
+            bench.quit()
+    return results
+
+
+def summary(results):
+    """Return text summary of results for each engine."""
+    engines = {}
+    for result in results:
+        totals = engines.setdefault(
+            result["engine"],
+            {"positions": 0, "errors": 0, "wall": 0, "time": 0, "nodes": 0},
+        )
+        if result.get("error"):
+            totals["errors"] += 1
+            continue
+        totals["positions"] += 1
+        totals["wall"] += result.get("wall_seconds", 0)
+        totals["time"] += result.get("time_ms", 0) / 1000
+        totals["nodes"] += result.get("nodes", 0)
+    lines = []
+    for engine, totals in engines.items():
+        lines.append(
+            "".join(
+                (
+                    engine,
+                    "\n  positions: ",
+                    str(totals["positions"]),
+                    "  errors: ",
+                    str(totals["errors"]),
+                    "\n  engine seconds: ",
+                    format(totals["time"], ".3f"),
+                    "  wall seconds: ",
+                    format(totals["wall"], ".3f"),
+                    "\n  nodes: ",
+                    str(totals["nodes"]),
+                    "  nps: ",
+                    str(
+                        int(totals["nodes"] / totals["time"])
+                        if totals["time"]
+                        else 0
+                    ),
+                    "\n",
+                )
+            )
+        )
+    return "".join(lines)
+
+
+def write_csv(results, path):
+    """Write results to file path in CSV format."""
+    with open(path, "w", newline="", encoding="utf-8") as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDS)
+        writer.writeheader()
+        writer.writerows(results)
+
+
+def write_json(results, path):
+    """Write results to file path in JSON format."""
+    with open(path, "w", encoding="utf-8") as jsonfile:
+        json.dump(results, jsonfile, indent=1)
+
+
+if __name__ == "__main__":
+
+    bench_options, arguments = split_server_options(sys.argv[1:])
+    if len(arguments) < 2:
+        sys.stdout.write(__doc__)
+        sys.exit()
+    engine_options = {}
+    if "threads" in bench_options:
+        engine_options["Threads"] = int(bench_options["threads"])
+    if "hash" in bench_options:
+        engine_options[ReservedOptionNames.Hash] = int(bench_options["hash"])
+    bench_results = run_bench(
+        arguments[1:],
+        read_epd_file(arguments[0]),
+        int(bench_options.get("depth", DEFAULT_DEPTH)),
+        int(bench_options.get("multipv", DEFAULT_MULTIPV)),
+        options=engine_options,
+        timeout=float(bench_options.get("timeout", DEFAULT_TIMEOUT)),
+    )
+    if "csv" in bench_options:
+        write_csv(bench_results, bench_options["csv"])
+    if "json" in bench_options:
+        write_json(bench_results, bench_options["json"])
+    sys.stdout.write(summary(bench_results))
@@ -10,9 +10,36 @@ The chess engine must support the Universal Chess Interface (UCI).
 
 from collections import namedtuple, deque
 import re
+import sys
 from copy import deepcopy
 
 
+class LazyRegex:
+    """Compile a class's regular expression the first time it is used.
+
+    Compiling all the regular expressions when the module is imported costs
+    processes which only need the command names, such as tcp_client, a
+    noticeable part of their start-up time.  The compiled expression replaces
+    this descriptor on the class when first used.
+
+    """
+
+    def __init__(self, pattern):
+        """Note pattern, the regular expression to be compiled."""
+        self.pattern = pattern
+        self.name = None
+
+    def __set_name__(self, owner, name):
+        """Note name of attribute in owner class holding the expression."""
+        self.name = name
+
+    def __get__(self, instance, owner):
+        """Return compiled expression, replacing descriptor in owner."""
+        compiled = re.compile(self.pattern)
+        setattr(owner, self.name, compiled)
+        return compiled
+
+
 class CommandsToEngine:
     """The names of commands sent to engines."""
 
@@ -92,7 +119,7 @@ class CommandsFromEngine:
 
     # Regular expression to parse text from engine for command
     # re = '\s+(name|type|default|min|max|var)\s+'
-    cfere = re.compile("|".join(all_).join((r"(?:\A|\s+)(", r")(?:\s+|\Z)")))
+    cfere = LazyRegex("|".join(all_).join((r"(?:\A|\s+)(", r")(?:\s+|\Z)")))
 
     @staticmethod
     def parse_command(text):
@@ -126,7 +153,7 @@ class IdParameters:
 
     # Regular expression to parse option command
     # re = '(?<= )(name|author)\s+'
-    ipre = re.compile("|".join(all_).join((r"(?<= )(", r")\s+")))
+    ipre = LazyRegex("|".join(all_).join((r"(?<= )(", r")\s+")))
 
     @staticmethod
     def parse_id(text):
@@ -197,7 +224,7 @@ class OptionParameters:
 
     # Regular expression to parse option command
     # re = '(?<= )(name|type|default|min|max|var)\s+'
-    opre = re.compile("|".join(all_).join((r"(?<= )(", r")\s+")))
+    opre = LazyRegex("|".join(all_).join((r"(?<= )(", r")\s+")))
 
     @staticmethod
     def parse_option(text):
@@ -504,7 +531,7 @@ class InfoParameters:
 
     # Regular expression to parse info command
     # re = '(?<= )(depth|seldepth|time| ,,, |string|refutation|currline)\s+'
-    ipre = re.compile("|".join(all_).join((r"(?<= )(", r")\s+")))
+    ipre = LazyRegex("|".join(all_).join((r"(?<= )(", r")\s+")))
 
     @staticmethod
     def parse_info(text):
@@ -558,7 +585,7 @@ class ScoreInfoValueNames:
 
     # Regular expression to parse score info value
     # re = '(?<= )(cp|mate|lowerbound|upperbound)\s+'
-    sivnre = re.compile("|".join(all_).join((r"(?<= )(", r")\s+")))
+    sivnre = LazyRegex("|".join(all_).join((r"(?<= )(", r")\s+")))
 
     @staticmethod
     def parse_score_info(text):
@@ -642,6 +669,12 @@ InfoSnapshot = namedtuple(
     ),
 )
 
+# A summary of responses from a chess engine made by Engine.engine_results()
+# so a driver process can send parsed results rather than the lines.
+EngineResults = namedtuple(
+    "EngineResults", ("snapshot", "pvs", "bestmove", "lines")
+)
+
 
 class BestmoveParameters:
     """The names of parameters in the bestmove command."""
@@ -652,7 +685,7 @@ class BestmoveParameters:
 
     # Regular expression to parse option command
     # re = '(?<= )(ponder)\s+'
-    bpre = re.compile("|".join(all_).join((r"(?<= )(", r")\s+")))
+    bpre = LazyRegex("|".join(all_).join((r"(?<= )(", r")\s+")))
 
     @staticmethod
     def parse_bestmove(text):
@@ -685,6 +718,29 @@ class BestmoveParameters:
         return out
 
 
+def _deep_size(obj, seen):
+    """Return bytes used by obj and the objects it contains not in seen.
+
+    The id of each object counted is added to seen, so objects shared by
+    several structures are counted once.
+
+    """
+    size = 0
+    stack = [obj]
+    while stack:
+        item = stack.pop()
+        if id(item) in seen:
+            continue
+        seen.add(id(item))
+        size += sys.getsizeof(item)
+        if isinstance(item, dict):
+            stack.extend(item.keys())
+            stack.extend(item.values())
+        elif isinstance(item, (list, tuple, deque, set, frozenset)):
+            stack.extend(item)
+    return size
+
+
 class Engine:
     """The chess engine state according to commands from engine.
 
@@ -824,6 +880,74 @@ class Engine:
         for i in commands[1]:
             self.note_engine_command(i)
 
+    def engine_results(self, commands):
+        """Note the values in commands from engine and return EngineResults.
+
+        snapshot is the latest InfoSnapshot less it's pv_group, pvs is a dict
+        of multipv value: latest info with a pv, bestmove is the latest
+        bestmove, and lines are the commands other than info commands plus
+        the 'info string' commands, which carry messages such as busy and
+        deadline notices.
+
+        The snapshot and bestmove are cleared when the first info command of
+        the next search arrives, and the info history is not kept.
+
+        """
+        cfe = CommandsFromEngine
+        lines = []
+        for text in commands:
+            if cfe.parse_command(text) == cfe.info:
+                if self.bestmove is not None:
+                    self.clear_snapshot()
+                self.note_engine_info(text)
+                if text.split(maxsplit=2)[1:2] == [InfoParameters.string]:
+                    lines.append(text)
+            else:
+                self.note_engine_command(text)
+                lines.append(text)
+        self.info.clear()
+        snapshot = self.snapshot
+        return EngineResults(
+            snapshot._replace(pv_group=None),
+            dict(snapshot.pv_group or {}),
+            self.bestmove,
+            lines,
+        )
+
+    def memory_report(self, threshold=None, callback=None):
+        """Return dict of bytes held by engine state, by structure.
+
+        The 'snapshot', 'bestmove', 'options', and 'info' items are the
+        bytes reached from those attributes, found by walking the objects.
+        An object shared by structures is counted in the first of these
+        which reaches it, so 'info' is the cost of keeping the history of
+        snapshots, including the pv_group dicts copied when depth changes.
+        'total' is the sum.  'snapshots' is the number of entries in info,
+        'pv_groups' the number of distinct pv_group dicts, and 'pv_lines'
+        the number of pv infos in those dicts.
+
+        If threshold is not None and the total is at least threshold bytes,
+        callback(engine, report) is called before the report is returned so
+        it can, for example, discard the older entries in info.
+
+        """
+        seen = set()
+        report = {}
+        for name in "snapshot", "bestmove", "options", "info":
+            report[name] = _deep_size(getattr(self, name), seen)
+        report["total"] = sum(report.values())
+        pv_groups = {}
+        for snapshot in [self.snapshot] + [entry[1] for entry in self.info]:
+            if snapshot.pv_group is not None:
+                pv_groups[id(snapshot.pv_group)] = snapshot.pv_group
+        report["snapshots"] = len(self.info)
+        report["pv_groups"] = len(pv_groups)
+        report["pv_lines"] = sum(len(group) for group in pv_groups.values())
+        if threshold is not None and report["total"] >= threshold:
+            if callback is not None:
+                callback(self, report)
+        return report
+
     def initialize_info_snapshot(self):
         """Initialize data structures holding commands from chess engines."""
         self.info = deque()
@@ -0,0 +1,124 @@
+# epd.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Read and write Extended Position Description (EPD) records.
+
+An EPD record is the first four fields of a FEN followed by operations, each
+an opcode and zero or more operands ended by a semicolon, for example:
+
+r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - id "pos 1";
+
+Operands containing spaces or semicolons are quoted strings.
+
+"""
+
+from .fen import canonical_fen
+
+# Opcodes used by this package.
+ID = "id"
+BEST_MOVE = "bm"
+CENTIPAWN_EVALUATION = "ce"
+PREDICTED_VARIATION = "pv"
+ANALYSIS_COUNT_DEPTH = "acd"
+HALFMOVE_CLOCK = "hmvc"
+FULLMOVE_NUMBER = "fmvn"
+
+_QUOTE = '"'
+_TERMINATOR = ";"
+
+
+def _split_operations(text):
+    """Return list of (opcode, [operand, ...]) in text, or None if invalid."""
+    operations = []
+    words = []
+    word = []
+    quoted = False
+    for char in text:
+        if quoted:
+            if char == _QUOTE:
+                quoted = False
+                words.append("".join(word))
+                word = []
+            else:
+                word.append(char)
+        elif char == _QUOTE:
+            if word:
+                return None
+            quoted = True
+        elif char.isspace() or char == _TERMINATOR:
+            if word:
+                words.append("".join(word))
+                word = []
+            if char == _TERMINATOR:
+                if not words:
+                    return None
+                operations.append((words[0], words[1:]))
+                words = []
+        else:
+            word.append(char)
+    if quoted or word or words:
+        return None
+    return operations
+
+
+def parse_epd(line):
+    """Return (fen, operations) from EPD record in line, or None if invalid.
+
+    fen is a six field FEN whose halfmove clock and fullmove number are from
+    the 'hmvc' and 'fmvn' operations, default 0 and 1.  operations is a dict
+    of opcode: list of operands with quotes removed.
+
+    """
+    fields = line.split(maxsplit=4)
+    if len(fields) < 4:
+        return None
+    if canonical_fen(" ".join(fields[:4])) is None:
+        return None
+    operations = _split_operations(fields[4] if len(fields) == 5 else "")
+    if operations is None:
+        return None
+    operations = dict(operations)
+    clocks = []
+    for opcode, default in ((HALFMOVE_CLOCK, "0"), (FULLMOVE_NUMBER, "1")):
+        value = operations.get(opcode, [default])
+        if len(value) != 1 or not value[0].isdigit():
+            return None
+        clocks.append(value[0])
+    return " ".join(fields[:4] + clocks), operations
+
+
+def format_epd(fen, operations):
+    """Return EPD record for fen with operations, a dict of opcode: operands.
+
+    Only the first four fields of fen are used.  Operands containing spaces
+    or semicolons are quoted.
+
+    """
+    items = fen.split()[:4]
+    for opcode, operands in operations.items():
+        words = [opcode]
+        for operand in operands:
+            operand = str(operand)
+            if not operand or any(
+                char.isspace() or char == _TERMINATOR for char in operand
+            ):
+                operand = _QUOTE + operand + _QUOTE
+            words.append(operand)
+        items.append(" ".join(words) + _TERMINATOR)
+    return " ".join(items)
+
+
+def read_epd_file(path):
+    """Return list of (fen, operations) for valid EPD records in file path.
+
+    Blank lines and invalid records are ignored.
+
+    """
+    records = []
+    with open(path, encoding="utf-8") as epdfile:
+        for line in epdfile:
+            record = parse_epd(line)
+            if record is not None:
+                records.append(record)
+    return records
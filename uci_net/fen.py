@@ -0,0 +1,335 @@
+# fen.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Normalise Forsyth-Edwards Notation (FEN) for use as position keys.
+
+Caches and deduplication keyed on the text of 'position fen ...' commands miss
+when positions differ only in ways which do not change the analysis: the
+halfmove clock, the fullmove number, an en passant square where no pawn can
+make the capture, or castling rights where the king or rook is not on it's
+original square.
+
+canonical_fen() returns the first four FEN fields with these differences
+removed, and position_hash() returns a 64-bit integer derived from the
+canonical FEN.  Both return None if the FEN is not valid.
+
+fen_after_move() returns the FEN of the position after a move in UCI long
+algebraic notation, such as the moves in the 'pv' of an engine's 'info'
+lines, and fen_from_position_command() returns the FEN of the position
+given by a 'position' command.
+
+The checks are on the arrangement of pieces only: the legality of the position
+is not verified.
+
+"""
+
+_PIECES = frozenset("KQRBNPkqrbnp")
+_EMPTY = "."
+_EXPAND = str.maketrans({str(i): _EMPTY * i for i in range(1, 9)})
+_COMPRESS = tuple((_EMPTY * i, str(i)) for i in range(8, 0, -1))
+_FILES = "abcdefgh"
+_ACTIVE_COLOURS = frozenset("wb")
+_NO_SQUARE = "-"
+_CASTLING_RIGHTS = frozenset("KQkq")
+STARTPOS_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+_RANKS = "87654321"
+_PROMOTIONS = frozenset("qrbn")
+_PAWNS = frozenset("Pp")
+_KINGS = frozenset("Kk")
+
+# (castling right, rank index, king file, rook file, king, rook) where rank
+# index 0 is the eighth rank as in FEN piece placement.
+_CASTLING = (
+    ("K", 7, 4, 7, "K", "R"),
+    ("Q", 7, 4, 0, "K", "R"),
+    ("k", 0, 4, 7, "k", "r"),
+    ("q", 0, 4, 0, "k", "r"),
+)
+
+# Keyed by active colour: (en passant rank, rank index of pawn which moved two
+# squares, pawn which moved, pawn which can capture).
+_EN_PASSANT = {
+    "w": ("6", 3, "p", "P"),
+    "b": ("3", 4, "P", "p"),
+}
+
+# hashlib.blake2b, bound by hash_canonical_fen() when first called.
+_blake2b = None
+
+
+def _expand_placement(placement):
+    """Return list of 8 rank strings, '.' for empty squares, or None."""
+    ranks = placement.translate(_EXPAND).split("/")
+    if len(ranks) != 8:
+        return None
+    for rank in ranks:
+        if len(rank) != 8:
+            return None
+        if not _PIECES.issuperset(rank.replace(_EMPTY, "")):
+            return None
+    return ranks
+
+
+def _compress_placement(ranks):
+    """Return FEN piece placement for list of 8 expanded rank strings."""
+    placement = "/".join(ranks)
+    for empty, digit in _COMPRESS:
+        placement = placement.replace(empty, digit)
+    return placement
+
+
+def _castling(castling, ranks):
+    """Return castling rights in castling supported by piece positions."""
+    if castling == _NO_SQUARE:
+        return castling
+    if not castling or len(set(castling)) != len(castling):
+        return None
+    if not _CASTLING_RIGHTS.issuperset(castling):
+        return None
+    rights = []
+    for right, rank, king_file, rook_file, king, rook in _CASTLING:
+        if right not in castling:
+            continue
+        if ranks[rank][king_file] == king and ranks[rank][rook_file] == rook:
+            rights.append(right)
+    return "".join(rights) or _NO_SQUARE
+
+
+def _en_passant(square, active_colour, ranks):
+    """Return square if an en passant capture is possible there, else '-'."""
+    if square == _NO_SQUARE:
+        return square
+    if len(square) != 2 or square[0] not in _FILES:
+        return None
+    ep_rank, pawn_rank, moved, capturer = _EN_PASSANT[active_colour]
+    if square[1] != ep_rank:
+        return None
+    file = _FILES.index(square[0])
+    rank = ranks[pawn_rank]
+    if rank[file] != moved:
+        return _NO_SQUARE
+    if file > 0 and rank[file - 1] == capturer:
+        return square
+    if file < 7 and rank[file + 1] == capturer:
+        return square
+    return _NO_SQUARE
+
+
+def canonical_fen(fen):
+    """Return canonical four field FEN for fen, or None if fen is invalid.
+
+    The halfmove clock and fullmove number are dropped, the piece placement
+    is written with maximal runs of empty squares, castling rights are
+    reduced to those where king and rook are on their original squares, and
+    the en passant square is replaced by '-' unless a pawn of the side to
+    move stands next to the pawn which has just moved two squares.
+
+    """
+    fields = fen.split()
+    if len(fields) < 4 or len(fields) > 6:
+        return None
+    placement, active_colour, castling, square = fields[:4]
+    if active_colour not in _ACTIVE_COLOURS:
+        return None
+    ranks = _expand_placement(placement)
+    if ranks is None:
+        return None
+    castling = _castling(castling, ranks)
+    if castling is None:
+        return None
+    square = _en_passant(square, active_colour, ranks)
+    if square is None:
+        return None
+    return " ".join(
+        (_compress_placement(ranks), active_colour, castling, square)
+    )
+
+
+def hash_canonical_fen(canonical):
+    """Return 64-bit integer hash of canonical, a canonical_fen() value."""
+    global _blake2b
+    if _blake2b is None:
+
+        # Imported on first use because hashlib is a large part of the time
+        # taken to import this module, and tcp_client does not hash
+        # positions.
+        from hashlib import blake2b as _blake2b
+
+    return int.from_bytes(
+        _blake2b(canonical.encode(), digest_size=8).digest(), "big"
+    )
+
+
+def position_hash(fen):
+    """Return 64-bit integer hash of canonical fen, or None if fen invalid."""
+    canonical = canonical_fen(fen)
+    if canonical is None:
+        return None
+    return hash_canonical_fen(canonical)
+
+
+def is_uci_move(move):
+    """Return True if move looks like a move in UCI long algebraic notation.
+
+    The move is not checked against any position.
+
+    """
+    if len(move) == 5:
+        if move[4] not in _PROMOTIONS:
+            return False
+    elif len(move) != 4:
+        return False
+    return (
+        _square_index(move[:2]) is not None
+        and _square_index(move[2:4]) is not None
+    )
+
+
+def _square_index(square):
+    """Return (rank index, file index) of square like 'e4', or None."""
+    if len(square) != 2 or square[0] not in _FILES or square[1] not in _RANKS:
+        return None
+    return _RANKS.index(square[1]), _FILES.index(square[0])
+
+
+def fen_after_move(fen, move):
+    """Return FEN of position after move in fen, or None.
+
+    move is in UCI long algebraic notation, like 'e2e4', 'e1g1' for castling,
+    or 'e7e8q' for promotion.  None is returned if fen is not valid or there
+    is no piece of the side to move on the move's start square.  The move is
+    not checked for legality.
+
+    """
+    fields = fen.split()
+    if len(fields) < 4 or len(fields) > 6:
+        return None
+    placement, active_colour, castling = fields[:3]
+    if active_colour not in _ACTIVE_COLOURS:
+        return None
+    ranks = _expand_placement(placement)
+    if ranks is None:
+        return None
+    if len(move) not in (4, 5):
+        return None
+    start = _square_index(move[:2])
+    end = _square_index(move[2:4])
+    if start is None or end is None:
+        return None
+    board = [list(rank) for rank in ranks]
+    piece = board[start[0]][start[1]]
+    if piece == _EMPTY or piece.isupper() != (active_colour == "w"):
+        return None
+    captured = board[end[0]][end[1]]
+    board[start[0]][start[1]] = _EMPTY
+    square = _NO_SQUARE
+    pawn_move = piece in _PAWNS
+    if pawn_move:
+        if start[1] != end[1] and captured == _EMPTY:
+            board[start[0]][end[1]] = _EMPTY
+        if abs(start[0] - end[0]) == 2:
+            square = move[0] + _RANKS[(start[0] + end[0]) // 2]
+        if len(move) == 5:
+            if move[4] not in _PROMOTIONS:
+                return None
+            piece = move[4].upper() if active_colour == "w" else move[4]
+    elif piece in _KINGS and abs(start[1] - end[1]) == 2:
+        rook_from, rook_to = (7, 5) if end[1] > start[1] else (0, 3)
+        board[start[0]][rook_to] = board[start[0]][rook_from]
+        board[start[0]][rook_from] = _EMPTY
+    board[end[0]][end[1]] = piece
+    ranks = ["".join(rank) for rank in board]
+    castling = _castling(castling, ranks)
+    if castling is None:
+        return None
+    halfmove = fields[4] if len(fields) > 4 and fields[4].isdigit() else "0"
+    fullmove = fields[5] if len(fields) > 5 and fields[5].isdigit() else "1"
+    if pawn_move or captured != _EMPTY:
+        halfmove = "0"
+    else:
+        halfmove = str(int(halfmove) + 1)
+    if active_colour == "b":
+        fullmove = str(int(fullmove) + 1)
+    return " ".join(
+        (
+            _compress_placement(ranks),
+            "b" if active_colour == "w" else "w",
+            castling,
+            square,
+            halfmove,
+            fullmove,
+        )
+    )
+
+
+def fen_from_position_command(command):
+    """Return FEN of position given by 'position' command, or None.
+
+    The command is 'position startpos' or 'position fen <fen>', optionally
+    followed by 'moves' and moves in UCI long algebraic notation which are
+    played from the position.  None is returned if command is not like this
+    or a move cannot be played.
+
+    """
+    words = command.split()
+    if len(words) < 2 or words[0] != "position":
+        return None
+    if "moves" in words:
+        moves = words[words.index("moves") + 1 :]
+        words = words[: words.index("moves")]
+    else:
+        moves = []
+    if len(words) < 2:
+        return None
+    if words[1:] == ["startpos"]:
+        fen = STARTPOS_FEN
+    elif words[1] == "fen" and canonical_fen(" ".join(words[2:])):
+        fen = " ".join(words[2:])
+    else:
+        return None
+    for move in moves:
+        if not is_uci_move(move):
+            return None
+        fen = fen_after_move(fen, move)
+        if fen is None:
+            return None
+    return fen
+
+
+if __name__ == "__main__":
+
+    import sys
+    import time
+
+    # Benchmark key generation: python -m uci_net.fen [count]
+    sample = (
+        "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq e3 0 1",
+        "rnbqkbnr/pp1ppppp/8/2p5/4P3/8/PPPP1PPP/RNBQKBNR w KQkq c6 0 2",
+        "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+        "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+        "r1bq1rk1/pp2ppbp/2np1np1/8/3NP3/2N1BP2/PPPQ2PP/2KR1B1R b - - 4 9",
+        "4k3/8/8/8/8/8/8/4K2R w Kkq - 12 40",
+    )
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100000
+    fens = [sample[i % len(sample)] for i in range(count)]
+    start = time.perf_counter()
+    for fen in fens:
+        canonical_fen(fen)
+    canonical_elapsed = time.perf_counter() - start
+    start = time.perf_counter()
+    for fen in fens:
+        position_hash(fen)
+    hash_elapsed = time.perf_counter() - start
+    sys.stdout.write(
+        "".join(
+            (
+                "canonical_fen: ",
+                str(int(count / canonical_elapsed)),
+                " keys per second\n",
+                "position_hash: ",
+                str(int(count / hash_elapsed)),
+                " keys per second\n",
+            )
+        )
+    )
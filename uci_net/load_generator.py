@@ -0,0 +1,201 @@
+# load_generator.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Drive concurrent clients against a tcp_server and report throughput.
+
+Usage:
+
+python -m uci_net.load_generator [options] url clients requests depth
+
+where url is like '//<host>:<port>?name=<engine name>'.  Each of clients
+threads sends requests analysis requests, to depth, one after another.
+
+The options are:
+
+--multipv=<n>      MultiPV value of the requests, default 1
+--stream=<mode>    ask for lines to be streamed, 'all' or 'pv'
+--compress=<n>     accept compressed frames at least <n> bytes long
+--priority=<name>  priority of the requests, 'interactive' or 'batch'
+--keepalive=yes    keep each client's connection open between requests
+
+The mock_engine module provides an engine whose output rate and size can be
+set, so the server can be measured without a real chess engine.
+
+Comparing the throughput for servers started with different '--workers' and
+'--engines' values shows how well the server scales across cores.
+
+"""
+
+import sys
+import time
+from urllib.parse import urlsplit
+
+# Use the multiprocessing API for threading
+from multiprocessing import dummy
+
+from .tcp_protocol import (
+    encode_request,
+    go_commands,
+    send_request,
+    reply_lines,
+    split_server_options,
+)
+from .tcp_client import (
+    ConnectionPool,
+    busy_retry_after,
+    DEFAULT_UCI_ENGINE_LISTEN_PORT,
+)
+
+DEFAULT_HOSTNAME = "127.0.0.1"
+
+# Positions analysed in rotation by each client.
+POSITIONS = (
+    "rnbqkbnr/pppppppp/8/8/4P3/8/PPPP1PPP/RNBQKBNR b KQkq - 0 1",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r3k2r/p1ppqpb1/bn2pnp1/3PN3/1p2P3/2N2Q1p/PPPBBPPP/R3K2R w KQkq - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+)
+
+
+class LoadResult:
+    """Latencies and outcomes of the requests made by a load run."""
+
+    def __init__(self):
+        """Initialise empty result."""
+        self.latencies = []
+        self.busy = 0
+        self.errors = 0
+        self.lines = 0
+        self.elapsed = 0
+
+    def percentile(self, fraction):
+        """Return latency at fraction, 0 to 1, of the sorted latencies."""
+        if not self.latencies:
+            return 0
+        latencies = sorted(self.latencies)
+        index = min(len(latencies) - 1, int(fraction * len(latencies)))
+        return latencies[index]
+
+    def throughput(self):
+        """Return completed requests per second."""
+        if not self.elapsed:
+            return 0
+        return len(self.latencies) / self.elapsed
+
+    def report(self):
+        """Return text summary of result."""
+        return "".join(
+            (
+                "requests completed: ",
+                str(len(self.latencies)),
+                "\nbusy replies: ",
+                str(self.busy),
+                "\nerrors: ",
+                str(self.errors),
+                "\nlines received: ",
+                str(self.lines),
+                "\nelapsed seconds: ",
+                format(self.elapsed, ".3f"),
+                "\nthroughput (requests per second): ",
+                format(self.throughput(), ".3f"),
+                "\nlatency p50 p95 p99 (seconds): ",
+                " ".join(
+                    format(self.percentile(f), ".3f")
+                    for f in (0.5, 0.95, 0.99)
+                ),
+                "\n",
+            )
+        )
+
+
+def run_client(
+    host, port, requests, depth, result, options, multipv=1, keepalive=False
+):
+    """Send requests analysis requests one after another noting outcomes.
+
+    The connection is kept open between requests if keepalive is True.
+
+    """
+    pool = ConnectionPool() if keepalive else None
+    for number in range(requests):
+        message = encode_request(
+            go_commands(
+                POSITIONS[number % len(POSITIONS)], depth, multipv=multipv
+            ),
+            **options,
+        )
+        start = time.perf_counter()
+        try:
+            if pool:
+                reply = pool.send_request(host, port, message)
+            else:
+                reply = send_request(host, port, message)
+        except OSError:
+            result.errors += 1
+            continue
+        result.lines += sum(len(reply_lines(item)) for item in reply)
+        if not reply:
+            result.errors += 1
+        elif busy_retry_after(reply[-1]) is not None:
+            result.busy += 1
+        else:
+            result.latencies.append(time.perf_counter() - start)
+    if pool:
+        pool.close()
+
+
+def run_load(
+    host,
+    port,
+    clients,
+    requests,
+    depth,
+    multipv=1,
+    keepalive=False,
+    **options
+):
+    """Return LoadResult for clients each sending requests to depth.
+
+    options are the request options, such as stream and compress.
+
+    """
+    result = LoadResult()
+    threads = [
+        dummy.Process(
+            target=run_client,
+            args=(host, port, requests, depth, result, options),
+            kwargs={"multipv": multipv, "keepalive": keepalive},
+        )
+        for _ in range(clients)
+    ]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    result.elapsed = time.perf_counter() - start
+    return result
+
+
+if __name__ == "__main__":
+
+    load_options, arguments = split_server_options(sys.argv[1:])
+    if len(arguments) != 4:
+        sys.stdout.write(__doc__)
+        sys.exit()
+    if "compress" in load_options:
+        load_options["compress"] = int(load_options["compress"])
+    url = urlsplit(arguments[0])
+    sys.stdout.write(
+        run_load(
+            url.hostname or DEFAULT_HOSTNAME,
+            url.port or DEFAULT_UCI_ENGINE_LISTEN_PORT,
+            int(arguments[1]),
+            int(arguments[2]),
+            int(arguments[3]),
+            multipv=int(load_options.pop("multipv", 1)),
+            keepalive=load_options.pop("keepalive", None) == "yes",
+            **load_options,
+        ).report()
+    )
@@ -0,0 +1,128 @@
+# metrics.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Collect server metrics and present them in Prometheus text format.
+
+Histograms count observations in cumulative buckets, like Prometheus
+histograms, so the shape of latency and size distributions is kept without
+keeping every observation.
+
+"""
+
+from bisect import bisect_left
+from collections import deque
+import time
+
+# Bucket upper bounds for latencies in seconds.
+LATENCY_BUCKETS = (
+    0.001,
+    0.005,
+    0.01,
+    0.05,
+    0.1,
+    0.5,
+    1,
+    5,
+    10,
+    30,
+    60,
+    300,
+)
+
+# Bucket upper bounds for reply sizes in bytes.
+SIZE_BUCKETS = (1000, 10000, 100000, 1000000, 10000000)
+
+# Bucket upper bounds for search depth reached in plies.
+DEPTH_BUCKETS = (5, 10, 15, 20, 25, 30, 40, 50, 75, 100)
+
+_INFINITY = "+Inf"
+
+
+class Histogram:
+    """Count observations in buckets with upper bounds in buckets."""
+
+    def __init__(self, buckets):
+        """Initialise histogram with ascending upper bounds in buckets."""
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value):
+        """Add value to the histogram."""
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def cumulative_counts(self):
+        """Return list of (upper bound, count of observations <= bound).
+
+        The final upper bound is '+Inf'.
+
+        """
+        counts = []
+        total = 0
+        for bound, count in zip(self.buckets + (_INFINITY,), self.counts):
+            total += count
+            counts.append((str(bound), total))
+        return counts
+
+    def as_dict(self):
+        """Return histogram as a dict which literal_eval() can rebuild."""
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "buckets": dict(self.cumulative_counts()),
+        }
+
+
+class RateMeter:
+    """Count events and report the rate over the most recent period."""
+
+    def __init__(self, period=60):
+        """Initialise to report rate over period seconds."""
+        self.period = period
+        self.times = deque()
+
+    def mark(self):
+        """Note an event now."""
+        self.times.append(time.monotonic())
+
+    def rate(self):
+        """Return events per second over the most recent period."""
+        times = self.times
+        horizon = time.monotonic() - self.period
+        while times and times[0] < horizon:
+            times.popleft()
+        return len(times) / self.period
+
+
+def prometheus_text(prefix, counters, gauges, histograms):
+    """Return Prometheus text exposition of metrics.
+
+    counters and gauges are dicts of name: value, and histograms a dict of
+    name: Histogram.  Each name is prefixed by prefix and '_', and counter
+    names are suffixed by '_total'.
+
+    """
+    lines = []
+    for name, value in counters.items():
+        name = "_".join((prefix, name, "total"))
+        lines.append(" ".join(("# TYPE", name, "counter")))
+        lines.append(" ".join((name, str(value))))
+    for name, value in gauges.items():
+        name = "_".join((prefix, name))
+        lines.append(" ".join(("# TYPE", name, "gauge")))
+        lines.append(" ".join((name, str(value))))
+    for name, histogram in histograms.items():
+        name = "_".join((prefix, name))
+        lines.append(" ".join(("# TYPE", name, "histogram")))
+        for bound, count in histogram.cumulative_counts():
+            lines.append(
+                "".join((name, '_bucket{le="', bound, '"} ', str(count)))
+            )
+        lines.append(" ".join((name + "_sum", str(histogram.sum))))
+        lines.append(" ".join((name + "_count", str(histogram.count))))
+    lines.append("")
+    return "\n".join(lines)
@@ -0,0 +1,328 @@
+# mock_engine.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""A mock chess engine which speaks enough UCI to test the uci_net modules.
+
+Usage:
+
+python -m uci_net.mock_engine [options]
+
+The options are:
+
+--name=<name>          the 'id name' value, default 'Mock Engine'
+--info-rate=<n>        'info' lines per second during a search, default 100
+--pv-length=<n>        moves in each 'pv', default 10
+--duration=<seconds>   time for every search, overriding info-rate
+--nps=<n>              nodes per second reported, default 1000000
+--default-depth=<n>    depth of searches without a depth limit, default 20
+--hang=<probability>   chance a search hangs, ignoring all commands until
+                       stdin is closed
+--crash=<probability>  chance a search ends with the process exiting
+--garbage=<probability>  chance of a garbage line before each 'info' line
+--seed=<n>             seed for the failure and garbage choices
+
+Searches to depth <n> send an 'info' line for each MultiPV variation at each
+depth from 1 to <n>, with the time taken set by --info-rate or --duration.
+'go movetime <n>' searches end after <n> milliseconds, and 'go nodes <n>'
+searches when the reported nodes reach <n>.  'go infinite' searches end
+only when 'stop' arrives.  The moves are not legal chess moves, just text
+which looks like moves in UCI long algebraic notation.
+
+For example, a server with two mock engines sending 1000 'info' lines per
+second with MultiPV 5 and long pvs is started by:
+
+python -m uci_net.tcp_server --engines=2 11111 127.0.0.1 python -m
+uci_net.mock_engine --info-rate=1000 --pv-length=30
+
+"""
+
+import sys
+import time
+import random
+import queue
+
+# Use the multiprocessing API for threading
+from multiprocessing import dummy
+
+from .engine import (
+    CommandsToEngine,
+    CommandsFromEngine,
+    GoSubCommands,
+    ReservedOptionNames,
+)
+
+# Text which looks like moves, used in rotation to build the pvs.
+_MOVES = tuple(
+    a + b
+    for a, b in zip(
+        [f + r for f in "abcdefgh" for r in "2345"],
+        [f + r for f in "hgfedcba" for r in "6543"],
+    )
+)
+
+# Garbage lines sent when the --garbage option is used.
+_GARBAGE = (
+    "",
+    "info",
+    "info depth",
+    "bestmove",
+    "info score cp",
+    "\x00\x01\x02",
+    "info depth x seldepth y pv",
+    "random text which is not a UCI command",
+)
+
+
+class MockEngine:
+    """Reply to UCI commands on stdin by writing to stdout."""
+
+    def __init__(
+        self,
+        name="Mock Engine",
+        info_rate=100,
+        pv_length=10,
+        duration=None,
+        nps=1000000,
+        default_depth=20,
+        hang=0,
+        crash=0,
+        garbage=0,
+        seed=None,
+    ):
+        """Initialise engine with MultiPV 1 and no position."""
+        self.name = name
+        self.info_rate = float(info_rate)
+        self.pv_length = int(pv_length)
+        self.duration = None if duration is None else float(duration)
+        self.nps = int(nps)
+        self.default_depth = int(default_depth)
+        self.hang = float(hang)
+        self.crash = float(crash)
+        self.garbage = float(garbage)
+        self.random = random.Random(None if seed is None else int(seed))
+        self.multipv = 1
+        self.commands = queue.Queue()
+        self.searches = 0
+
+    def read_commands(self):
+        """Put lines from stdin on the commands queue, then None at the end."""
+        for line in sys.stdin:
+            self.commands.put(line.strip())
+        self.commands.put(None)
+
+    def write(self, line):
+        """Write line to stdout."""
+        sys.stdout.write(line + "\n")
+        sys.stdout.flush()
+
+    def run(self):
+        """Process commands until 'quit' or end of file."""
+        reader = dummy.Process(target=self.read_commands)
+        reader.daemon = True
+        reader.start()
+        while True:
+            command = self.commands.get()
+            if not self.do_command(command):
+                break
+
+    def do_command(self, command):
+        """Do command and return False if the engine should quit."""
+        if command is None:
+            return False
+        words = command.split()
+        if not words:
+            return True
+        if words[0] == CommandsToEngine.quit_:
+            return False
+        if words[0] == CommandsToEngine.uci:
+            self.write("id name " + self.name)
+            self.write("id author uci_net")
+            self.write(
+                "".join(
+                    (
+                        "option name ",
+                        ReservedOptionNames.MultiPV,
+                        " type spin default 1 min 1 max 500",
+                    )
+                )
+            )
+            self.write(
+                "".join(
+                    (
+                        "option name ",
+                        ReservedOptionNames.Hash,
+                        " type spin default 16 min 1 max 1024",
+                    )
+                )
+            )
+            self.write(CommandsFromEngine.uciok)
+        elif words[0] == CommandsToEngine.isready:
+            self.write(CommandsFromEngine.readyok)
+        elif words[0] == CommandsToEngine.setoption:
+            if words[2:3] == [ReservedOptionNames.MultiPV]:
+                if len(words) == 5 and words[4].isdigit():
+                    self.multipv = max(1, int(words[4]))
+        elif words[0] == CommandsToEngine.go:
+            return self.search(words[1:])
+        return True
+
+    def search_limits(self, words):
+        """Return (depth, seconds, nodes) limits from 'go' sub-commands."""
+        limits = {}
+        for index, word in enumerate(words[:-1]):
+            if word in (
+                GoSubCommands.depth,
+                GoSubCommands.movetime,
+                GoSubCommands.nodes,
+            ):
+                if words[index + 1].isdigit():
+                    limits[word] = int(words[index + 1])
+        if GoSubCommands.infinite in words:
+            depth = None
+        else:
+            depth = limits.get(GoSubCommands.depth)
+            if not limits:
+                depth = self.default_depth
+        seconds = limits.get(GoSubCommands.movetime)
+        if seconds is not None:
+            seconds /= 1000
+        return depth, seconds, limits.get(GoSubCommands.nodes)
+
+    def pv(self, depth, variation):
+        """Return pv text for variation at depth."""
+        start = (depth + variation * 7) % len(_MOVES)
+        return " ".join(
+            _MOVES[(start + move) % len(_MOVES)]
+            for move in range(self.pv_length)
+        )
+
+    def search(self, words):
+        """Send 'info' lines and a 'bestmove' and return False to quit.
+
+        Commands which arrive during the search are answered if they are
+        'isready', end the search if they are 'stop' or 'quit', and are done
+        after the search otherwise.  The end of stdin ends the search, and
+        the engine quits after sending the 'bestmove'.
+
+        """
+        depth_limit, seconds, nodes_limit = self.search_limits(words)
+        self.searches += 1
+        if self.random.random() < self.crash:
+            sys.exit(1)
+        if self.random.random() < self.hang:
+            while self.commands.get() is not None:
+                pass
+            return False
+        if self.duration is not None and depth_limit:
+            interval = self.duration / (depth_limit * self.multipv)
+        else:
+            interval = 1 / self.info_rate
+        deferred = []
+        start = time.monotonic()
+        due = start
+        depth = 0
+        pv = self.pv(1, 0)
+        stopped = False
+        while not stopped:
+            depth += 1
+            if depth_limit is not None and depth > depth_limit:
+                break
+            for variation in range(self.multipv):
+                due += interval
+                while not stopped:
+                    wait = due - time.monotonic()
+                    if wait <= 0:
+                        break
+                    try:
+                        command = self.commands.get(timeout=wait)
+                    except queue.Empty:
+                        break
+                    if command is None:
+                        deferred.append(command)
+                        stopped = True
+                        continue
+                    word = command.split(maxsplit=1)[:1]
+                    if word == [CommandsToEngine.isready]:
+                        self.write(CommandsFromEngine.readyok)
+                    elif word == [CommandsToEngine.stop]:
+                        stopped = True
+                    elif word == [CommandsToEngine.quit_]:
+                        return False
+                    else:
+                        deferred.append(command)
+                elapsed = time.monotonic() - start
+                nodes = int(elapsed * self.nps) + 1
+                if self.random.random() < self.garbage:
+                    self.write(self.random.choice(_GARBAGE))
+                line_pv = self.pv(depth, variation)
+                if variation == 0:
+                    pv = line_pv
+                self.write(
+                    " ".join(
+                        (
+                            "info depth",
+                            str(depth),
+                            "seldepth",
+                            str(depth + 2),
+                            "multipv",
+                            str(variation + 1),
+                            "score cp",
+                            str(30 - variation * 10 + depth % 3),
+                            "nodes",
+                            str(nodes),
+                            "nps",
+                            str(self.nps),
+                            "time",
+                            str(int(elapsed * 1000)),
+                            "pv",
+                            line_pv,
+                        )
+                    )
+                )
+                if seconds is not None and elapsed >= seconds:
+                    stopped = True
+                if nodes_limit is not None and nodes >= nodes_limit:
+                    stopped = True
+                if stopped:
+                    break
+        moves = pv.split()
+        self.write(
+            " ".join(
+                (
+                    CommandsFromEngine.bestmove,
+                    moves[0],
+                    "ponder",
+                    moves[1] if len(moves) > 1 else moves[0],
+                )
+            )
+        )
+        for command in deferred:
+            if not self.do_command(command):
+                return False
+        return True
+
+
+def engine_options(argv):
+    """Return dict of MockEngine arguments from '--<name>=<value>' in argv.
+
+    '-' in <name> is replaced by '_'.  ValueError is raised for other items.
+
+    """
+    options = {}
+    for item in argv:
+        if not item.startswith("--") or "=" not in item:
+            raise ValueError(item)
+        name, value = item[2:].split("=", 1)
+        options[name.replace("-", "_")] = value
+    return options
+
+
+if __name__ == "__main__":
+
+    try:
+        engine = MockEngine(**engine_options(sys.argv[1:]))
+    except (TypeError, ValueError):
+        sys.stdout.write(__doc__)
+        sys.exit()
+    engine.run()
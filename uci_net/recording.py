@@ -0,0 +1,323 @@
+# recording.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Record sessions with chess engines and replay them as a fake engine.
+
+Usage:
+
+python -m uci_net.recording record <logfile> <engine> [args ...]
+python -m uci_net.recording replay [--fast] <logfile>
+python -m uci_net.recording bench [--parse] <logfile> [runs]
+
+'record' runs engine with args and passes lines between it and stdin and
+stdout, so it can be used wherever the engine command is used, for example
+as the engine of a tcp_server.  Each line is written to logfile with it's
+time from the start of the session, taken from time.monotonic(), and it's
+direction: '>' for lines sent to the engine and '<' for lines from the
+engine.  The logfile is compressed with gzip if it's name ends '.gz'.
+
+'replay' acts as the engine recorded in logfile.  Each recorded line sent to
+the engine is matched by reading a line from stdin, whatever it's content,
+and the recorded lines from the engine which follow are written to stdout.
+The lines are written with the recorded intervals after the preceding line,
+or as fast as possible if '--fast' is given.
+
+'bench' drives a UCIDriver, parsing the responses in the driver if
+'--parse' is given, with the commands in logfile against a fast replay of
+logfile, and reports the best time of runs, default 5.  It measures changes
+to UCIDriver and the Engine parser without the variation in an engine's
+timing.
+
+"""
+
+import sys
+import gzip
+import time
+import shlex
+import subprocess
+
+# Use the multiprocessing API for threading
+from multiprocessing import dummy
+
+from .engine import CommandsFromEngine, CommandsToEngine, EngineResults
+from .uci_driver import UCIDriver
+
+TO_ENGINE = ">"
+FROM_ENGINE = "<"
+
+DEFAULT_RUNS = 5
+
+# Longest wait for the replies to a command in the bench.
+BENCH_TIMEOUT = 60
+
+
+def open_log(path, mode):
+    """Return text file object for path, compressed if path ends '.gz'."""
+    if path.endswith(".gz"):
+        return gzip.open(path, mode + "t", encoding="utf-8")
+    return open(path, mode, encoding="utf-8")
+
+
+def read_recording(path):
+    """Return list of (seconds, direction, line) recorded in file path.
+
+    Lines which are not records are ignored.
+
+    """
+    events = []
+    with open_log(path, "r") as logfile:
+        for record in logfile:
+            fields = record.rstrip("\n").split(" ", 2)
+            if len(fields) < 2 or fields[1] not in (TO_ENGINE, FROM_ENGINE):
+                continue
+            try:
+                seconds = float(fields[0])
+            except ValueError:
+                continue
+            events.append(
+                (seconds, fields[1], fields[2] if len(fields) > 2 else "")
+            )
+    return events
+
+
+class Recorder:
+    """Run an engine and record the lines passed to and from it."""
+
+    def __init__(self, path, args):
+        """Initialise to run engine command line args and record in path."""
+        self.path = path
+        self.args = args
+        self._lock = dummy.Lock()
+        self._logfile = None
+        self._start = None
+
+    def log(self, direction, line):
+        """Write line passed in direction to the log."""
+        with self._lock:
+            self._logfile.write(
+                "".join(
+                    (
+                        format(time.monotonic() - self._start, ".6f"),
+                        " ",
+                        direction,
+                        " ",
+                        line,
+                        "\n",
+                    )
+                )
+            )
+
+    def _copy_engine_output(self, engine):
+        """Copy lines from engine to stdout, and the log."""
+        for line in engine.stdout:
+            line = line.rstrip("\n")
+            self.log(FROM_ENGINE, line)
+            sys.stdout.write(line + "\n")
+            sys.stdout.flush()
+
+    def run(self):
+        """Run engine until stdin is closed or the engine exits."""
+        engine = subprocess.Popen(
+            self.args,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            bufsize=1,
+            universal_newlines=True,
+        )
+        self._start = time.monotonic()
+        with open_log(self.path, "w") as logfile:
+            self._logfile = logfile
+            logfile.write("# " + " ".join(self.args) + "\n")
+            reader = dummy.Process(
+                target=self._copy_engine_output, args=(engine,)
+            )
+            reader.daemon = True
+            reader.start()
+            try:
+                for line in sys.stdin:
+                    line = line.rstrip("\n")
+                    self.log(TO_ENGINE, line)
+
+                    # The log is flushed as each command arrives, rather
+                    # than for each line from the engine, so little is lost
+                    # if the recorder is killed.
+                    with self._lock:
+                        logfile.flush()
+                    engine.stdin.write(line + "\n")
+                    engine.stdin.flush()
+                    if line.split(maxsplit=1)[:1] == [CommandsToEngine.quit_]:
+                        break
+            except (BrokenPipeError, KeyboardInterrupt):
+                pass
+            try:
+                engine.stdin.close()
+            except BrokenPipeError:
+                pass
+            engine.wait()
+            reader.join(5)
+        return engine.returncode
+
+
+class ReplayEngine:
+    """Act as the engine whose session is in a recording."""
+
+    def __init__(self, events, fast=False):
+        """Initialise to replay events, from read_recording().
+
+        The lines from the engine are written as fast as possible if fast is
+        True, or with the recorded intervals otherwise.
+
+        """
+        self.events = events
+        self.fast = fast
+
+    def run(self, stdin=None, stdout=None):
+        """Replay events until they or stdin end, or 'quit' is read."""
+        stdin = sys.stdin if stdin is None else stdin
+        stdout = sys.stdout if stdout is None else stdout
+        fast = self.fast
+        previous = None
+        resumed = time.monotonic()
+        for seconds, direction, line in self.events:
+            if direction == TO_ENGINE:
+                stdout.flush()
+                command = stdin.readline()
+                if not command:
+                    return
+                if command.split(maxsplit=1)[:1] == [CommandsToEngine.quit_]:
+                    return
+                previous = seconds
+                resumed = time.monotonic()
+                continue
+            if not fast and previous is not None:
+                wait = resumed + seconds - previous - time.monotonic()
+                if wait > 0:
+                    stdout.flush()
+                    time.sleep(wait)
+            stdout.write(line + "\n")
+            if not fast:
+                stdout.flush()
+        stdout.flush()
+
+        # Wait for the user of the engine to finish.
+        for line in stdin:
+            if line.split(maxsplit=1)[:1] == [CommandsToEngine.quit_]:
+                break
+
+
+def _non_info_count(item):
+    """Return number of lines other than 'info' lines in reply item."""
+    response = item[1]
+    if isinstance(response, EngineResults):
+        response = response.lines
+    return sum(
+        1
+        for line in response
+        if not line.startswith(CommandsFromEngine.info)
+    )
+
+
+def bench_replay(path, parse=False):
+    """Return seconds for a UCIDriver to do the session recorded in path.
+
+    Each recorded command is sent when the lines, other than 'info' lines,
+    recorded before it have been received from a fast replay of the
+    session.  The time starts when the reply to 'uci' has been received.
+
+    """
+    events = read_recording(path)
+    commands = []
+    expected = 0
+    for seconds, direction, line in events:
+        if direction == TO_ENGINE:
+            commands.append((line, expected))
+        elif not line.startswith(CommandsFromEngine.info):
+            expected += 1
+    replies = dummy.Queue()
+    driver = UCIDriver(replies, "replay", parse=parse)
+    driver.start_engine(
+        sys.executable,
+        " ".join(("-m uci_net.recording replay --fast", shlex.quote(path))),
+    )
+    received = 0
+    handshake = False
+    start = time.perf_counter()
+    try:
+        for command, wanted in commands + [(None, expected)]:
+            while received < wanted:
+                received += _non_info_count(replies.get(timeout=BENCH_TIMEOUT))
+
+            # The clock is restarted when the 'uciok' has arrived so the
+            # fixed wait for more replies to 'uci' is not timed.
+            if handshake:
+                handshake = False
+                start = time.perf_counter()
+            if command is None:
+                break
+            word = command.split(maxsplit=1)[:1]
+            if word == [CommandsToEngine.quit_]:
+                break
+            if word == [CommandsToEngine.uci]:
+                handshake = True
+            driver.send_to_engine(command)
+        return time.perf_counter() - start
+    finally:
+
+        # The replay exits on 'quit' so the driver's threads see the end of
+        # file rather than a closed file.
+        driver.send_to_engine(CommandsToEngine.quit_)
+        try:
+            driver.engine_process.wait(BENCH_TIMEOUT)
+        except subprocess.TimeoutExpired:
+            driver.quit_engine()
+
+
+if __name__ == "__main__":
+
+    arguments = sys.argv[1:]
+    action = arguments.pop(0) if arguments else None
+    if action == "record" and len(arguments) > 1:
+        sys.exit(Recorder(arguments[0], arguments[1:]).run())
+    elif action == "replay" and arguments:
+        replay_fast = arguments[0] == "--fast"
+        if replay_fast:
+            arguments.pop(0)
+        if len(arguments) != 1:
+            sys.stdout.write(__doc__)
+            sys.exit()
+        ReplayEngine(read_recording(arguments[0]), fast=replay_fast).run()
+    elif action == "bench" and arguments:
+        parse_responses = arguments[0] == "--parse"
+        if parse_responses:
+            arguments.pop(0)
+        if len(arguments) not in (1, 2):
+            sys.stdout.write(__doc__)
+            sys.exit()
+        runs = int(arguments[1]) if len(arguments) > 1 else DEFAULT_RUNS
+        best = min(
+            bench_replay(arguments[0], parse=parse_responses)
+            for _ in range(runs)
+        )
+        lines = sum(
+            1
+            for event in read_recording(arguments[0])
+            if event[1] == FROM_ENGINE
+        )
+        sys.stdout.write(
+            "".join(
+                (
+                    "best of ",
+                    str(runs),
+                    " runs (seconds): ",
+                    format(best, ".3f"),
+                    "\nlines from engine: ",
+                    str(lines),
+                    "\nlines per second: ",
+                    str(int(lines / best)) if best else "-",
+                    "\n",
+                )
+            )
+        )
+    else:
+        sys.stdout.write(__doc__)
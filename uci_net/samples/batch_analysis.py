@@ -0,0 +1,102 @@
+# batch_analysis.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Analyse the positions in a file with a batch request to a tcp_server.
+
+Usage:
+
+python -m uci_net.samples.batch_analysis url depth multipv fenfile
+
+where url is like '//<host>:<port>?name=<engine name>' and fenfile contains
+positions, one FEN per line.
+
+Any 'info string' lines, the final 'info' line with a 'pv' for each multipv,
+and the 'bestmove' line are printed for each position in the order the
+analysis completes.
+
+"""
+
+import sys
+import time
+from urllib.parse import urlsplit
+
+from ..tcp_protocol import (
+    encode_batch_request,
+    iter_reply,
+    ReplyKeys,
+    StreamModes,
+)
+from ..tcp_client import (
+    DEFAULT_UCI_ENGINE_HOSTNAME,
+    DEFAULT_UCI_ENGINE_LISTEN_PORT,
+)
+
+
+def analyse_positions(host, port, fens, depth, multipv):
+    """Yield (index, seconds, lines) for each of fens as analysis completes.
+
+    seconds is the time from the start of the batch to completion of the
+    analysis of the position at index in fens.
+
+    """
+    start = time.perf_counter()
+    lines = {}
+    for item in iter_reply(
+        host,
+        port,
+        encode_batch_request(
+            [(fen, depth, multipv) for fen in fens], stream=StreamModes.pv
+        ),
+    ):
+        index = item.get(ReplyKeys.index)
+        if index is None:
+            continue
+        lines.setdefault(index, []).extend(item[ReplyKeys.lines])
+        if lines[index] and lines[index][-1].startswith("bestmove"):
+            yield index, time.perf_counter() - start, lines.pop(index)
+
+
+def summary_lines(lines):
+    """Return the lines from engine to print for a position.
+
+    These are the 'info string' lines, the last 'info' line with a 'pv' for
+    each multipv, and the 'bestmove' line.
+
+    """
+    strings = []
+    latest = {}
+    for line in lines:
+        if line.startswith("info string "):
+            strings.append(line)
+        elif line.startswith("info ") and " pv " in line:
+            words = line.split()
+            if "multipv" in words:
+                latest[words[words.index("multipv") + 1]] = line
+            else:
+                latest["1"] = line
+    return (
+        strings + [latest[k] for k in sorted(latest, key=int)] + lines[-1:]
+    )
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) != 5:
+        sys.stdout.write(__doc__)
+        sys.exit()
+    url = urlsplit(sys.argv[1])
+    with open(sys.argv[4], encoding="utf-8") as fenfile:
+        positions = [line.strip() for line in fenfile if line.strip()]
+    for index, seconds, lines in analyse_positions(
+        url.hostname or DEFAULT_UCI_ENGINE_HOSTNAME,
+        url.port or DEFAULT_UCI_ENGINE_LISTEN_PORT,
+        positions,
+        int(sys.argv[2]),
+        int(sys.argv[3]),
+    ):
+        sys.stdout.write(
+            "{} {:.3f} {}\n".format(index + 1, seconds, positions[index])
+        )
+        for line in summary_lines(lines):
+            sys.stdout.write("    " + line + "\n")
@@ -0,0 +1,153 @@
+# compression_timing.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Compare bytes on wire and latency of compressed and ordinary reply frames.
+
+Usage:
+
+python -m uci_net.samples.compression_timing [megabits per second]
+
+Replies like those from engines doing MultiPV searches are made for a range
+of depths and MultiPV values.  Each reply is sent as an ordinary frame and as
+a compressed frame over a loopback connection, and the time to send the
+bytes over a link of the given speed, default 10 megabits per second, is
+added to the loopback time to estimate the latency over a slower link.
+
+"""
+
+import sys
+import time
+import socket
+import random
+from multiprocessing import dummy
+
+from ..tcp_protocol import (
+    encode_frame,
+    compress_frame,
+    reply_item,
+    FrameDecoder,
+    RequestKeys,
+    DEFAULT_COMPRESS_THRESHOLD,
+)
+
+# (depth, multipv) of the replies compared.
+REPLY_SIZES = ((10, 1), (20, 1), (20, 5), (30, 5), (30, 10), (40, 20))
+
+_SQUARES = [f + r for f in "abcdefgh" for r in "12345678"]
+
+
+def engine_lines(depth, multipv, seed=1):
+    """Return 'info' and 'bestmove' lines like a search to depth."""
+    generator = random.Random(seed)
+    pvs = [
+        [
+            generator.choice(_SQUARES) + generator.choice(_SQUARES)
+            for _ in range(depth + 10)
+        ]
+        for _ in range(multipv)
+    ]
+    lines = []
+    nodes = 0
+    for ply in range(1, depth + 1):
+        for number, pv in enumerate(pvs):
+            nodes += 1000 * ply
+            lines.append(
+                " ".join(
+                    (
+                        "info depth",
+                        str(ply),
+                        "seldepth",
+                        str(ply + 5),
+                        "multipv",
+                        str(number + 1),
+                        "score cp",
+                        str(generator.randint(-50, 50)),
+                        "nodes",
+                        str(nodes),
+                        "nps 1500000 hashfull 100 tbhits 0 time",
+                        str(nodes // 1500),
+                        "pv",
+                        " ".join(pv[: ply + 1]),
+                    )
+                )
+            )
+    lines.append("bestmove " + pvs[0][0] + " ponder " + pvs[0][1])
+    return lines
+
+
+def loopback_seconds(frame):
+    """Return seconds to send frame over loopback and decode the reply."""
+    listener = socket.create_server(("127.0.0.1", 0))
+
+    def send():
+        connection = listener.accept()[0]
+        with connection:
+            connection.sendall(frame)
+
+    sender = dummy.Process(target=send)
+    sender.start()
+    start = time.perf_counter()
+    decoder = FrameDecoder()
+    with socket.create_connection(listener.getsockname()) as sock:
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            decoder.feed(chunk)
+    decoder.close()
+    elapsed = time.perf_counter() - start
+    sender.join()
+    listener.close()
+    return elapsed
+
+
+def compare(depth, multipv, bytes_per_second):
+    """Return (plain bytes, compressed bytes, plain s, compressed s)."""
+    item = reply_item(
+        "engine",
+        engine_lines(depth, multipv),
+        {RequestKeys.compress: DEFAULT_COMPRESS_THRESHOLD},
+    )
+    results = []
+    for threshold in (None, DEFAULT_COMPRESS_THRESHOLD):
+        start = time.perf_counter()
+        frame = compress_frame(encode_frame(item), threshold)
+        encode_seconds = time.perf_counter() - start
+        results.append(
+            (
+                len(frame),
+                encode_seconds
+                + loopback_seconds(frame)
+                + len(frame) / bytes_per_second,
+            )
+        )
+    return results[0][0], results[1][0], results[0][1], results[1][1]
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 2:
+        sys.stdout.write(__doc__)
+        sys.exit()
+    megabits = float(sys.argv[1]) if len(sys.argv) == 2 else 10
+    sys.stdout.write(
+        "depth multipv  plain bytes  zlib bytes  ratio"
+        "  plain ms  zlib ms\n"
+    )
+    for depth, multipv in REPLY_SIZES:
+        plain, compressed, plain_time, compressed_time = compare(
+            depth, multipv, megabits * 125000
+        )
+        sys.stdout.write(
+            "{:>5} {:>7}  {:>11}  {:>10}  {:>5.2f}  {:>8.2f}  {:>7.2f}\n"
+            .format(
+                depth,
+                multipv,
+                plain,
+                compressed,
+                compressed / plain,
+                plain_time * 1000,
+                compressed_time * 1000,
+            )
+        )
@@ -2,24 +2,67 @@
 # Copyright 2015 Roger Marsh
 # License: See LICENSE.TXT (BSD licence)
 
-"""Sample display of output from multiple chess engines."""
+"""Sample display of output from multiple chess engines.
+
+The engine responses are parsed in the driver processes, which put an
+EngineResults summary on the queue to this process rather than the lines.
+Responses other than 'info' lines from all the engines are appended to a
+log which keeps the most recent MAX_LOG_LINES lines.  Each engine also has
+a pane showing the latest 'pv' for each 'multipv' value in the current
+search.
+
+The queue of responses is polled every POLL_MIN_MS milliseconds while
+responses are arriving, and less often, down to every POLL_MAX_MS
+milliseconds, while the engines are quiet.  At most DRAIN_SECONDS are spent
+taking responses from the queue before the display is updated, so the
+display stays responsive when several engines stream at full rate.
+
+"""
 
 import tkinter
 import tkinter.messagebox
 import tkinter.filedialog
 import sys
+import time
 import multiprocessing
 from queue import Empty
 from urllib.parse import urlsplit
 
 from ..uci_driver_over_tcp import UCIDriverOverTCP
-from ..engine import CommandsToEngine
+from ..engine import (
+    CommandsToEngine,
+    EngineResults,
+    InfoParameters,
+    ScoreInfoValueNames,
+)
+
+# Seconds between putting the responses so far on the queue during a search.
+STREAM_INTERVAL = 0.1
+
+# Lines kept in the log of responses from all engines.
+MAX_LOG_LINES = 5000
+
+# Limits of the interval between polls of the queue of responses.
+POLL_MIN_MS = 20
+POLL_MAX_MS = 500
+
+# Longest time spent taking responses from the queue before display.
+DRAIN_SECONDS = 0.05
+
+# Most lines shown in an engine's pane before it scrolls.
+MAX_PANE_LINES = 10
 
 
 # Copied from chesstab/core/uci.py
 def run_driver(to_driver_queue, to_ui_queue, path, args, ui_name):
     """Run the process or thread driving communication with chess engine."""
-    driver = UCIDriverOverTCP(to_ui_queue, ui_name)
+    driver = UCIDriverOverTCP(
+        to_ui_queue,
+        ui_name,
+        stream_interval=STREAM_INTERVAL,
+        in_process=True,
+        parse=True,
+    )
     try:
         driver.start_engine(path, args)
     except Exception:
@@ -34,6 +77,59 @@ def run_driver(to_driver_queue, to_ui_queue, path, args, ui_name):
     driver.quit_engine()
 
 
+def multipv_order(multipv):
+    """Return sort key for multipv value, a string or None meaning 1."""
+    if multipv is None:
+        return 1
+    return int(multipv) if multipv.isdigit() else 0
+
+
+def pv_text(info):
+    """Return text showing depth, score, and pv in parsed info."""
+    ips = InfoParameters
+    score = info.get(ips.score) or {}
+    items = [ips.depth, info.get(ips.depth) or "?"]
+    for name in ScoreInfoValueNames.cp, ScoreInfoValueNames.mate:
+        if name in score:
+            items.extend((name, score[name]))
+    items.extend(info.get(ips.pv, ()))
+    return " ".join(items)
+
+
+class EnginePane:
+    """Show the latest pv for each multipv value from an engine."""
+
+    def __init__(self, master, ui_name):
+        """Create pane in master for engine named ui_name."""
+        self.frame = tkinter.LabelFrame(master=master, text=ui_name)
+        self.text = tkinter.Text(
+            master=self.frame, height=1, wrap=tkinter.NONE
+        )
+        self.text.pack(fill=tkinter.X, expand=tkinter.TRUE)
+        self.frame.pack(side=tkinter.TOP, fill=tkinter.X)
+        self.pvs = {}
+
+    def note_results(self, results):
+        """Note latest pvs in EngineResults results and return True if new."""
+        if results.pvs == self.pvs:
+            return False
+        self.pvs = results.pvs
+        return True
+
+    def show(self):
+        """Replace the lines shown by the latest pvs."""
+        text = self.text
+        text.delete("1.0", tkinter.END)
+        text.insert(
+            tkinter.END,
+            "\n".join(
+                pv_text(self.pvs[k])
+                for k in sorted(self.pvs, key=multipv_order)
+            ),
+        )
+        text.configure(height=max(1, min(MAX_PANE_LINES, len(self.pvs))))
+
+
 class EngineOutput:
     """An application to communicate with chess engines with UCI commands.
 
@@ -46,6 +142,8 @@ class EngineOutput:
         self.uci_drivers_reply = multiprocessing.Queue()
         self.uci_drivers = dict()
         self.counter = 0
+        self.engine_panes = dict()
+        self.poll_interval = POLL_MIN_MS
 
         self.root = tkinter.Tk()
         self.root.wm_title("Output from multiple Chess Engines")
@@ -103,6 +201,8 @@ class EngineOutput:
             label=CommandsToEngine.quit_, underline=0, command=self.quit_
         )
         self.root.configure(menu=menubar)
+        self.panes = tkinter.Frame(self.root)
+        self.panes.pack(side=tkinter.TOP, fill=tkinter.X)
         text = tkinter.Text(self.root)
         scrollbar = tkinter.Scrollbar(
             master=self.root, orient=tkinter.VERTICAL, command=text.yview
@@ -222,6 +322,7 @@ class EngineOutput:
         )
         driver.start()
         self.uci_drivers[driver] = (program_file_name, to_driver_queue)
+        self.engine_panes[ui_name] = EnginePane(self.panes, ui_name)
 
     def send_to_all_engines(self, event):
         """Send a command to all engines.
@@ -314,25 +415,59 @@ class EngineOutput:
         self.do_command(CommandsToEngine.quit_, self.send_to_all_engines)
 
     def get_engine_responses(self):
-        """Process engine responses."""
-        text = self.text
-        self.root.after(1000, self.get_engine_responses)
-        while True:
+        """Process engine responses.
+
+        All the responses taken from the queue in one poll are added to the
+        log in one insert, and each engine's pane is redrawn at most once.
+
+        """
+        reply = self.uci_drivers_reply
+        panes = self.engine_panes
+        chunks = []
+        changed = set()
+        start = time.monotonic()
+        while time.monotonic() - start < DRAIN_SECONDS:
             try:
-                item = self.uci_drivers_reply.get_nowait()
+                item = reply.get_nowait()
             except Empty:
                 break
             try:
                 name, response = item
-                text.insert(tkinter.END, "".join((str(name), "\n")))
-                for clause in response:
-                    try:
-                        text.insert(tkinter.END, clause)
-                    except Exception:
-                        text.insert(tkinter.END, "*** unable to insert item")
-                    text.insert(tkinter.END, "\n")
+                if not isinstance(response, EngineResults):
+                    chunks.append(str(name))
+                    chunks.extend(str(clause) for clause in response)
+                    continue
+                if response.lines:
+                    chunks.append(str(name))
+                    chunks.extend(response.lines)
+                if name in panes and panes[name].note_results(response):
+                    changed.add(name)
             except Exception:
-                text.insert(tkinter.END, "*** unable to insert any items")
+                chunks.append("*** unable to insert any items")
+        if chunks:
+            self.append_to_log(chunks)
+        if chunks or changed:
+            self.poll_interval = POLL_MIN_MS
+        else:
+            self.poll_interval = min(POLL_MAX_MS, self.poll_interval * 2)
+        for name in changed:
+            panes[name].show()
+        self.root.after(self.poll_interval, self.get_engine_responses)
+
+    def append_to_log(self, lines):
+        """Append lines to log and discard the oldest beyond MAX_LOG_LINES.
+
+        The log follows the new lines if it was showing the last line.
+
+        """
+        text = self.text
+        following = text.yview()[1] >= 1
+        text.insert(tkinter.END, "\n".join(lines) + "\n")
+        excess = int(text.index("end-1c").split(".")[0]) - MAX_LOG_LINES
+        if excess > 0:
+            text.delete("1.0", str(excess + 1) + ".0")
+        if following:
+            text.see(tkinter.END)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,66 @@
+# session_timing.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Compare time-to-depth with and without a session on a tcp_server.
+
+Usage:
+
+python -m uci_net.samples.session_timing url depth fenfile
+
+where url is like '//<host>:<port>?name=<engine name>' and fenfile contains
+consecutive positions from a game, one FEN per line.
+
+Each position is analysed to depth without a session, and then again with a
+session so the server retains the hash tables between positions.
+
+"""
+
+import sys
+import time
+from urllib.parse import urlsplit
+
+from ..tcp_protocol import encode_request, go_commands, send_request
+from ..tcp_client import (
+    DEFAULT_UCI_ENGINE_HOSTNAME,
+    DEFAULT_UCI_ENGINE_LISTEN_PORT,
+)
+
+
+def time_positions(host, port, fens, depth, session):
+    """Return list of seconds taken to analyse each of fens to depth."""
+    elapsed = []
+    for fen in fens:
+        commands = go_commands(fen, depth)
+        start = time.perf_counter()
+        send_request(host, port, encode_request(commands, session=session))
+        elapsed.append(time.perf_counter() - start)
+    return elapsed
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) != 4:
+        sys.stdout.write(__doc__)
+        sys.exit()
+    url = urlsplit(sys.argv[1])
+    with open(sys.argv[3], encoding="utf-8") as fenfile:
+        positions = [line.strip() for line in fenfile if line.strip()]
+    args = (
+        url.hostname or DEFAULT_UCI_ENGINE_HOSTNAME,
+        url.port or DEFAULT_UCI_ENGINE_LISTEN_PORT,
+        positions,
+        int(sys.argv[2]),
+    )
+    without_session = time_positions(*args, None)
+    with_session = time_positions(*args, "session_timing " + str(time.time()))
+    sys.stdout.write("position  without session  with session\n")
+    for number, times in enumerate(zip(without_session, with_session)):
+        sys.stdout.write(
+            "{:>8}  {:>15.3f}  {:>12.3f}\n".format(number + 1, *times)
+        )
+    sys.stdout.write(
+        "{:>8}  {:>15.3f}  {:>12.3f}\n".format(
+            "total", sum(without_session), sum(with_session)
+        )
+    )
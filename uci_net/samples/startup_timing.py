@@ -0,0 +1,91 @@
+# startup_timing.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Measure the start-up time of the tcp_client process against a budget.
+
+Usage:
+
+python -m uci_net.samples.startup_timing [runs] [budget milliseconds]
+
+UCIDriverOverTCP starts a tcp_client process for each remote engine, so the
+time taken for the process to start matters when many engines are used.
+
+A tcp_client process which gets no commands is started runs times, default
+20, and so is an interpreter which does nothing.  The median extra time
+taken by tcp_client is compared with the budget, default 50 milliseconds,
+and the exit status is 1 if the budget is exceeded.
+
+"""
+
+import sys
+import time
+import subprocess
+from statistics import median
+
+from ..tcp_client import (
+    DEFAULT_UCI_ENGINE_HOSTNAME,
+    DEFAULT_UCI_ENGINE_LISTEN_PORT,
+)
+
+DEFAULT_RUNS = 20
+DEFAULT_BUDGET = 50
+
+# The client is given no commands so it never connects to this address.
+_URL = "".join(
+    (
+        "//",
+        DEFAULT_UCI_ENGINE_HOSTNAME,
+        ":",
+        DEFAULT_UCI_ENGINE_LISTEN_PORT,
+        "?name=startup_timing",
+    )
+)
+
+
+def time_process(args, runs):
+    """Return list of seconds taken by runs processes running args."""
+    elapsed = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        subprocess.run(args, stdin=subprocess.DEVNULL, check=True)
+        elapsed.append(time.perf_counter() - start)
+    return elapsed
+
+
+def startup_times(runs):
+    """Return (interpreter, tcp_client) median seconds for runs starts."""
+    interpreter = time_process([sys.executable, "-c", "pass"], runs)
+    client = time_process(
+        [sys.executable, "-m", "uci_net.tcp_client", _URL], runs
+    )
+    return median(interpreter), median(client)
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 3:
+        sys.stdout.write(__doc__)
+        sys.exit()
+    runs = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_RUNS
+    budget = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_BUDGET
+    interpreter, client = startup_times(runs)
+    extra = (client - interpreter) * 1000
+    sys.stdout.write(
+        "".join(
+            (
+                "median interpreter start (ms): ",
+                format(interpreter * 1000, ".1f"),
+                "\nmedian tcp_client start (ms): ",
+                format(client * 1000, ".1f"),
+                "\ntcp_client extra (ms): ",
+                format(extra, ".1f"),
+                "\nbudget (ms): ",
+                str(budget),
+                "\n",
+            )
+        )
+    )
+    if extra > budget:
+        sys.stdout.write("budget exceeded\n")
+        sys.exit(1)
@@ -0,0 +1,137 @@
+# transport_timing.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Compare the queue and shared memory transports used by tcp_server.
+
+Usage:
+
+python -m uci_net.samples.transport_timing [replies] [lines per reply]
+
+A process like run_driver puts replies, default 2000, each of some 'info'
+lines, default 50, on a multiprocessing.Queue and then on a
+SharedMemoryQueue.  The throughput of each transport is reported, and the
+round trip time of single line commands and replies, as between a 'stop'
+command and it's 'bestmove'.
+
+The shared memory transport needs Python 3.8 or later.
+
+"""
+
+import sys
+import time
+import multiprocessing
+from statistics import median
+
+from ..tcp_server import QUEUE_TRANSPORT, SHARED_MEMORY_TRANSPORT
+from ..shared_memory_queue import SharedMemoryQueue, shared_memory
+
+DEFAULT_REPLIES = 2000
+DEFAULT_LINES = 50
+ROUND_TRIPS = 1000
+
+# An 'info' line of the size sent by engines searching with long pvs.
+_INFO = " ".join(
+    (
+        "info depth 30 seldepth 42 multipv 1 score cp 25 nodes 123456789",
+        "nps 2500000 hashfull 500 tbhits 0 time 49382 pv",
+        " ".join(["e2e4 e7e5 g1f3 b8c6 f1b5 a7a6"] * 6),
+    )
+)
+
+
+def echo_driver(to_driver_queue, to_ui_queue):
+    """Reply to commands like run_driver until 'quit'.
+
+    'reply <n> <lines>' gets n replies of lines 'info' lines, and any other
+    command gets a reply of the command.  The lines differ so pickle does
+    not reduce repeated lines to references.
+
+    """
+    while True:
+        command = to_driver_queue.get()
+        if command == "quit":
+            break
+        words = command.split()
+        if words[0] == "reply":
+            for reply in range(int(words[1])):
+                to_ui_queue.put(
+                    (
+                        "echo",
+                        [
+                            _INFO.replace("time", "time " + str(reply + line))
+                            for line in range(int(words[2]))
+                        ],
+                    )
+                )
+            to_ui_queue.put(("echo", ["bestmove e2e4"]))
+        else:
+            to_ui_queue.put(("echo", [command]))
+
+
+def time_transport(transport, replies, lines):
+    """Return (seconds for replies, round trip seconds) for transport."""
+    if transport == SHARED_MEMORY_TRANSPORT:
+        to_driver_queue = SharedMemoryQueue()
+        to_ui_queue = SharedMemoryQueue()
+    else:
+        to_driver_queue = multiprocessing.Queue()
+        to_ui_queue = multiprocessing.Queue()
+    driver = multiprocessing.Process(
+        target=echo_driver, args=(to_driver_queue, to_ui_queue)
+    )
+    driver.start()
+    try:
+        to_driver_queue.put("isready")
+        to_ui_queue.get()
+        start = time.perf_counter()
+        to_driver_queue.put(" ".join(("reply", str(replies), str(lines))))
+        while to_ui_queue.get()[1] != ["bestmove e2e4"]:
+            pass
+        elapsed = time.perf_counter() - start
+        round_trips = []
+        for _ in range(ROUND_TRIPS):
+            start = time.perf_counter()
+            to_driver_queue.put("stop")
+            to_ui_queue.get()
+            round_trips.append(time.perf_counter() - start)
+        to_driver_queue.put("quit")
+        driver.join()
+    finally:
+        if transport == SHARED_MEMORY_TRANSPORT:
+            to_driver_queue.unlink()
+            to_ui_queue.unlink()
+    return elapsed, median(round_trips)
+
+
+if __name__ == "__main__":
+
+    if len(sys.argv) > 3:
+        sys.stdout.write(__doc__)
+        sys.exit()
+    reply_count = int(sys.argv[1]) if len(sys.argv) > 1 else DEFAULT_REPLIES
+    line_count = int(sys.argv[2]) if len(sys.argv) > 2 else DEFAULT_LINES
+    megabytes = reply_count * line_count * (len(_INFO) + 1) / 2**20
+    transports = [QUEUE_TRANSPORT]
+    if shared_memory is not None:
+        transports.append(SHARED_MEMORY_TRANSPORT)
+    sys.stdout.write(
+        "{} replies of {} lines, {:.1f} MB\n".format(
+            reply_count, line_count, megabytes
+        )
+    )
+    sys.stdout.write(
+        "{:<15} {:>12} {:>12} {:>16}\n".format(
+            "transport", "replies/s", "MB/s", "round trip (us)"
+        )
+    )
+    for name in transports:
+        seconds, round_trip = time_transport(name, reply_count, line_count)
+        sys.stdout.write(
+            "{:<15} {:>12.0f} {:>12.1f} {:>16.1f}\n".format(
+                name,
+                reply_count / seconds,
+                megabytes / seconds,
+                round_trip * 1e6,
+            )
+        )
@@ -0,0 +1,207 @@
+# shared_memory_queue.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""A queue between processes in a shared memory ring buffer.
+
+SharedMemoryQueue can replace the multiprocessing.Queue instances between
+tcp_server and it's run_driver processes.  The items put on these queues are
+UCI commands, which are strings, and (<name>, <lines from engine>) replies.
+These are written into the ring buffer as UTF-8 text, without pickling and
+without the feeder thread and pipe of multiprocessing.Queue.  A semaphore
+counts the items in the buffer so a reader can wait for an item without
+polling.
+
+The lines in a reply are joined by newlines, so a line containing a newline
+arrives as two lines.  Lines read from an engine's stdout by UCIDriver do
+not contain newlines.
+
+Other items, such as the commands made by tracing.trace_command(), are rare
+and are pickled.
+
+The multiprocessing.shared_memory module is needed, which was introduced in
+Python 3.8.
+
+"""
+
+import pickle
+import queue
+import struct
+import time
+import multiprocessing
+
+try:
+    from multiprocessing import shared_memory
+except ImportError:  # Python 3.7
+    shared_memory = None
+
+# Default size in bytes of the ring buffer.  A small ring stays in the
+# processor caches, and a reply too big for the ring is put in parts.
+DEFAULT_BUFFER_SIZE = 2**22
+
+# Seconds between checks for space when the ring buffer is full.
+FULL_BUFFER_WAIT = 0.001
+
+# The header holds the total bytes written and read as unsigned 64-bit
+# integers.  Positions in the ring are these totals modulo the ring size.
+_HEADER = struct.Struct("=QQ")
+
+# Each item is it's length, it's kind, and it's data.
+_ITEM_HEADER = struct.Struct("=Ic")
+
+_STRING = b"s"
+_REPLY = b"r"
+_PICKLE = b"p"
+
+_SEPARATOR = "\n"
+
+
+def encode_item(item):
+    """Return (kind, data) for item as stored in the ring buffer."""
+    if isinstance(item, str):
+        return _STRING, item.encode()
+    if (
+        isinstance(item, tuple)
+        and len(item) == 2
+        and isinstance(item[0], str)
+        and isinstance(item[1], (list, tuple))
+        and _SEPARATOR not in item[0]
+    ):
+        if not item[1]:
+            return _REPLY, item[0].encode()
+        try:
+            return _REPLY, _SEPARATOR.join((item[0], *item[1])).encode()
+        except TypeError:
+            pass
+    return _PICKLE, pickle.dumps(item)
+
+
+def decode_item(kind, data):
+    """Return item stored in the ring buffer as kind and data.
+
+    data is a bytes-like object, such as a memoryview of the ring buffer.
+
+    """
+    if kind == _STRING:
+        return str(data, "utf-8")
+    if kind == _REPLY:
+        name, separator, text = str(data, "utf-8").partition(_SEPARATOR)
+        return name, text.split(_SEPARATOR) if separator else []
+    return pickle.loads(data)
+
+
+class SharedMemoryQueue:
+    """A multiple producer, single consumer, queue in shared memory.
+
+    The put() and get() methods behave like those of multiprocessing.Queue
+    for the items used by tcp_server and run_driver.  put() waits while the
+    ring buffer is too full for the item.  A reply too big for the ring
+    buffer is put as consecutive replies each with some of the lines, and
+    other items too big for the ring buffer cannot be put.
+
+    The process which creates the queue should call unlink() when the queue
+    is no longer needed.
+
+    """
+
+    def __init__(self, size=DEFAULT_BUFFER_SIZE):
+        """Create queue with a ring buffer of size bytes."""
+        if shared_memory is None:
+            raise RuntimeError("multiprocessing.shared_memory not available")
+        self.size = size
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=_HEADER.size + size
+        )
+        _HEADER.pack_into(self.memory.buf, 0, 0, 0)
+
+        # Touch every page now so the first pass round the ring is not slowed
+        # by page faults.
+        self.memory.buf[_HEADER.size :] = bytes(size)
+        self.items = multiprocessing.Semaphore(0)
+        self.put_lock = multiprocessing.Lock()
+
+    def _positions(self):
+        """Return (total bytes written, total bytes read)."""
+        return _HEADER.unpack_from(self.memory.buf, 0)
+
+    def _copy_in(self, position, data):
+        """Copy data into ring starting at total bytes written position."""
+        buf = self.memory.buf
+        offset = position % self.size
+        first = min(len(data), self.size - offset)
+        start = _HEADER.size + offset
+        if first == len(data):
+            buf[start : start + first] = data
+            return
+        data = memoryview(data)
+        buf[start : start + first] = data[:first]
+        buf[_HEADER.size : _HEADER.size + len(data) - first] = data[first:]
+
+    def _copy_out(self, position, length):
+        """Return length bytes from ring starting at total bytes read.
+
+        A memoryview of the ring buffer is returned, rather than a copy, if
+        the bytes do not wrap round the end of the ring.  It must be used
+        before the read position is moved past the bytes.
+
+        """
+        buf = self.memory.buf
+        offset = position % self.size
+        first = min(length, self.size - offset)
+        start = _HEADER.size + offset
+        if first == length:
+            return buf[start : start + length]
+        return bytes(buf[start : start + first]) + bytes(
+            buf[_HEADER.size : _HEADER.size + length - first]
+        )
+
+    def put(self, item):
+        """Put item on the queue, waiting while the ring buffer is full."""
+        kind, data = encode_item(item)
+        length = _ITEM_HEADER.size + len(data)
+        if length > self.size:
+            if kind == _REPLY and len(item[1]) > 1:
+                half = len(item[1]) // 2
+                self.put((item[0], item[1][:half]))
+                self.put((item[0], item[1][half:]))
+                return
+            raise ValueError("item too big for shared memory queue")
+        with self.put_lock:
+            while True:
+                written, read = self._positions()
+                if self.size - (written - read) >= length:
+                    break
+                time.sleep(FULL_BUFFER_WAIT)
+            self._copy_in(written, _ITEM_HEADER.pack(len(data), kind))
+            self._copy_in(written + _ITEM_HEADER.size, data)
+            struct.pack_into("=Q", self.memory.buf, 0, written + length)
+        self.items.release()
+
+    def get(self, block=True, timeout=None):
+        """Remove and return an item from the queue.
+
+        queue.Empty is raised if no item arrives within timeout seconds, or
+        at once if block is False.
+
+        """
+        if not self.items.acquire(block, timeout):
+            raise queue.Empty
+        read = self._positions()[1]
+        length, kind = _ITEM_HEADER.unpack(
+            self._copy_out(read, _ITEM_HEADER.size)
+        )
+        item = decode_item(
+            kind, self._copy_out(read + _ITEM_HEADER.size, length)
+        )
+        struct.pack_into(
+            "=Q", self.memory.buf, 8, read + _ITEM_HEADER.size + length
+        )
+        return item
+
+    def get_nowait(self):
+        """Remove and return an item if one is available at once."""
+        return self.get(block=False)
+
+    def unlink(self):
+        """Destroy the shared memory when all processes have closed it."""
+        self.memory.unlink()
@@ -4,6 +4,10 @@
 
 # The start point for this module is the sample code in Python 3.6.1 module
 # documentation for asyncio at 18.5.4.3.1. TCP echo client protocol.
+#
+# A blocking socket has since replaced asyncio because one request at a time
+# is sent and importing asyncio was most of the start-up time of this module,
+# which is run in a new process for each remote engine.
 
 """Send positions to a remote chess engine for analysis.
 
@@ -32,9 +36,14 @@ using 'setoption name MultiPV value <n>' where <n> is an integer.
 Each 'go' command must be preceded by a 'setoption' command which sets the
 'MultiPV' option.
 
-Each 'go' command must be preceded by a 'position' command.
+Each 'go' command must be preceded by a 'position' command, which must be like
+'position startpos' or 'position fen <fen>' optionally followed by 'moves'
+and the moves to play.
 
-The 'go' command must be like 'go depth <n>' where <n> is an integer.
+The 'go' command must include at least one of 'depth <n>', 'nodes <n>', and
+'movetime <n>', where <n> is a positive integer, so the search ends.  These
+may be combined with 'searchmoves' and the moves to search.  No other 'go'
+sub-commands are allowed.
 
 UCI chess engines expect chess user interface programs to issue 'ucinewgame',
 'isready', and 'uci' commands to control it's operation.  There are other such
@@ -53,18 +62,64 @@ be playing games of chess where retaining the hash tables between each move is
 an advantage.  When analysing arbitrary positions it seems best to analyse each
 position starting with a clean hash table.)
 
+The exception is when consecutive positions come from the same game.  A
+session identity given in the engine URL, '//<host>:<port>?name=<engine
+name>&session=<identity>', is sent with each batch so the server can route the
+batches to the same engine and retain the hash tables between them.
+
+A 'stream=all' or 'stream=pv' item in the engine URL asks the server to send
+lines from the engine as they arrive during a search, all of them or only the
+'info' lines with a 'pv' plus the 'bestmove', and these are written to stdout
+straight away.
+
+A 'priority=batch' item in the engine URL tells the server the batches may be
+pre-empted by requests from interactive users, which are re-queued and done
+again later.
+
+Several servers running the same engine may be listed in the engine URL,
+'//<host>:<port>,<host>:<port>?name=<engine name>'.  Each batch is sent to
+the server with the lowest recent latency which has not failed recently, and
+is sent to the next server if the connection fails or the server is busy.
+
+A 'keepalive=yes' item in the engine URL keeps connections to the server open
+between batches, so consecutive batches do not wait for a new connection.
+Connections idle for a while are checked with an 'isready' request before
+reuse, and a batch which fails on a reused connection is sent again on a new
+connection.
+
+A 'deadline=<n>' item in the engine URL asks the server to complete each
+batch within <n> milliseconds, cutting the search short if necessary.
+
+A 'compress=<n>' item in the engine URL tells the server replies may be sent
+as zlib compressed frames when a frame is at least <n> bytes long.  This is
+worth doing over slow links when MultiPV replies with long PVs are large.
+
+A 'trace=<file>' item in the engine URL gives each batch a trace identity,
+and the time taken to get the first reply and the whole reply is appended to
+<file>.  Servers with a trace file record the steps of traced batches in
+their file.  See the tracing module.
+
 """
 import sys
-from urllib.parse import urlsplit
-import asyncio
-from ast import literal_eval
-import tkinter.messagebox
+from urllib.parse import urlsplit, parse_qs
+import socket
+import time
 
 from .engine import (
     CommandsToEngine,
     ReservedOptionNames,
-    GoSubCommands,
-    PositionSubCommands,
+)
+from .fen import fen_from_position_command
+from .tcp_protocol import (
+    go_limits,
+    encode_request,
+    iter_reply,
+    FrameDecoder,
+    reply_lines,
+    END_OF_REPLY,
+    ReplyKeys,
+    RequestKeys,
+    URLQueryKeys,
 )
 
 DEFAULT_UCI_ENGINE_LISTEN_PORT = "11111"
@@ -72,103 +127,167 @@ DEFAULT_UCI_ENGINE_HOSTNAME = "127.0.0.1"
 GO_COMMAND_SEQUENCE = [CommandsToEngine.setoption, CommandsToEngine.position]
 
 
-class UCIClientProtocol(asyncio.Protocol):
-    """Implement communication with chess engine processes over TCP."""
+class PooledConnection:
+    """A connection to a server which is kept open for more requests."""
+
+    def __init__(self, host, port, timeout=None):
+        """Connect to server at host:port."""
+        self.sock = socket.create_connection((host, port), timeout=timeout)
+        self.decoder = FrameDecoder()
+        self.last_used = time.monotonic()
 
-    def __init__(self, message, loop):
-        """Initialize instance to send message and receive reply."""
-        self.message = message
-        self.loop = loop
-        self.data_from_engine = []
+    def iter_reply(self, message):
+        """Yield reply items to request message as they arrive."""
+        self.sock.sendall((message + "\n").encode())
+        while True:
+            data = self.sock.recv(65536)
+            if not data:
+                raise ConnectionResetError("Connection closed by server")
+            for item in self.decoder.feed(data):
+                if item is END_OF_REPLY:
+                    self.last_used = time.monotonic()
+                    return
+                yield item
 
-    def connection_made(self, transport):
-        """Write message on transport after connection made."""
-        transport.write(self.message.encode())
+    def is_healthy(self):
+        """Return True if the server replies to an 'isready' request."""
         try:
-            transport.write_eof()
-        except ConnectionResetError:
-            pass
-
-    def data_received(self, data):
-        """Collect response to message."""
-        self.data_from_engine.append(data)
-
-    def connection_lost(self, exc):
-        """Write response to stdout after connection finished."""
-        self.loop.stop()
-        response = b"".join(self.data_from_engine).decode().strip()
-        if response:
-            response = literal_eval(response)
-            for text in response[-1]:
-                sys.stdout.write(text + "\n")
-                sys.stdout.flush()
+            for _ in self.iter_reply(
+                encode_request([CommandsToEngine.isready])
+            ):
+                pass
+        except OSError:
+            return False
+        return True
 
+    def close(self):
+        """Close the connection."""
+        self.sock.close()
 
-def run_connection(host, port, message):
-    """Connect to UCI chess engine on host:port to commands in message."""
-    try:
-        loop = asyncio.get_event_loop()
-        coro = loop.create_connection(
-            lambda: UCIClientProtocol(message, loop), host, port
-        )
-        loop.run_until_complete(coro)
-        loop.run_forever()
-    except Exception as exc:
-        rep = tkinter.Tk()
-        rep.wm_title("UCI TCP Client")
-        label = tkinter.Label(
-            master=rep,
-            wraplength="3i",
-            justify=tkinter.LEFT,
-            text="".join(
-                (
-                    "\nA problem has occurred with the UCI ",
-                    "chess engine:\n\n",
-                    sys.argv[1],
-                    "\n\nNo more analysis will be done by ",
-                    "this engine until the quit and start ",
-                    "actions have been done.\n\nThe reported ",
-                    "exception is:\n\n",
-                    str(exc),
-                    "\n",
-                )
-            ),
-        )
-        label.pack()
-        rep.mainloop()
-        del rep
 
+class ConnectionPool:
+    """Keep connections to servers open for reuse by later requests.
 
-if __name__ == "__main__":
+    Connections idle for more than idle_timeout seconds are closed rather
+    than reused, and connections idle for more than health_check_interval
+    seconds are checked with an 'isready' request before reuse.  A request
+    which fails on a reused connection before any reply arrives is sent again
+    on a new connection, because the server may have closed the connection
+    while it was idle.
 
-    url = urlsplit(sys.argv[1])
-    if url.port or url.hostname:
-        if url.hostname:
-            hostname = url.hostname
-        else:
-            hostname = DEFAULT_UCI_ENGINE_HOSTNAME
-        if url.port:
-            port = url.port
-        else:
-            port = DEFAULT_UCI_ENGINE_LISTEN_PORT
+    """
 
-    commands_to_engine = [" ".join((CommandsToEngine.start, sys.argv[1]))]
-    while True:
-        data = sys.stdin.readline()
-        if not data:
-            break
+    def __init__(
+        self, idle_timeout=240, health_check_interval=10, timeout=None
+    ):
+        """Initialise pool with no connections."""
+        # Imported here so a client without keepalive does not import
+        # multiprocessing.  Use the multiprocessing API for threading.
+        from multiprocessing import dummy
+
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.timeout = timeout
+        self.connections = {}
+        self._lock = dummy.Lock()
+
+    def _checkout(self, host, port):
+        """Return (connection, reused) for server at host:port."""
+        while True:
+            with self._lock:
+                idle = self.connections.get((host, port))
+                if not idle:
+                    break
+                connection = idle.pop()
+            idle_time = time.monotonic() - connection.last_used
+            if idle_time > self.idle_timeout:
+                connection.close()
+            elif (
+                idle_time > self.health_check_interval
+                and not connection.is_healthy()
+            ):
+                connection.close()
+            else:
+                return connection, True
+        return PooledConnection(host, port, timeout=self.timeout), False
+
+    def _checkin(self, host, port, connection):
+        """Keep connection to server at host:port for reuse."""
+        with self._lock:
+            self.connections.setdefault((host, port), []).append(connection)
+
+    def iter_reply(self, host, port, message):
+        """Yield reply items from server at host:port to request message.
+
+        The connection is closed, not reused, if the caller abandons the
+        reply before it is complete.
+
+        """
+        connection, reused = self._checkout(host, port)
+        try:
+            replied = False
+            try:
+                for item in connection.iter_reply(message):
+                    replied = True
+                    yield item
+            except OSError:
+                connection.close()
+                if replied or not reused:
+                    raise
+                connection = PooledConnection(host, port, timeout=self.timeout)
+                yield from connection.iter_reply(message)
+        except BaseException:
+            connection.close()
+            raise
+        self._checkin(host, port, connection)
+
+    def send_request(self, host, port, message):
+        """Return list of reply items from server at host:port to message."""
+        return list(self.iter_reply(host, port, message))
+
+    def close(self):
+        """Close all the idle connections."""
+        with self._lock:
+            for idle in self.connections.values():
+                for connection in idle:
+                    connection.close()
+            self.connections.clear()
+
+
+class CommandBatcher:
+    """Collect commands from a user interface into batches for a server.
+
+    Commands which the server does not allow are dropped, and commands which
+    cannot form a valid batch with those before them discard the batch.
+
+    """
+
+    def __init__(self, url):
+        """Initialise for engine at url with the 'start' command pending."""
+        self.commands_to_engine = [" ".join((CommandsToEngine.start, url))]
+
+    def add(self, data):
+        """Return batch of commands completed by data, or None if none.
+
+        data is a line of text from the user interface.
+
+        """
+        commands_to_engine = self.commands_to_engine
         command_data = data.split(maxsplit=4)
+        if not command_data:
+            return None
         command = command_data[0]
+        batch = None
         if command == CommandsToEngine.isready:
             if len(commands_to_engine) > 1:
                 commands_to_engine.clear()
-                continue
+                return None
             if len(commands_to_engine) == 1:
                 if commands_to_engine[0] != CommandsToEngine.ucinewgame:
                     commands_to_engine.clear()
-                    continue
+                    return None
             commands_to_engine.append(data.strip())
-            run_connection(hostname, port, repr(commands_to_engine))
+            batch = commands_to_engine[:]
             commands_to_engine.clear()
         elif command == CommandsToEngine.ucinewgame:
             commands_to_engine.append(data.strip())
@@ -177,9 +296,7 @@ if __name__ == "__main__":
                 if command_data[2] == ReservedOptionNames.MultiPV:
                     commands_to_engine.append(data.strip())
         elif command == CommandsToEngine.go:
-            if len(command_data) != 3:
-                pass
-            elif command_data[1] != GoSubCommands.depth:
+            if go_limits(data) is None:
                 pass
             elif [
                 c.split()[0] for c in commands_to_engine
@@ -187,20 +304,381 @@ if __name__ == "__main__":
                 pass
             else:
                 commands_to_engine.append(data.strip())
-                run_connection(hostname, port, repr(commands_to_engine))
+                batch = commands_to_engine[:]
             commands_to_engine.clear()
         elif command == CommandsToEngine.position:
-            if len(command_data) < 2:
-                commands_to_engine.clear()
-            elif command_data[1] != PositionSubCommands.fen:
-                commands_to_engine.clear()
-            elif PositionSubCommands.moves in command_data[-1]:
+            if fen_from_position_command(data) is None:
                 commands_to_engine.clear()
             else:
                 commands_to_engine.append(data.strip())
         elif command == CommandsToEngine.uci:
             commands_to_engine.append(data.strip())
-            run_connection(hostname, port, repr(commands_to_engine))
+            batch = commands_to_engine[:]
             commands_to_engine.clear()
         else:
             commands_to_engine.clear()
+        return batch
+
+
+class ServerState:
+    """Latency and failures of requests to a server."""
+
+    # Weight of latest latency in the average used to choose a server.
+    latency_smoothing = 0.3
+
+    def __init__(self, host, port):
+        """Initialise state for server at host:port with no requests."""
+        self.host = host
+        self.port = port
+        self.latency = 0
+        self.errors = 0
+        self.busy = 0
+        self.unavailable_until = 0
+
+    def note_latency(self, seconds):
+        """Note seconds taken to receive the first reply to a request."""
+        if self.latency:
+            self.latency += self.latency_smoothing * (seconds - self.latency)
+        else:
+            self.latency = seconds
+        self.unavailable_until = 0
+
+    def note_error(self, retry_interval):
+        """Note failed request and avoid the server for a while."""
+        self.errors += 1
+        self.unavailable_until = time.monotonic() + retry_interval
+
+    def note_busy(self, retry_after):
+        """Note busy reply and avoid the server for retry_after seconds."""
+        self.busy += 1
+        self.unavailable_until = time.monotonic() + retry_after
+
+
+class ServerList:
+    """Send requests to the best of several servers running the same engine.
+
+    Servers are tried in order of their recent latency, the time to receive
+    the first reply item, except servers which failed or were busy recently
+    are tried last.  A request goes to the next server if the connection
+    fails or the server sends a busy reply before any other reply.  Servers
+    which have failed are avoided for retry_interval seconds.
+
+    Connections are taken from pool if it is not None.
+
+    """
+
+    def __init__(self, addresses, pool=None, retry_interval=30):
+        """Initialise for servers at (host, port) items in addresses."""
+        self.servers = [ServerState(host, port) for host, port in addresses]
+        self.pool = pool
+        self.retry_interval = retry_interval
+
+    def ranked(self):
+        """Return servers in the order they should be tried."""
+        now = time.monotonic()
+        return sorted(
+            self.servers,
+            key=lambda server: (
+                server.unavailable_until > now,
+                server.latency,
+            ),
+        )
+
+    def iter_reply(self, message):
+        """Yield reply items to request message from the best server.
+
+        The busy reply from the last server tried is yielded if all the
+        servers are busy, and the exception from the last server tried is
+        raised if none can be used.  A server which closes the connection
+        without replying has failed, and ConnectionError is raised if it is
+        the last server tried.
+
+        """
+        servers = self.ranked()
+        for server in servers:
+            start = time.monotonic()
+            if self.pool is None:
+                reply = iter_reply(server.host, server.port, message)
+            else:
+                reply = self.pool.iter_reply(server.host, server.port, message)
+            try:
+                first = next(reply, None)
+            except OSError:
+                server.note_error(self.retry_interval)
+                if server is servers[-1]:
+                    raise
+                continue
+            if first is None:
+
+                # The server closed the connection without replying.
+                reply.close()
+                server.note_error(self.retry_interval)
+                if server is servers[-1]:
+                    raise ConnectionError(
+                        "".join(
+                            (
+                                "No reply from server at ",
+                                str(server.host),
+                                ":",
+                                str(server.port),
+                            )
+                        )
+                    )
+                continue
+            retry_after = busy_retry_after(first)
+            if retry_after is not None:
+                server.note_busy(retry_after / 1000)
+                if server is not servers[-1]:
+                    reply.close()
+                    continue
+            else:
+                server.note_latency(time.monotonic() - start)
+            yield first
+            try:
+                yield from reply
+            except OSError:
+                server.note_error(self.retry_interval)
+                raise
+            return
+
+
+def busy_retry_after(item):
+    """Return milliseconds to wait if item is a busy reply, or None."""
+    if isinstance(item, dict):
+        return item.get(ReplyKeys.busy)
+    lines = reply_lines(item)
+    if lines and lines[0].startswith("info string busy, retry after "):
+        return int(lines[0].split()[-2])
+    return None
+
+
+def server_addresses(url):
+    """Return list of (hostname, port) of servers in url, a urlsplit() result.
+
+    The servers are separated by ',' in the network location, and defaults
+    are used for absent items.  The list is empty if there is no network
+    location.
+
+    """
+    addresses = []
+    for netloc in url.netloc.split(","):
+        if not netloc:
+            continue
+        server = urlsplit("//" + netloc)
+        addresses.append(
+            (
+                server.hostname or DEFAULT_UCI_ENGINE_HOSTNAME,
+                server.port or DEFAULT_UCI_ENGINE_LISTEN_PORT,
+            )
+        )
+    return addresses
+
+
+def request_options(url):
+    """Return (options, ignored) from query in url, a urlsplit() result.
+
+    options is a dict of request options, where options absent from the
+    query are None.  The 'compress' and 'deadline' options must be integers
+    and are left out of options otherwise.  ignored is a list of the
+    (<url key>, <value>) items left out, which the caller reports.
+
+    """
+    query = parse_qs(url.query)
+    options = {
+        RequestKeys.session: query.get(URLQueryKeys.session, [None])[0],
+        RequestKeys.stream: query.get(URLQueryKeys.stream, [None])[0],
+        RequestKeys.priority: query.get(URLQueryKeys.priority, [None])[0],
+    }
+    ignored = []
+    for url_key, request_key in (
+        (URLQueryKeys.compress, RequestKeys.compress),
+        (URLQueryKeys.deadline, RequestKeys.deadline),
+    ):
+        if url_key not in query:
+            continue
+        value = query[url_key][0]
+        try:
+            options[request_key] = int(value)
+        except ValueError:
+            ignored.append((url_key, value))
+    return options, ignored
+
+
+def ignored_options_text(ignored):
+    """Return report of ignored, a list from request_options()."""
+    return "".join(
+        "".join(
+            (
+                "The '",
+                url_key,
+                "' value in the UCI chess engine url is not an integer: ",
+                value,
+                "\nThe option is ignored and analysis continues.\n",
+            )
+        )
+        for url_key, value in ignored
+    )
+
+
+def trace_file(url):
+    """Return trace file in query in url, a urlsplit() result, or None."""
+    return parse_qs(url.query).get(URLQueryKeys.trace, [None])[0]
+
+
+def is_keepalive(url):
+    """Return True if query in url, a urlsplit() result, asks for keepalive."""
+    return parse_qs(url.query).get(URLQueryKeys.keepalive, [None])[0] == "yes"
+
+
+def write_reply(reply, trace=None):
+    """Write lines in items from iterator reply to stdout.
+
+    trace is None, or (Tracer, trace identity) to record the time taken to
+    get the first item and all the items.
+
+    """
+    start = time.time()
+    first = True
+    for item in reply:
+        if first and trace:
+            trace[0].record(trace[1], "first_reply", start)
+        first = False
+        write_reply_items([item])
+    if trace:
+        trace[0].record(trace[1], "request", start)
+
+
+def write_reply_items(items):
+    """Write lines from engine in reply items to stdout."""
+    if items:
+        for item in items:
+            for text in reply_lines(item):
+                sys.stdout.write(text + "\n")
+        sys.stdout.flush()
+
+
+def run_connection(host, port, message, trace=None):
+    """Connect to UCI chess engine on host:port to commands in message.
+
+    trace is passed to write_reply().
+
+    """
+    try:
+        write_reply(iter_reply(host, port, message), trace=trace)
+    except Exception as exc:
+        report_problem(exc)
+
+
+def run_server_list_connection(servers, message, trace=None):
+    """Send message to best UCI chess engine server in ServerList servers.
+
+    trace is passed to write_reply().
+
+    """
+    try:
+        write_reply(servers.iter_reply(message), trace=trace)
+    except Exception as exc:
+        report_problem(exc)
+
+
+def report_problem(exc):
+    """Report exc from UCI chess engine in sys.argv[1] in a dialogue."""
+    show_report(
+        "".join(
+            (
+                "\nA problem has occurred with the UCI ",
+                "chess engine:\n\n",
+                sys.argv[1],
+                "\n\nNo more analysis will be done by ",
+                "this engine until the quit and start ",
+                "actions have been done.\n\nThe reported ",
+                "exception is:\n\n",
+                str(exc),
+                "\n",
+            )
+        )
+    )
+
+
+def show_report(text):
+    """Show text in a dialogue.
+
+    tkinter is imported only when needed, and text is written to stderr if
+    a dialogue cannot be shown, as on hosts without a display or without Tk.
+
+    """
+    try:
+        import tkinter
+    except ImportError:
+        sys.stderr.write(text)
+        return
+    try:
+        rep = tkinter.Tk()
+    except tkinter.TclError:
+        sys.stderr.write(text)
+        return
+    rep.wm_title("UCI TCP Client")
+    label = tkinter.Label(
+        master=rep,
+        wraplength="3i",
+        justify=tkinter.LEFT,
+        text=text,
+    )
+    label.pack()
+    rep.mainloop()
+    del rep
+
+
+if __name__ == "__main__":
+
+    url = urlsplit(sys.argv[1])
+    addresses = server_addresses(url)
+    options, ignored_options = request_options(url)
+    if ignored_options:
+        show_report(
+            "".join(
+                (
+                    "\nA problem has occurred with the UCI ",
+                    "chess engine:\n\n",
+                    sys.argv[1],
+                    "\n\n",
+                    ignored_options_text(ignored_options),
+                )
+            )
+        )
+    pool = ConnectionPool() if is_keepalive(url) else None
+    if pool or len(addresses) > 1:
+        servers = ServerList(addresses, pool=pool)
+    else:
+        servers = None
+    batcher = CommandBatcher(sys.argv[1])
+    trace_path = trace_file(url)
+    if trace_path:
+
+        # Imported here so clients which do not trace start quicker.
+        from .tracing import get_tracer, new_trace_id
+
+        tracer = get_tracer(trace_path, "tcp_client")
+    else:
+        tracer = None
+    while True:
+        data = sys.stdin.readline()
+        if not data:
+            break
+        commands_to_engine = batcher.add(data)
+        if not commands_to_engine:
+            continue
+        if tracer:
+            trace = (tracer, new_trace_id())
+            message = encode_request(
+                commands_to_engine, trace=trace[1], **options
+            )
+        else:
+            trace = None
+            message = encode_request(commands_to_engine, **options)
+        if servers:
+            run_server_list_connection(servers, message, trace=trace)
+        else:
+            run_connection(*addresses[0], message, trace=trace)
+    if pool:
+        pool.close()
@@ -0,0 +1,498 @@
+# tcp_protocol.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Requests and replies exchanged by the tcp_client and tcp_server modules.
+
+A request is the repr() of a list of UCI commands, or the repr() of a dict
+when the client uses features not understood by older servers.  The dict
+holds the list of UCI commands in the 'commands' item and the options in
+other items.
+
+Older servers will fail on a dict request so clients send a list unless an
+option is needed.  A request which is not a non-empty list of commands, or a
+dict holding one, gets the reply to a list request with an 'info string
+invalid request' line and a 'bestmove 0000' line.
+
+A reply is a sequence of frames, each the repr() of a Python literal followed
+by a newline.  The reply to a list request is one (<engine name>, <lines from
+engine>) tuple.  The reply to a dict request is one or more dicts, the last
+of which has the 'final' item True.  The 'stream' option asks for a frame for
+each group of lines from the engine as they arrive during a search, rather
+than a single frame when the search is complete.
+
+A client may keep a connection open for more requests by ending each request
+with a newline.  The server follows each reply on such a connection with an
+end of reply frame, 'None', so the client knows the reply is complete.
+
+A 'deadline' option gives the milliseconds, from receipt of the request, by
+which the reply must be complete.  The server limits the search with a
+'movetime', and sends 'stop' if the engine overruns it.  The final reply
+dict then has a 'depth' item giving the depth reached and a 'depth_reached'
+item saying whether the depth asked for was reached, or None if no depth was
+asked for.
+
+A batch request asks for analysis of a list of positions on one connection.
+The server shares the positions between it's engines and sends the reply for
+each position, tagged by the position's index in the list, as it arrives.
+
+A 'compress' option, the size in bytes of the smallest frame worth
+compressing, tells the server the client accepts compressed frames.  A
+compressed frame is 'z<n>' and a newline followed by <n> bytes of zlib
+compressed data, which decompress to an ordinary frame.  The option makes
+the request a dict, so it must not be used with servers which accept only
+list requests.  Servers which accept dict requests but not compression ignore
+the option and send ordinary frames, which the client still accepts.
+
+A 'trace' option gives an identity used to trace the request through the
+client, server, and engine driver processes.  Processes with a trace file
+record the time spent at each step of the request in the file.
+
+A server with too many requests waiting for an engine replies at once with
+an 'info string busy, retry after <n> ms' line and a 'bestmove 0000' line so
+the user interface is not left waiting for a 'bestmove'.  The reply dict to
+a dict request also has a 'busy' item giving <n>.
+
+"""
+
+import socket
+import zlib
+from ast import literal_eval
+
+from .engine import (
+    CommandsFromEngine,
+    CommandsToEngine,
+    GoSubCommands,
+    ReservedOptionNames,
+    SetoptionSubCommands,
+)
+from .fen import fen_from_position_command, is_uci_move
+
+# The first byte of a compressed frame.  Ordinary frames start with the first
+# character of the repr() of a tuple or dict.
+COMPRESSED_FRAME_MARKER = b"z"
+
+# Frames shorter than this are not worth compressing.
+DEFAULT_COMPRESS_THRESHOLD = 1024
+
+# The 'go' sub-commands which guarantee the search ends.  At least one must be
+# given.
+GO_LIMITS = frozenset(
+    (GoSubCommands.depth, GoSubCommands.nodes, GoSubCommands.movetime)
+)
+
+# The item in the frame which ends a reply on a connection kept open.
+END_OF_REPLY = None
+
+# The zlib default level.  Level 1 is about twice as quick but the frames are
+# about 40% bigger, which costs more than the time saved on slow links.
+COMPRESSION_LEVEL = 6
+
+
+class CommandsToServer:
+    """The names of non-UCI commands sent to tcp_server.
+
+    stats asks for the server's metrics and is the only command in it's
+    request.
+
+    batch asks for analysis of the (fen, depth, multipv) jobs in the 'jobs'
+    option of a dict request and is the only command in it's request.
+
+    """
+
+    stats = "stats"
+    batch = "batch"
+
+
+class RequestKeys:
+    """The names of items in a request dict sent to tcp_server."""
+
+    commands = "commands"
+    session = "session"
+    stream = "stream"
+    priority = "priority"
+    jobs = "jobs"
+    compress = "compress"
+    deadline = "deadline"
+    trace = "trace"
+
+
+class Priorities:
+    """The values of the priority option in a request, most urgent first.
+
+    Requests without a priority are treated as interactive.  An interactive
+    request may pre-empt a batch request's search.
+
+    """
+
+    interactive = "interactive"
+    batch = "batch"
+
+    rank = {interactive: 0, batch: 1}
+
+
+class ReplyKeys:
+    """The names of items in a reply dict sent by tcp_server."""
+
+    name = "name"
+    lines = "lines"
+    final = "final"
+    busy = "busy"
+    index = "index"
+    depth = "depth"
+    depth_reached = "depth_reached"
+
+
+class StreamModes:
+    """The values of the stream option in a request.
+
+    all_ streams every line from the engine and pv streams only 'info'
+    lines with a 'pv'.  Lines which are not 'info' lines are always sent.
+
+    """
+
+    all_ = "all"
+    pv = "pv"
+
+
+class URLQueryKeys:
+    """The names of query items in '//<host>:<port>?name=<engine name>' URLs.
+
+    name identifies the engine and is checked by the server.  Other items are
+    options for the client.
+
+    """
+
+    name = "name"
+    session = "session"
+    stream = "stream"
+    priority = "priority"
+    compress = "compress"
+    keepalive = "keepalive"
+    deadline = "deadline"
+    trace = "trace"
+
+
+def go_commands(fen, depth, multipv=1):
+    """Return the commands to analyse position fen to depth with multipv."""
+    return [
+        "setoption name MultiPV value " + str(multipv),
+        "position fen " + fen,
+        "go depth " + str(depth),
+    ]
+
+
+def multipv_value(command):
+    """Return n in 'setoption name MultiPV value <n>' command, or None."""
+    words = command.split()
+    if len(words) != 5 or not words[-1].isdigit():
+        return None
+    if words[:4] != [
+        CommandsToEngine.setoption,
+        SetoptionSubCommands.name,
+        ReservedOptionNames.MultiPV,
+        SetoptionSubCommands.value,
+    ]:
+        return None
+    return int(words[-1])
+
+
+def go_limits(command):
+    """Return dict of limits in 'go' command if the search must end.
+
+    The limits are the values of the 'depth', 'nodes', and 'movetime'
+    sub-commands, at least one of which must be given.  The only other
+    sub-command allowed is 'searchmoves' followed by moves.  None is returned
+    if command is not like this.
+
+    """
+    words = command.split()
+    if not words or words[0] != CommandsToEngine.go:
+        return None
+    limits = {}
+    index = 1
+    while index < len(words):
+        word = words[index]
+        if word in GO_LIMITS:
+            if word in limits or index + 1 == len(words):
+                return None
+            value = words[index + 1]
+            if not value.isdigit() or int(value) < 1:
+                return None
+            limits[word] = int(value)
+            index += 2
+        elif word == GoSubCommands.searchmoves:
+            index += 1
+            start = index
+            while index < len(words) and is_uci_move(words[index]):
+                index += 1
+            if index == start:
+                return None
+        else:
+            return None
+    if not limits:
+        return None
+    return limits
+
+
+def is_go_block(commands):
+    """Return True if commands are MultiPV, position, and bounded go.
+
+    This is the only form of 'go' block served, because the search must
+    end and the final command forces a reply from the engine.
+
+    """
+    if len(commands) != 3:
+        return False
+    setoption, position, go = commands
+    return (
+        multipv_value(setoption) is not None
+        and fen_from_position_command(position) is not None
+        and go_limits(go) is not None
+    )
+
+
+def analysis_request(commands):
+    """Return (fen, depth, multipv) if commands ask for search to a depth.
+
+    None is returned for other commands, including searches limited by
+    'nodes', 'movetime', or 'searchmoves' because their analysis is not
+    comparable with searches to a depth.
+
+    """
+    if not is_go_block(commands):
+        return None
+    setoption, position, go = commands
+    limits = go_limits(go)
+    if len(go.split()) != 3 or GoSubCommands.depth not in limits:
+        return None
+    return (
+        fen_from_position_command(position),
+        limits[GoSubCommands.depth],
+        multipv_value(setoption),
+    )
+
+
+def encode_batch_request(jobs, **options):
+    """Return request message for batch of (fen, depth, multipv) jobs."""
+    return encode_request(
+        [CommandsToServer.batch], jobs=[tuple(job) for job in jobs], **options
+    )
+
+
+def encode_request(commands, **options):
+    """Return request message for commands and options not None."""
+    options = {k: v for k, v in options.items() if v is not None}
+    if not options:
+        return repr(commands)
+    options[RequestKeys.commands] = commands
+    return repr(options)
+
+
+def decode_request(message):
+    """Return (commands, options) from request message, or None if invalid.
+
+    options is a dict which is empty if message is the repr() of a list.
+    None is returned unless commands is a non-empty list of strings.
+
+    """
+    try:
+        request = literal_eval(message)
+    except (ValueError, TypeError, SyntaxError, MemoryError, RecursionError):
+        return None
+    if isinstance(request, dict):
+        commands = request.pop(RequestKeys.commands, None)
+        options = request
+    else:
+        commands = request
+        options = {}
+    if not isinstance(commands, (list, tuple)) or not commands:
+        return None
+    if not all(isinstance(command, str) for command in commands):
+        return None
+    return commands, options
+
+
+def encode_frame(item):
+    """Return bytes to send item, a Python literal, as a frame."""
+    return (repr(item) + "\n").encode()
+
+
+def decode_frame(frame):
+    """Return Python literal in frame, bytes without the trailing newline."""
+    return literal_eval(frame.decode())
+
+
+def compress_frame(frame, threshold):
+    """Return frame compressed if threshold is not None and frame is large.
+
+    The frame is returned unchanged if it is shorter than threshold or if
+    compression would not make it smaller.
+
+    """
+    if threshold is None or len(frame) < threshold:
+        return frame
+    data = zlib.compress(frame, COMPRESSION_LEVEL)
+    header = COMPRESSED_FRAME_MARKER + str(len(data)).encode() + b"\n"
+    if len(header) + len(data) >= len(frame):
+        return frame
+    return header + data
+
+
+class FrameDecoder:
+    """Split data received into frames and return the items in them.
+
+    Compressed and ordinary frames are accepted.
+
+    """
+
+    def __init__(self):
+        """Initialise with no data received."""
+        self.data = b""
+
+    def feed(self, data):
+        """Return list of items in frames completed by data."""
+        self.data += data
+        items = []
+        while True:
+            end = self.data.find(b"\n")
+            if end < 0:
+                break
+            if not self.data.startswith(COMPRESSED_FRAME_MARKER):
+                frame = self.data[:end]
+                self.data = self.data[end + 1 :]
+                if frame.strip():
+                    items.append(decode_frame(frame))
+                continue
+            start = end + 1
+            end = start + int(self.data[1 : start - 1])
+            if len(self.data) < end:
+                break
+            frame = zlib.decompress(self.data[start:end])
+            self.data = self.data[end:]
+            items.append(decode_frame(frame.rstrip(b"\n")))
+        return items
+
+    def close(self):
+        """Return list of items in data after the last newline received."""
+        data = self.data
+        self.data = b""
+        if data.strip() and not data.startswith(COMPRESSED_FRAME_MARKER):
+            return [decode_frame(data)]
+        return []
+
+
+def reply_item(engine_name, lines, options, final=True, **items):
+    """Return reply to request with options for lines from engine_name.
+
+    A tuple is returned for list requests, where options is empty, and a
+    dict including items otherwise.
+
+    """
+    if not options:
+        return (engine_name, lines)
+    item = {
+        ReplyKeys.name: engine_name,
+        ReplyKeys.lines: lines,
+        ReplyKeys.final: final,
+    }
+    item.update(items)
+    return item
+
+
+def busy_reply_item(engine_name, retry_after, options):
+    """Return busy reply to request with options asking retry after ms."""
+    item = reply_item(
+        engine_name,
+        [
+            "info string busy, retry after " + str(retry_after) + " ms",
+            "bestmove 0000",
+        ],
+        options,
+    )
+    if options:
+        item[ReplyKeys.busy] = retry_after
+    return item
+
+
+def failure_lines(commands, text):
+    """Return lines ending commands whose request failed with problem text.
+
+    An 'info string' line reporting text is followed by the reply awaited
+    for the last command, if any, so the user interface is not left
+    waiting.
+
+    """
+    lines = ["info string " + " ".join(text.split())]
+    last = commands[-1].split(maxsplit=1)[:1] if commands else []
+    if last == [CommandsToEngine.go]:
+        lines.append(CommandsFromEngine.bestmove + " 0000")
+    elif last == [CommandsToEngine.isready]:
+        lines.append(CommandsFromEngine.readyok)
+    elif last == [CommandsToEngine.uci]:
+        lines.append(CommandsFromEngine.uciok)
+    return lines
+
+
+def reply_lines(item):
+    """Return the lines from the engine in reply item, a tuple or dict."""
+    if isinstance(item, dict):
+        return item[ReplyKeys.lines]
+    return item[-1]
+
+
+def stream_lines(lines, mode):
+    """Return lines to be sent in stream mode.
+
+    'info' lines without a 'pv' are dropped when mode is 'pv'.
+
+    """
+    if mode != StreamModes.pv:
+        return lines
+    return [
+        line
+        for line in lines
+        if not line.startswith("info ") or " pv " in line
+    ]
+
+
+def iter_reply(host, port, message, timeout=None):
+    """Yield reply items from server at host:port to message as they arrive.
+
+    The connection is closed after the reply.
+
+    """
+    with socket.create_connection((host, port), timeout=timeout) as sock:
+        sock.sendall(message.encode())
+        sock.shutdown(socket.SHUT_WR)
+        decoder = FrameDecoder()
+        while True:
+            chunk = sock.recv(65536)
+            if not chunk:
+                break
+            yield from decoder.feed(chunk)
+        yield from decoder.close()
+
+
+def send_request(host, port, message, timeout=None):
+    """Return list of reply items from server at host:port to message.
+
+    This is for tools which do not need the reply as it arrives.
+
+    """
+    return list(iter_reply(host, port, message, timeout=timeout))
+
+
+def split_server_options(argv):
+    """Return (options, arguments) from argv, command line less program name.
+
+    options is a dict of the leading '--<name>=<value>' items in argv with
+    '-' in <name> replaced by '_', and arguments is the rest of argv.
+
+    """
+    options = {}
+    arguments = list(argv)
+    while arguments and arguments[0].startswith("--"):
+        name, value = arguments.pop(0)[2:].partition("=")[::2]
+        options[name.replace("-", "_")] = value
+    return options, arguments
@@ -11,30 +11,121 @@ The chess engine must support the Universal Chess Interface (UCI).
 
 This server is intended for analysing positions rather than playing games.
 
+The server clears the hash tables before each 'go' command unless the client
+tags it's requests with a session identity.  Consecutive requests in a session
+are routed to the same engine, and the 'ucinewgame' and 'Clear Hash' commands
+are not done while the session is active.  A session is active until another
+session uses the engine, or until no request has been received in the session
+for 'session timeout' seconds.  This is intended for analysing consecutive
+positions from a game.
+
+A client can ask for the lines from the engine to be streamed as they arrive
+during a search, optionally restricted to 'info' lines with a 'pv', rather
+than sent in a single reply when the search is complete.
+
 """
 
 import sys
 import asyncio
+import socket
 import multiprocessing
+from multiprocessing import dummy
 import os
-from ast import literal_eval
+import shlex
+import time
+import heapq
+import itertools
+import functools
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit, parse_qs
 
 from .uci_driver import UCIDriver
 from .engine import (
     CommandsToEngine,
     ReservedOptionNames,
     CommandsFromEngine,
+    GoSubCommands,
+    InfoParameters,
     SetoptionSubCommands,
 )
+from .analysis_cache import AnalysisCache
+from .analysis_store import AnalysisStore
+from .tracing import get_tracer, trace_command, is_trace_command
+from .shared_memory_queue import SharedMemoryQueue, shared_memory
+from .fen import canonical_fen, fen_after_move
+from .metrics import (
+    Histogram,
+    RateMeter,
+    LATENCY_BUCKETS,
+    SIZE_BUCKETS,
+    DEPTH_BUCKETS,
+    prometheus_text,
+)
+from .tcp_protocol import (
+    analysis_request,
+    is_go_block,
+    go_limits,
+    compress_frame,
+    decode_request,
+    END_OF_REPLY,
+    encode_frame,
+    go_commands,
+    reply_item,
+    busy_reply_item,
+    stream_lines,
+    split_server_options,
+    CommandsToServer,
+    Priorities,
+    ReplyKeys,
+    RequestKeys,
+    URLQueryKeys,
+)
 
 UCI_ENGINE_LISTEN_HOSTNAME = "0.0.0.0"
+METRICS_LISTEN_HOSTNAME = "127.0.0.1"
+
+# Weight of latest search time in the average used to estimate retry times.
+SEARCH_TIME_SMOOTHING = 0.2
+
+# Speculative searches yield to any request.
+SPECULATION_PRIORITY = max(Priorities.rank.values()) + 1
+
+# The size of the analysis cache if speculation or an analysis store is on
+# but cache size not set.
+SPECULATION_CACHE_SIZE = 1000
+
+# Seconds after a request's deadline when 'stop' is sent to an engine which
+# has not ended the search limited by 'movetime'.
+DEADLINE_STOP_GRACE = 0.1
+
+# Transports between the server and it's run_driver processes.
+QUEUE_TRANSPORT = "queue"
+SHARED_MEMORY_TRANSPORT = "shared-memory"
+
+# Size in bytes of the shared memory ring buffer for commands to an engine.
+COMMAND_BUFFER_SIZE = 2**20
+
+# Seconds the server waits for another process' write to the analysis store
+# before treating the access as failed.
+STORE_LOCK_TIMEOUT = 0.1
+
+# Order of requests with same priority waiting for an engine.
+_waiter_sequence = itertools.count()
+
+# Implicit sessions of batches are (BATCH_SESSION, <n>), unlike the string
+# sessions named by clients.
+BATCH_SESSION = "batch"
+_batch_sequence = itertools.count()
 
 
 # This side of "if __name__ == '__main__'" so multiprocessing.Process() target
 # reference works on Microsoft Windows.
-def run_driver(to_driver_queue, to_ui_queue, path, args, ui_name):
+def run_driver(
+    to_driver_queue, to_ui_queue, path, args, ui_name, stream_interval=None
+):
     """Start chess engine and enter loop sending queued requests to engine."""
-    driver = UCIDriver(to_ui_queue, ui_name)
+    driver = UCIDriver(to_ui_queue, ui_name, stream_interval=stream_interval)
     try:
         driver.start_engine(path, args)
         to_driver_queue.put(CommandsToEngine.uci)
@@ -50,6 +141,9 @@ def run_driver(to_driver_queue, to_ui_queue, path, args, ui_name):
     try:
         while True:
             command = to_driver_queue.get()
+            if is_trace_command(command):
+                set_driver_trace(driver, *command[1:])
+                continue
             if command == CommandsToEngine.quit_:
                 break
             driver.send_to_engine(command)
@@ -59,45 +153,810 @@ def run_driver(to_driver_queue, to_ui_queue, path, args, ui_name):
     driver.quit_engine()
 
 
-if __name__ == "__main__":
+def set_driver_trace(driver, trace_id, path, sent):
+    """Set trace for driver's next commands from a trace_command() command.
 
-    async def handle_client_uci_commands(reader, writer):
-        """Handle UCI commands received on reader and reply on writer."""
-        data = await reader.read()
-        message = data.decode()
+    The time the command spent on the queue to the driver is recorded.
 
-        commands = literal_eval(message)
-        if commands[-1] == CommandsToEngine.uci:
+    """
+    if trace_id is None:
+        driver.set_trace(None)
+        return
+    get_tracer(path, "run_driver").record(trace_id, "command_queue", sent)
+    driver.set_trace((get_tracer(path, "UCIDriver"), trace_id))
 
-            # Normal action is start engine and issue 'uci' command.
-            # Server does this at startup so check that client is asking for
-            # started engine and return the 'uciok' block sent by the engine
-            # at startup.
-            if commands[0].endswith(engine_name):
-                writer.write(repr(uciok_item).encode())
 
-        elif commands[-1] == CommandsToEngine.isready:
+def search_progress(lines):
+    """Return (depth, nps) from latest 'info' line in lines with a depth.
 
-            # Normal action is prepare for 'setoption'(MultiPV) 'position' and
-            # 'go' commands with 'ucinewgame' and 'clear hash'.
-            # Postpone the 'isready' block until the 'go' block arrives.
-            writer.write(
-                repr((engine_name, [CommandsFromEngine.readyok])).encode()
+    (None, None) is returned if no 'info' line has a depth, and nps is None if
+    the 'info' line has no nps.
+
+    """
+    for line in reversed(lines):
+        if not line.startswith("info ") or " depth " not in line:
+            continue
+        words = line.split()
+        depth = _word_after(words, "depth")
+        if depth is None:
+            continue
+        return depth, _word_after(words, "nps")
+    return None, None
+
+
+def _word_after(words, name):
+    """Return word after first name in words, or None if there is none."""
+    try:
+        return words[words.index(name) + 1]
+    except (ValueError, IndexError):
+        return None
+
+
+def compress_threshold(options):
+    """Return frame size to compress from options or None if not wanted."""
+    threshold = options.get(RequestKeys.compress)
+    if isinstance(threshold, bool) or not isinstance(threshold, int):
+        return None
+    return max(threshold, 0)
+
+
+def batch_job_commands(job):
+    """Return commands for (fen, depth, multipv) job, or None if invalid."""
+    try:
+        fen, depth, multipv = job
+    except (TypeError, ValueError):
+        return None
+    if not isinstance(fen, str) or canonical_fen(fen) is None:
+        return None
+    if not isinstance(depth, int) or not isinstance(multipv, int):
+        return None
+    if depth < 1 or multipv < 1:
+        return None
+    return go_commands(fen, depth, multipv)
+
+
+def request_deadline(options):
+    """Return time.monotonic() deadline in request options, or None.
+
+    The deadline option is milliseconds from receipt of the request.
+
+    """
+    milliseconds = options.get(RequestKeys.deadline)
+    if isinstance(milliseconds, bool):
+        return None
+    if not isinstance(milliseconds, (int, float)):
+        return None
+    return time.monotonic() + milliseconds / 1000
+
+
+def deadline_commands(commands, deadline):
+    """Return commands with 'go' limited by 'movetime' to end by deadline.
+
+    commands is a block accepted by is_go_block() and deadline is a
+    time.monotonic() value.
+
+    """
+    movetime = max(1, int((deadline - time.monotonic()) * 1000))
+    limit = go_limits(commands[-1]).get(GoSubCommands.movetime)
+    if limit is not None and limit <= movetime:
+        return commands
+    words = commands[-1].split()
+    if limit is not None:
+        index = words.index(GoSubCommands.movetime)
+        del words[index : index + 2]
+    words[1:1] = [GoSubCommands.movetime, str(movetime)]
+    return commands[:-1] + [" ".join(words)]
+
+
+def depth_reached_items(deadline, target_depth, depth):
+    """Return reply items saying if search to target_depth reached depth.
+
+    The items are the depth reached and whether it is at least target_depth,
+    None if there is no target depth.  There are no items if deadline is
+    None.
+
+    """
+    if deadline is None:
+        return {}
+    if depth is not None and str(depth).isdigit():
+        depth = int(depth)
+    else:
+        depth = None
+    if target_depth is None:
+        reached = None
+    else:
+        reached = depth is not None and depth >= target_depth
+    return {ReplyKeys.depth: depth, ReplyKeys.depth_reached: reached}
+
+
+def speculative_positions(fen, lines, plies):
+    """Return FENs after up to plies moves of principal variation in lines.
+
+    The principal variation is in the last 'info' line with a 'pv' for the
+    first multipv in lines from the engine's analysis of fen.
+
+    """
+    for line in reversed(lines):
+        words = line.split()
+        if not words or words[0] != CommandsFromEngine.info:
+            continue
+
+        # Free text in an 'info string' line may contain 'pv'.
+        if words[1:2] == [InfoParameters.string]:
+            continue
+        if InfoParameters.pv not in words:
+            continue
+        if _word_after(words, InfoParameters.multipv) not in (None, "1"):
+            continue
+        moves = words[words.index(InfoParameters.pv) + 1 :]
+        break
+    else:
+        return []
+    positions = []
+    for move in moves[:plies]:
+        fen = fen_after_move(fen, move)
+        if fen is None:
+            break
+        positions.append(fen)
+    return positions
+
+
+class EngineProcess:
+    """Run a chess engine in a run_driver process on behalf of UCIServer.
+
+    Replies from the driver process are moved to an asyncio.Queue by a thread
+    so the server's event loop is not blocked waiting for the chess engine.
+
+    Requests wait for the engine in priority order, and a request waiting
+    for the engine in use by a lower priority request pre-empts that request
+    by sending a 'stop' command to the engine.
+
+    Commands and replies pass through multiprocessing.Queue instances unless
+    transport is SHARED_MEMORY_TRANSPORT, when SharedMemoryQueue instances
+    are used instead.
+
+    """
+
+    def __init__(
+        self,
+        program_file_name,
+        args,
+        ui_name,
+        stream_interval=None,
+        transport=QUEUE_TRANSPORT,
+    ):
+        """Initialise to run chess engine program_file_name with args."""
+        self.transport = transport
+        if transport == SHARED_MEMORY_TRANSPORT:
+            self.to_driver_queue = SharedMemoryQueue(COMMAND_BUFFER_SIZE)
+            self.uci_drivers_reply = SharedMemoryQueue()
+        else:
+            self.to_driver_queue = multiprocessing.Queue()
+
+            # Creating this queue raised "OSError: [WinError 535] Pipe
+            # connected" at Python3.3 running under Wine on FreeBSD 10.1.
+            # The OSError stopped happening by wine-2.0_3,1 but get() and
+            # get_nowait() do not wait, or 'not wait', correctly at Python3.5
+            # under Wine, and asyncio is not in Python3.3: so the queue is
+            # not guarded.
+            self.uci_drivers_reply = multiprocessing.Queue()
+        self.driver = multiprocessing.Process(
+            target=run_driver,
+            args=(
+                self.to_driver_queue,
+                self.uci_drivers_reply,
+                program_file_name,
+                args,
+                ui_name,
+                stream_interval,
+            ),
+        )
+        self.replies = None
+        self.loop = None
+        self.waiters = []
+        self.priority = None
+        self.preempted = False
+        self.searching = False
+        self.session = None
+        self.session_time = 0
+
+    def start(self):
+        """Start the driver process and return the reply to 'uci' command."""
+        self.driver.start()
+
+        # If this done here rather than in run_driver() Contol-c is ignored
+        # later.
+        # to_driver_queue.put(CommandsToEngine.uci)
+
+        return self.uci_drivers_reply.get()
+
+    def attach_to_loop(self, loop):
+        """Start thread putting replies from driver on queue for loop."""
+        self.replies = asyncio.Queue()
+        self.loop = loop
+        thread = dummy.Process(target=self._forward_replies, args=(loop,))
+        thread.daemon = True
+        thread.start()
+
+    def _forward_replies(self, loop):
+        """Move replies from driver process to queue in loop."""
+        while True:
+            item = self.uci_drivers_reply.get()
+            loop.call_soon_threadsafe(self.replies.put_nowait, item)
+
+    def put(self, command):
+        """Put command on queue to driver process."""
+        self.to_driver_queue.put(command)
+
+    async def get(self):
+        """Return next reply, less the ui_name, from driver process."""
+        # n, c = await self.replies.get()
+        return (await self.replies.get())[1]
+
+    @property
+    def waiting(self):
+        """Return number of requests waiting for engine."""
+        return len(self.waiters)
+
+    def in_use(self):
+        """Return True if a request is using the engine."""
+        return self.priority is not None
+
+    async def acquire(self, priority, sequence):
+        """Wait until engine is free for request with priority.
+
+        Lower values of priority are more urgent, and requests with the same
+        priority are served in sequence order.  A request using the engine
+        with a less urgent priority is pre-empted.
+
+        """
+        if self.priority is None and not self.waiters:
+            self.priority = priority
+            return
+        future = self.loop.create_future()
+        waiter = (priority, sequence, future)
+        heapq.heappush(self.waiters, waiter)
+        if self.priority is not None and priority < self.priority:
+            self.preempt()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if waiter in self.waiters:
+                self.waiters.remove(waiter)
+                heapq.heapify(self.waiters)
+            elif future.done() and not future.cancelled():
+                self.release()
+            raise
+
+    def release(self):
+        """Give engine to most urgent waiting request, if any."""
+        self.preempted = False
+        while self.waiters:
+            priority, sequence, future = heapq.heappop(self.waiters)
+            if not future.done():
+                self.priority = priority
+                future.set_result(None)
+                return
+        self.priority = None
+
+    def preempt(self):
+        """Stop search for request using engine so it can be re-queued."""
+        if not self.preempted:
+            self.preempted = True
+            self.stop()
+
+    def stop(self):
+        """Send 'stop' to engine if a 'go' command is in progress.
+
+        A 'stop' without a search in progress may be taken by the engine as
+        stopping the next search.
+
+        """
+        if self.searching:
+            self.put(CommandsToEngine.stop)
+
+    def is_session_active(self, session, timeout):
+        """Return True if session is active on this engine."""
+        if session is None or session != self.session:
+            return False
+        return time.monotonic() - self.session_time < timeout
+
+    def quit(self):
+        """Tell driver process to quit."""
+        self.to_driver_queue.put(CommandsToEngine.quit_)
+
+    def terminate(self):
+        """Terminate the driver process."""
+        self.driver.terminate()
+        self.driver.join(10)
+        if self.transport == SHARED_MEMORY_TRANSPORT:
+            self.to_driver_queue.unlink()
+            self.uci_drivers_reply.unlink()
+
+
+class UCIServer:
+    """Capture server process parameters from command line.
+
+    The process running the second and subsequent chess engines will have
+    to override the default listen port.
+
+    The remote hosts allowed to use this server can be restricted by giving
+    a list of hostnames in allowed_callers.  By default any host may use
+    the server.
+
+    More than one instance of the chess engine is run if engines is greater
+    than 1.  session_timeout is the number of seconds a session stays active
+    after it's most recent request.  stream_interval is the minimum number of
+    seconds between passing groups of 'info' lines from the chess engine to
+    clients which ask for a stream of lines during a search.
+
+    Interactive requests are served before batch requests, and pre-empt the
+    search for a batch request if no engine is free.  The pre-empted request
+    is re-queued.
+
+    A request which has to wait for an engine gets an immediate busy reply if
+    max_queue requests are waiting already, and a busy reply if it waits
+    longer than queue_timeout seconds.  max_queue and queue_timeout of None
+    mean no limit.
+
+    Metrics are returned in reply to a 'stats' request, and in Prometheus
+    text format by an HTTP listener on localhost if metrics_port is given.
+
+    If workers is greater than 1, that number of processes, each with
+    engines instances of the chess engine, share the listening port.  The
+    worker attribute is the worker number in each process.
+
+    A connection stays open for more requests if the request ends with a
+    newline, until no request arrives for idle_timeout seconds.
+
+    Analysis of up to cache_size positions is kept for reuse by later
+    requests to the same or smaller depth.  If speculate is greater than 0
+    the positions after up to that many moves of the principal variation in
+    the reply to a request are analysed while an engine is idle, and the
+    analysis kept in the cache.  A request needing the engine stops the
+    speculative search.
+
+    Requests with a trace identity have the time taken by each step
+    recorded in trace_file, by this process and the engine driver
+    processes, if trace_file is not None.
+
+    Commands and replies pass between this process and the engine driver
+    processes on multiprocessing queues, or shared memory ring buffers if
+    transport is SHARED_MEMORY_TRANSPORT.
+
+    If analysis_store is not None it is the path of an AnalysisStore
+    database behind the analysis cache, so analysis is kept when the server
+    is restarted.
+
+    """
+
+    listen_port = 11111
+    allowed_callers = ()
+    engines = 1
+    session_timeout = 600
+    stream_interval = 0.1
+    max_queue = 16
+    queue_timeout = None
+    metrics_port = None
+    workers = 1
+    idle_timeout = 300
+    cache_size = 0
+    speculate = 0
+    trace_file = None
+    transport = QUEUE_TRANSPORT
+    analysis_store = None
+
+    # Requests arrive as a single line, or the whole of the data before EOF.
+    request_size_limit = 2**24
+
+    def __init__(
+        self,
+        listen_port=None,
+        allowed_callers=None,
+        engines=None,
+        session_timeout=None,
+        stream_interval=None,
+        max_queue=None,
+        queue_timeout=None,
+        metrics_port=None,
+        workers=None,
+        idle_timeout=None,
+        cache_size=None,
+        speculate=None,
+        trace_file=None,
+        transport=None,
+        analysis_store=None,
+    ):
+        """Initialise to listen for allowed_callers on listen_port."""
+        if listen_port is not None:
+            self.listen_port = listen_port
+        if isinstance(allowed_callers, str):
+            self.allowed_callers = (allowed_callers,)
+        elif allowed_callers is not None:
+            self.allowed_callers = tuple(allowed_callers)
+        if engines is not None:
+            self.engines = max(1, int(engines))
+        if session_timeout is not None:
+            self.session_timeout = float(session_timeout)
+        if stream_interval is not None:
+            self.stream_interval = float(stream_interval)
+        if max_queue is not None:
+            self.max_queue = int(max_queue) or None
+        if queue_timeout is not None:
+            self.queue_timeout = float(queue_timeout) or None
+        if metrics_port is not None:
+            self.metrics_port = int(metrics_port)
+        if workers is not None:
+            self.workers = max(1, int(workers))
+        if idle_timeout is not None:
+            self.idle_timeout = float(idle_timeout)
+        if cache_size is not None:
+            self.cache_size = int(cache_size)
+        if speculate is not None:
+            self.speculate = int(speculate)
+        if analysis_store is not None:
+            self.analysis_store = analysis_store
+        if (self.speculate or self.analysis_store) and not self.cache_size:
+            self.cache_size = SPECULATION_CACHE_SIZE
+        if self.cache_size:
+            self.analysis_cache = AnalysisCache(self.cache_size)
+        else:
+            self.analysis_cache = None
+        if trace_file is not None:
+            self.trace_file = trace_file
+        self.tracer = get_tracer(self.trace_file, "tcp_server")
+        if transport is not None:
+            if transport not in (QUEUE_TRANSPORT, SHARED_MEMORY_TRANSPORT):
+                raise ValueError("Unknown transport " + transport)
+            if transport == SHARED_MEMORY_TRANSPORT and shared_memory is None:
+                raise ValueError("Shared memory transport not available")
+            self.transport = transport
+        self.speculation_jobs = deque()
+        self.speculation_task = None
+        self.speculations = 0
+        self.speculations_cancelled = 0
+        self.deadlines_missed = 0
+        self.worker = None
+        self.engine_name = None
+        self.uciok_item = None
+        self.engine_processes = []
+        self.requests = 0
+        self.connections = 0
+        self.connections_open = 0
+        self.requests_rejected = 0
+        self.requests_timed_out = 0
+        self.requests_preempting = 0
+        self.requests_preempted = 0
+        self.frames_compressed = 0
+        self.compression_saved_bytes = 0
+        self.queue_wait_total = 0
+        self.queue_wait_count = 0
+        self.queue_wait_max = 0
+        self.search_time_average = 0
+        self.engine_nps = 0
+        self.request_rate = RateMeter()
+        self.histograms = {
+            "connect_seconds": Histogram(LATENCY_BUCKETS),
+            "queue_wait_seconds": Histogram(LATENCY_BUCKETS),
+            "reset_seconds": Histogram(LATENCY_BUCKETS),
+            "search_seconds": Histogram(LATENCY_BUCKETS),
+            "write_seconds": Histogram(LATENCY_BUCKETS),
+            "reply_bytes": Histogram(SIZE_BUCKETS),
+            "depth_reached": Histogram(DEPTH_BUCKETS),
+        }
+
+    def start_engines(self, program_file_name, args):
+        """Start the chess engines and return True if all started."""
+        ui_name = os.path.splitext(os.path.basename(program_file_name))[0]
+        for _ in range(self.engines):
+            engine = EngineProcess(
+                program_file_name,
+                args,
+                ui_name,
+                stream_interval=self.stream_interval,
+                transport=self.transport,
+            )
+            self.engine_processes.append(engine)
+            uciok_item = engine.start()
+            if uciok_item[0] == "start failed":
+                sys.stdout.write("Unable to start chess engine.\n")
+                return False
+            if self.uciok_item is None:
+                self.uciok_item = uciok_item
+        engine_name = " ".join(
+            (
+                CommandsFromEngine.id_,
+                SetoptionSubCommands.name,
+                "",
+            )
+        )
+        for i in self.uciok_item[1]:
+            if i.startswith(engine_name):
+                engine_name = i.split(None, 2)
+                if len(engine_name) == 3:
+                    engine_name = engine_name[2].strip()
+                    if self.uciok_item[1][-1] == CommandsFromEngine.uciok:
+                        break
+        else:
+            sys.stdout.write(
+                "Unexpected start-up response from chess engine.\n"
+            )
+            return False
+        self.engine_name = engine_name
+
+        # The store is opened here because it's analysis is by engine name.
+        # It is used in a thread of it's own so the event loop does not wait
+        # for the database.
+        if self.analysis_store is not None:
+            self.analysis_cache.store = AnalysisStore(
+                self.analysis_store,
+                engine=engine_name,
+                timeout=STORE_LOCK_TIMEOUT,
+            )
+            self.analysis_cache.executor = ThreadPoolExecutor(max_workers=1)
+        return True
+
+    def attach_engines_to_loop(self, loop):
+        """Arrange for replies from chess engines to be handled in loop."""
+        for engine in self.engine_processes:
+            engine.attach_to_loop(loop)
+
+    def quit_engines(self):
+        """Tell all chess engines to quit."""
+        for engine in self.engine_processes:
+            engine.quit()
+
+    def terminate_engines(self):
+        """Terminate all chess engine driver processes."""
+        for engine in self.engine_processes:
+            engine.terminate()
+
+    def is_engine_requested(self, start_command):
+        """Return True if start_command names the engine being served.
+
+        start_command is 'start //<host>:<port>?name=<engine name>' possibly
+        with other items in the query.
+
+        """
+        if start_command.endswith(self.engine_name):
+            return True
+        url = urlsplit(start_command.split(maxsplit=1)[-1])
+        return self.engine_name in parse_qs(url.query).get(
+            URLQueryKeys.name, ()
+        )
+
+    @property
+    def queue_depth(self):
+        """Return number of requests waiting for an engine."""
+        return sum(e.waiting for e in self.engine_processes)
+
+    def retry_after(self):
+        """Return estimated milliseconds until an engine becomes free."""
+        return int(
+            1000
+            * self.search_time_average
+            * (self.queue_depth / len(self.engine_processes) + 1)
+        )
+
+    def log(self, text):
+        """Write text to stdout as a timestamped log entry."""
+        sys.stdout.write(
+            " ".join((time.strftime("%Y-%m-%d %H:%M:%S"), text)) + "\n"
+        )
+        sys.stdout.flush()
+
+    def counters(self):
+        """Return dict of metrics which only increase."""
+        return {
+            "requests": self.requests,
+            "connections": self.connections,
+            "requests_preempting": self.requests_preempting,
+            "requests_preempted": self.requests_preempted,
+            "requests_rejected": self.requests_rejected,
+            "requests_timed_out": self.requests_timed_out,
+            "frames_compressed": self.frames_compressed,
+            "compression_saved_bytes": self.compression_saved_bytes,
+            "cache_hits": (
+                self.analysis_cache.hits if self.analysis_cache else 0
+            ),
+            "cache_misses": (
+                self.analysis_cache.misses if self.analysis_cache else 0
+            ),
+            "store_hits": (
+                self.analysis_cache.store.hits
+                if self.analysis_cache is not None
+                and self.analysis_cache.store is not None
+                else 0
+            ),
+            "store_errors": (
+                self.analysis_cache.store_errors if self.analysis_cache else 0
+            ),
+            "speculations": self.speculations,
+            "speculations_cancelled": self.speculations_cancelled,
+            "deadlines_missed": self.deadlines_missed,
+        }
+
+    def gauges(self):
+        """Return dict of metrics which go up and down."""
+        return {
+            "requests_per_second": self.request_rate.rate(),
+            "queue_depth": self.queue_depth,
+            "connections_open": self.connections_open,
+            "engines_in_use": sum(
+                1 for e in self.engine_processes if e.in_use()
+            ),
+            "queue_wait_mean": (
+                self.queue_wait_total / self.queue_wait_count
+                if self.queue_wait_count
+                else 0
+            ),
+            "queue_wait_max": self.queue_wait_max,
+            "search_time_average": self.search_time_average,
+            "engine_nps": self.engine_nps,
+            "cache_entries": (
+                len(self.analysis_cache) if self.analysis_cache else 0
+            ),
+        }
+
+    def metrics(self):
+        """Return dict of server metrics."""
+        metrics = self.counters()
+        metrics.update(self.gauges())
+        metrics["max_queue"] = self.max_queue
+        metrics["worker"] = self.worker
+        for name, histogram in self.histograms.items():
+            metrics[name] = histogram.as_dict()
+        return metrics
+
+    def prometheus_metrics(self):
+        """Return server metrics in Prometheus text format."""
+        return prometheus_text(
+            "uci_net", self.counters(), self.gauges(), self.histograms
+        )
+
+    async def handle_metrics_request(self, reader, writer):
+        """Reply to HTTP request on reader with metrics in Prometheus format.
+
+        Any request gets the metrics so the request is not parsed.
+
+        """
+        await reader.readline()
+        body = self.prometheus_metrics().encode()
+        writer.write(
+            b"".join(
+                (
+                    b"HTTP/1.0 200 OK\r\n",
+                    b"Content-Type: text/plain; version=0.0.4\r\n",
+                    b"Content-Length: ",
+                    str(len(body)).encode(),
+                    b"\r\n\r\n",
+                    body,
+                )
+            )
+        )
+        await writer.drain()
+        writer.close()
+
+    async def write_frame(self, writer, item, compress=None):
+        """Write item as a frame on writer and return it's size in bytes.
+
+        The frame is compressed if it is at least compress bytes long.
+
+        """
+        frame = encode_frame(item)
+        size = len(frame)
+        frame = compress_frame(frame, compress)
+        if len(frame) < size:
+            self.frames_compressed += 1
+            self.compression_saved_bytes += size - len(frame)
+        start = time.monotonic()
+        writer.write(frame)
+        await writer.drain()
+        self.histograms["write_seconds"].observe(time.monotonic() - start)
+        return len(frame)
+
+    def queue_depth_for(self, priority):
+        """Return number of requests waiting with priority or more urgent."""
+        return sum(
+            1
+            for e in self.engine_processes
+            for waiter in e.waiters
+            if waiter[0] <= priority
+        )
+
+    async def acquire_engine(self, session, priority, sequence, deadline=None):
+        """Return an engine reserved for request, preferring session active.
+
+        Otherwise prefer an idle engine without an active session, then an
+        engine which can be pre-empted, then the engine with fewest requests
+        of the same or more urgent priority waiting.
+
+        None is returned, without waiting, if the request would have to wait
+        when max_queue requests of the same or more urgent priority are
+        waiting already.  None is also returned if the request waits longer
+        than queue_timeout seconds, or beyond deadline, a time.monotonic()
+        value, if deadline is not None.
+
+        """
+        timeout = self.session_timeout
+        engines = self.engine_processes
+        for engine in engines:
+            if engine.is_session_active(session, timeout):
+                break
+        else:
+            engine = min(
+                engines,
+                key=lambda e: (
+                    e.in_use() and e.priority <= priority,
+                    e.in_use(),
+                    sum(1 for w in e.waiters if w[0] <= priority),
+                    e.is_session_active(e.session, timeout),
+                ),
+            )
+        if engine.in_use() and self.max_queue is not None:
+            if self.queue_depth_for(priority) >= self.max_queue:
+                self.requests_rejected += 1
+                return None
+        if engine.in_use() and priority < engine.priority:
+            self.requests_preempting += 1
+            self.log(
+                "".join(
+                    (
+                        "pre-empt priority ",
+                        str(engine.priority),
+                        " search for priority ",
+                        str(priority),
+                        " request",
+                    )
+                )
+            )
+        start = time.monotonic()
+        wait_timeout = self.queue_timeout
+        if deadline is not None:
+            remaining = deadline - start
+            if remaining <= 0:
+                self.requests_timed_out += 1
+                return None
+            if wait_timeout is None or remaining < wait_timeout:
+                wait_timeout = remaining
+        try:
+            await asyncio.wait_for(
+                engine.acquire(priority, sequence), wait_timeout
             )
+        except asyncio.TimeoutError:
+            self.requests_timed_out += 1
+            return None
+        wait = time.monotonic() - start
+        self.histograms["queue_wait_seconds"].observe(wait)
+        self.queue_wait_total += wait
+        self.queue_wait_count += 1
+        self.queue_wait_max = max(wait, self.queue_wait_max)
+        return engine
+
+    async def search(self, engine, commands, session, trace=None):
+        """Yield replies from engine to the 'go' block in commands.
+
+        The 'ucinewgame' and 'clear hash' commands postponed by the client are
+        done first unless session is active on engine.
 
-        elif commands[-1].split(maxsplit=1)[0] == CommandsToEngine.go:
+        The steps are recorded for trace, a trace identity, if not None.
 
-            # Do postponned 'ucinewgame' and 'clear hash' commands followed by
-            # 'go' block; waiting for 'readyok' and 'bestmove' commands from
-            # engine after 'ucinewgame' and 'go' commands to engine.
-            to_driver_queue.put(CommandsToEngine.ucinewgame)
-            to_driver_queue.put(CommandsToEngine.isready)
+        """
+        tracer = self.tracer
+        if tracer is not None:
+            engine.put(trace_command(trace, self.trace_file))
+        if not engine.is_session_active(session, self.session_timeout):
+
+            # Wait for 'readyok' after 'ucinewgame'.
+            start = time.monotonic()
+            trace_start = time.time()
+            engine.put(CommandsToEngine.ucinewgame)
+            engine.put(CommandsToEngine.isready)
             while True:
-                # n, c = uci_drivers_reply.get()
-                item = uci_drivers_reply.get()[1]
+                item = await engine.get()
                 if item[-1].split(maxsplit=1)[0] == CommandsFromEngine.readyok:
                     break
-            to_driver_queue.put(
+            engine.put(
                 " ".join(
                     (
                         CommandsToEngine.setoption,
@@ -106,162 +965,724 @@ if __name__ == "__main__":
                     )
                 )
             )
-            for item in commands:
-                to_driver_queue.put(item)
+            self.histograms["reset_seconds"].observe(
+                time.monotonic() - start
+            )
+            if tracer is not None:
+                tracer.record(trace, "reset", trace_start)
+        engine.session = session
+        engine.session_time = start = time.monotonic()
+        trace_start = time.time()
+
+        # A request pre-empted before the 'go' command is not searched, and
+        # no 'stop' was sent for it.
+        if engine.preempted:
+            return
+        engine.searching = True
+        for item in commands:
+            engine.put(item)
+        while True:
+            item = await engine.get()
+            yield item
+            if item[-1].split(maxsplit=1)[0] == CommandsFromEngine.bestmove:
+                break
+        engine.searching = False
+        engine.session_time = time.monotonic()
+        elapsed = engine.session_time - start
+        self.histograms["search_seconds"].observe(elapsed)
+        if tracer is not None:
+            tracer.record(trace, "search", trace_start)
+        if self.search_time_average:
+            self.search_time_average += (
+                elapsed - self.search_time_average
+            ) * SEARCH_TIME_SMOOTHING
+        else:
+            self.search_time_average = elapsed
+
+    async def reply_to_go(
+        self,
+        commands,
+        options,
+        write,
+        last=True,
+        speculate=True,
+        deadline=None,
+        trace=None,
+        **items
+    ):
+        """Write reply to 'go' block in commands with options using write.
+
+        write is a coroutine function which writes a reply item and returns
+        the number of bytes written.
+
+        In stream mode each group of lines from the engine is written when it
+        arrives.  A pre-empted search is re-queued and done again, so the
+        lines streamed so far are repeated.
+
+        The final item is marked final if last is True, and items are added
+        to each reply item in replies to dict requests.
+
+        Analysis in the cache is used if possible, and the reply is added to
+        the cache.  Speculative analysis of the positions which follow is
+        started if speculate is True.
+
+        If deadline, a time.monotonic() value, is not None the search is
+        limited by a 'movetime' ending at the deadline, and 'stop' is sent if
+        the engine is still searching shortly after the deadline.  The final
+        item then says whether the search reached it's target depth.
+
+        The steps are recorded for trace, a trace identity, if not None.
+
+        """
+        engine_name = self.engine_name
+        tracer = self.tracer
+        session = options.get(RequestKeys.session)
+        stream = options.get(RequestKeys.stream)
+        priority = Priorities.rank.get(
+            options.get(RequestKeys.priority),
+            Priorities.rank[Priorities.interactive],
+        )
+        self.requests += 1
+        depth_limit = go_limits(commands[-1]).get(GoSubCommands.depth)
+        if self.analysis_cache is not None:
+            analysis = analysis_request(commands)
+        else:
+            analysis = None
+        if analysis is not None:
+            fen, target_depth, multipv = analysis
+            reply = await self.analysis_cache.fetch(
+                fen, multipv, target_depth
+            )
+            if reply is not None:
+                if tracer is not None:
+                    tracer.record(trace, "cache_hit", time.time())
+                self.histograms["reply_bytes"].observe(
+                    await write(
+                        reply_item(
+                            engine_name,
+                            stream_lines(reply, stream) if stream else reply,
+                            options,
+                            last,
+                            **items,
+                            **depth_reached_items(
+                                deadline, depth_limit, target_depth
+                            )
+                        )
+                    )
+                )
+                return
+
+        # A re-queued request keeps it's place among requests with the same
+        # priority.
+        sequence = next(_waiter_sequence)
+        reply_bytes = 0
+        while True:
+            wait_start = time.time()
+            engine = await self.acquire_engine(
+                session, priority, sequence, deadline=deadline
+            )
+            if tracer is not None:
+                tracer.record(trace, "queue_wait", wait_start)
+            if engine is None:
+                busy = busy_reply_item(
+                    engine_name, self.retry_after(), options
+                )
+                if options:
+                    busy.update(
+                        items,
+                        final=last,
+                        **depth_reached_items(deadline, depth_limit, None)
+                    )
+                await write(busy)
+                return
             reply = []
-            while True:
-                # n, c = uci_drivers_reply.get()
-                item = uci_drivers_reply.get()[1]
-                reply.extend(item)
-                if (
-                    item[-1].split(maxsplit=1)[0]
-                    == CommandsFromEngine.bestmove
+            depth = nps = None
+            if deadline is None:
+                search_commands = commands
+                stopper = None
+            else:
+                search_commands = deadline_commands(commands, deadline)
+                stopper = asyncio.get_event_loop().call_later(
+                    max(0, deadline - time.monotonic()) + DEADLINE_STOP_GRACE,
+                    engine.stop,
+                )
+            try:
+                async for item in self.search(
+                    engine, search_commands, session, trace=trace
                 ):
-                    break
-            reply = repr((engine_name, reply))
-            writer.write(reply.encode())
+                    if engine.preempted:
+                        continue
+                    progress = search_progress(item)
+                    if progress[0] is not None:
+                        depth, nps = progress
 
-        await writer.drain()
+                    # A streamed reply is kept only for the analysis cache.
+                    if not stream:
+                        reply.extend(item)
+                        continue
+                    if analysis is not None:
+                        reply.extend(item)
+                    final = (
+                        item[-1].split(maxsplit=1)[0]
+                        == CommandsFromEngine.bestmove
+                    )
+                    lines = stream_lines(item, stream)
+                    if lines or final:
+                        reply_bytes += await write(
+                            reply_item(
+                                engine_name,
+                                lines,
+                                options,
+                                final and last,
+                                **items,
+                                **(
+                                    depth_reached_items(
+                                        deadline, depth_limit, depth
+                                    )
+                                    if final
+                                    else {}
+                                )
+                            )
+                        )
+                preempted = engine.preempted
+            finally:
+                if stopper is not None:
+                    stopper.cancel()
+                engine.release()
+            if not preempted:
+                break
+            self.requests_preempted += 1
+            self.log(
+                "".join(
+                    (
+                        "re-queue pre-empted priority ",
+                        str(priority),
+                        " request",
+                    )
+                )
+            )
+        reached = depth_reached_items(deadline, depth_limit, depth)
+        if not stream:
+            write_start = time.time()
+            reply_bytes += await write(
+                reply_item(
+                    engine_name, reply, options, last, **items, **reached
+                )
+            )
+            if tracer is not None:
+                tracer.record(trace, "write", write_start)
+        self.histograms["reply_bytes"].observe(reply_bytes)
+        if depth is not None and depth.isdigit():
+            self.histograms["depth_reached"].observe(int(depth))
+        if nps is not None and nps.isdigit():
+            self.engine_nps = int(nps)
 
-        writer.close()
+        # Analysis cut short by the deadline is not kept.
+        if reached.get(ReplyKeys.depth_reached) is False:
+            self.deadlines_missed += 1
+        elif analysis is not None:
+            self.analysis_cache.put(fen, multipv, target_depth, reply)
+            if speculate and self.speculate:
+                self.schedule_speculation(analysis, reply, session)
+
+    def schedule_speculation(self, analysis, reply, session):
+        """Replace speculative jobs with positions after moves in reply.
+
+        analysis is the (fen, depth, multipv) of the request, and the reply
+        lines contain the principal variation.  The jobs are done in session.
+
+        """
+        fen, depth, multipv = analysis
+        self.speculation_jobs.clear()
+        for position in speculative_positions(fen, reply, self.speculate):
+            if not self.analysis_cache.contains(position, multipv, depth):
+                self.speculation_jobs.append(
+                    (position, depth, multipv, session)
+                )
+        if not self.speculation_jobs:
+            return
+        if self.speculation_task is None or self.speculation_task.done():
+            self.speculation_task = asyncio.ensure_future(
+                self.speculate_while_idle()
+            )
+
+    async def speculate_while_idle(self):
+        """Do speculative jobs, one at a time, while an engine is idle.
+
+        Speculation stops when no engine is idle or a request pre-empts the
+        speculative search.  The next request schedules new jobs.  A job is
+        skipped if it's analysis is in the analysis store, or if every idle
+        engine holds another client's active session.
+
+        """
+        timeout = self.session_timeout
+        while self.speculation_jobs:
+            fen, depth, multipv, session = self.speculation_jobs.popleft()
+
+            # Positions in the analysis store are not in the cache until a
+            # request asks for them.
+            if await self.analysis_cache.store_contains(fen, multipv, depth):
+                continue
+            idle = [
+                e
+                for e in self.engine_processes
+                if not e.in_use() and not e.waiters
+            ]
+            if not idle:
+                return
+
+            # Another client's session is not disturbed by speculation.
+            candidates = [
+                e
+                for e in idle
+                if e.is_session_active(session, timeout)
+                or not e.is_session_active(e.session, timeout)
+            ]
+            if not candidates:
+                continue
+            engine = max(
+                candidates,
+                key=lambda e: e.is_session_active(session, timeout),
+            )
+            await engine.acquire(
+                SPECULATION_PRIORITY, next(_waiter_sequence)
+            )
+            self.speculations += 1
+            reply = []
+            try:
+                async for item in self.search(
+                    engine, go_commands(fen, depth, multipv), session
+                ):
+                    reply.extend(item)
+                cancelled = engine.preempted
+            finally:
+                engine.release()
+            if cancelled:
+                self.speculations_cancelled += 1
+                return
+            self.analysis_cache.put(fen, multipv, depth, reply)
 
-    class UCIServer:
-        """Capture server process parameters from command line.
+    async def reply_to_batch(
+        self, options, writer, deadline=None, trace=None
+    ):
+        """Write replies to the batch of analysis jobs in options on writer.
 
-        The process running the second and subsequent chess engines will have
-        to override the default listen port.
+        The jobs are shared between as many tasks as there are engines,
+        except that the jobs are done one at a time in a session to get the
+        benefit of the retained hash tables.
 
-        The remote hosts allowed to use this server can be restricted by giving
-        a list of hostnames in allowed_callers.  By default any host may use
-        the server.
+        The reply to each job is tagged with the job's index in the batch,
+        and the final reply item, without lines, follows the last job.
+        Without a session each task has an implicit session for the batch,
+        so an engine is reset for the first of it's jobs but not the rest.
+
+        All jobs must be done by deadline, a time.monotonic() value, if it is
+        not None.  The jobs are traced with trace, a trace identity, if it is
+        not None.
 
         """
+        engine_name = self.engine_name
+        write_lock = asyncio.Lock()
+        compress = compress_threshold(options)
 
-        listen_port = 11111
-        allowed_callers = ()
-
-        def __init__(self, listen_port=None, allowed_callers=None):
-            """Initialise to listen for allowed_callers on listen_port."""
-            if listen_port is not None:
-                self.listen_port = listen_port
-            if isinstance(allowed_callers, str):
-                self.allowed_callers = (allowed_callers,)
-            elif allowed_callers is not None:
-                self.allowed_callers = tuple(allowed_callers)
-
-    if len(sys.argv) > 4:
-        uciserver = UCIServer(
-            listen_port=sys.argv[1], allowed_callers=sys.argv[2]
-        )
-        program_file_name = sys.argv[3]
-        args = sys.argv[4:]
-    elif len(sys.argv) > 3:
-        uciserver = UCIServer(
-            listen_port=sys.argv[1], allowed_callers=sys.argv[2]
-        )
-        program_file_name = sys.argv[3]
-        args = None
-    elif len(sys.argv) > 2:
-        uciserver = UCIServer(listen_port=sys.argv[1])
-        program_file_name = sys.argv[2]
-        args = None
-    elif len(sys.argv) > 1:
-        uciserver = UCIServer()
-        program_file_name = sys.argv[1]
-        args = None
-    else:
-        sys.stdout.write(
-            "".join(
-                (
-                    "Usage:\n\n",
-                    "python[version] -m uci_net.tcp_driver ",
-                    "[port] [allowed callers] ",
-                    "path [options]\n\n",
-                    "A path to an UCI chess engine must be given.\n\n",
-                    "See chess engine documentation for 'options'.\n\n",
-                    "'allowed callers' is a comma separated hostname list.\n",
-                    "Only those on the list are allowed, but anyone is ",
-                    "allowed if\nno list is given.\n\n",
-                    "'port' is the port the server will listen on.\n",
-                    "The default is ",
-                    str(UCIServer.listen_port),
-                    ".\n\n",
+        async def write(item):
+            async with write_lock:
+                return await self.write_frame(writer, item, compress)
+
+        jobs = options.get(RequestKeys.jobs, ())
+        if not isinstance(jobs, (list, tuple)):
+            await write(
+                reply_item(
+                    engine_name,
+                    [
+                        "info string invalid jobs",
+                        CommandsFromEngine.bestmove + " 0000",
+                    ],
+                    options,
                 )
             )
-        )
-        sys.exit()
+            return
+        jobs = list(enumerate(jobs))
+        jobs.reverse()
+        batch_sessions = []
 
-    # Avoid "OSError: [WinError 535] Pipe connected"  at Python3.3 running
-    # under Wine on FreeBSD 10.1 by disabling the UCI functions.
-    # Assume all later Pythons are affected because they do not install
-    # under Wine at time of writing.
-    # The OSError stopped happening by wine-2.0_3,1 on FreeBSD 10.1 but
-    # get_nowait() fails to 'not wait', so ChessTab never gets going under
-    # wine at present.  Leave alone because it looks like the problem is
-    # being shifted constructively.
-    # At Python3.5 running under Wine on FreeBSD 10.1, get() does not wait
-    # when the queue is empty either, and ChessTab does not run under
-    # Python3.3 because it uses asyncio: so no point in disabling.
-    # try:
-    #    uci_drivers_reply = multiprocessing.Queue()
-    # except OSError:
-    #    uci_drivers_reply = None
-    uci_drivers_reply = multiprocessing.Queue()
-
-    to_driver_queue = multiprocessing.Queue()
-    driver = multiprocessing.Process(
-        target=run_driver,
-        args=(
-            to_driver_queue,
-            uci_drivers_reply,
-            program_file_name,
-            args,
-            os.path.splitext(os.path.basename(program_file_name))[0],
-        ),
-    )
-    driver.start()
+        async def do_jobs(job_options):
+            while jobs:
+                index, job = jobs.pop()
+                commands = batch_job_commands(job)
+                if commands is None:
+                    await write(
+                        reply_item(
+                            engine_name,
+                            [
+                                "info string invalid job " + repr(job),
+                                CommandsFromEngine.bestmove + " 0000",
+                            ],
+                            job_options,
+                            False,
+                            index=index,
+                        )
+                    )
+                    continue
+                await self.reply_to_go(
+                    commands,
+                    job_options,
+                    write,
+                    last=False,
+                    speculate=False,
+                    deadline=deadline,
+                    trace=trace,
+                    index=index,
+                )
 
-    # If this done here rather than in run_driver() Contol-c is ignored later.
-    # to_driver_queue.put(CommandsToEngine.uci)
+        if options.get(RequestKeys.session) is None:
 
-    uciok_item = uci_drivers_reply.get()
-    if uciok_item[0] == "start failed":
-        sys.stdout.write("Unable to start chess engine.\n")
-        sys.exit()
-    engine_name = " ".join(
-        (
-            CommandsFromEngine.id_,
-            SetoptionSubCommands.name,
-            "",
+            # Each task has a session of it's own, which no client can name,
+            # so the engine is reset before it's first job only.
+            for _ in self.engine_processes:
+                batch_sessions.append((BATCH_SESSION, next(_batch_sequence)))
+            task_options = [
+                {**options, RequestKeys.session: session}
+                for session in batch_sessions
+            ]
+        else:
+            task_options = [options]
+        try:
+            await asyncio.gather(*[do_jobs(o) for o in task_options])
+        finally:
+            for engine in self.engine_processes:
+                if engine.session in batch_sessions:
+                    engine.session = None
+        await write(reply_item(engine_name, [], options))
+
+    async def handle_client_uci_commands(self, reader, writer):
+        """Handle requests received on reader and reply on writer.
+
+        A request ending with a newline comes from a client which keeps the
+        connection open for more requests, so the reply is followed by an
+        end of reply frame and the next request is awaited.  Otherwise the
+        request is all the data before EOF and the connection is closed after
+        the reply.
+
+        """
+        self.connections += 1
+        self.connections_open += 1
+        try:
+            start = time.monotonic()
+            while True:
+                try:
+                    data = await asyncio.wait_for(
+                        reader.readline(), self.idle_timeout
+                    )
+                except (asyncio.TimeoutError, ConnectionError):
+                    break
+                except (asyncio.LimitOverrunError, ValueError):
+
+                    # readline() raises ValueError, from LimitOverrunError,
+                    # for a request longer than request_size_limit.
+                    self.log("request too long: connection closed")
+                    break
+                if not data.strip():
+                    break
+
+                # Time waiting for later requests on the connection is
+                # client idle time.
+                if start is not None:
+                    self.histograms["connect_seconds"].observe(
+                        time.monotonic() - start
+                    )
+                    start = None
+
+                self.request_rate.mark()
+                await self.reply_to_request(data.decode(), writer)
+                if not data.endswith(b"\n"):
+                    break
+                writer.write(encode_frame(END_OF_REPLY))
+                await writer.drain()
+        finally:
+            self.connections_open -= 1
+            writer.close()
+
+    async def reply_to_request(self, message, writer):
+        """Reply to request in message on writer."""
+        start = time.time()
+        request = decode_request(message)
+        if request is None:
+            writer.write(
+                encode_frame(
+                    reply_item(
+                        self.engine_name,
+                        [
+                            "info string invalid request",
+                            CommandsFromEngine.bestmove + " 0000",
+                        ],
+                        {},
+                    )
+                )
+            )
+            await writer.drain()
+            return
+        commands, options = request
+        deadline = request_deadline(options)
+        if self.tracer is not None:
+            trace = options.get(RequestKeys.trace)
+            self.tracer.record(trace, "decode", start)
+        else:
+            trace = None
+        engine_name = self.engine_name
+        if commands[-1] == CommandsToEngine.uci:
+
+            # Normal action is start engine and issue 'uci' command.
+            # Server does this at startup so check that client is asking for
+            # started engine and return the 'uciok' block sent by the engine
+            # at startup.
+            if self.is_engine_requested(commands[0]):
+                if options:
+                    writer.write(
+                        encode_frame(
+                            reply_item(
+                                engine_name, self.uciok_item[1], options
+                            )
+                        )
+                    )
+                else:
+                    writer.write(encode_frame(self.uciok_item))
+
+        elif commands[-1] == CommandsToServer.stats:
+            writer.write(encode_frame(self.metrics()))
+
+        elif commands[-1] == CommandsToEngine.isready:
+
+            # Normal action is prepare for 'setoption'(MultiPV) 'position' and
+            # 'go' commands with 'ucinewgame' and 'clear hash'.
+            # Postpone the 'isready' block until the 'go' block arrives.
+            writer.write(
+                encode_frame(
+                    reply_item(
+                        engine_name, [CommandsFromEngine.readyok], options
+                    )
+                )
+            )
+
+        elif commands[-1] == CommandsToServer.batch:
+            await self.reply_to_batch(
+                options, writer, deadline=deadline, trace=trace
+            )
+
+        elif not is_go_block(commands):
+
+            # The search may not end, or the final command may not force a
+            # reply, so refuse the block.
+            writer.write(
+                encode_frame(
+                    reply_item(
+                        engine_name,
+                        [
+                            "info string unsupported commands",
+                            CommandsFromEngine.bestmove + " 0000",
+                        ],
+                        options,
+                    )
+                )
+            )
+
+        else:
+
+            # Do postponned 'ucinewgame' and 'clear hash' commands, unless in
+            # an active session, followed by 'go' block; waiting for 'readyok'
+            # and 'bestmove' commands from engine after 'ucinewgame' and 'go'
+            # commands to engine.
+            await self.reply_to_go(
+                commands,
+                options,
+                functools.partial(
+                    self.write_frame,
+                    writer,
+                    compress=compress_threshold(options),
+                ),
+                deadline=deadline,
+                trace=trace,
+            )
+
+        await writer.drain()
+        if trace is not None:
+            self.tracer.record(trace, "request", start)
+
+
+def make_server(server_options, argv):
+    """Return (UCIServer, engine path, engine args) from command line.
+
+    server_options and argv are as returned by split_server_options().  None
+    is returned if the command line is not valid.
+
+    """
+    try:
+        if len(argv) > 3:
+            uciserver = UCIServer(
+                listen_port=argv[0], allowed_callers=argv[1], **server_options
+            )
+            program_file_name = argv[2]
+
+            # UCIDriver.start_engine() splits args with shlex.split().
+            args = " ".join(shlex.quote(arg) for arg in argv[3:])
+        elif len(argv) > 2:
+            uciserver = UCIServer(
+                listen_port=argv[0], allowed_callers=argv[1], **server_options
+            )
+            program_file_name = argv[2]
+            args = None
+        elif len(argv) > 1:
+            uciserver = UCIServer(listen_port=argv[0], **server_options)
+            program_file_name = argv[1]
+            args = None
+        elif len(argv) > 0:
+            uciserver = UCIServer(**server_options)
+            program_file_name = argv[0]
+            args = None
+        else:
+            return None
+    except (TypeError, ValueError):
+        return None
+    return uciserver, program_file_name, args
+
+
+def write_usage():
+    """Write command line usage to stdout."""
+    sys.stdout.write(
+        "".join(
+            (
+                "Usage:\n\n",
+                "python[version] -m uci_net.tcp_driver ",
+                "[--engines=<n>] [--session-timeout=<seconds>] ",
+                "[--stream-interval=<seconds>] ",
+                "[--max-queue=<n>] [--queue-timeout=<seconds>] ",
+                "[--metrics-port=<port>] [--workers=<n>] ",
+                "[--idle-timeout=<seconds>] ",
+                "[--cache-size=<n>] [--speculate=<plies>] ",
+                "[--trace-file=<file>] [--transport=<name>] ",
+                "[--analysis-store=<file>] ",
+                "[port] [allowed callers] ",
+                "path [options]\n\n",
+                "A path to an UCI chess engine must be given.\n\n",
+                "See chess engine documentation for 'options'.\n\n",
+                "'allowed callers' is a comma separated hostname list.\n",
+                "Only those on the list are allowed, but anyone is ",
+                "allowed if\nno list is given.\n\n",
+                "'port' is the port the server will listen on.\n",
+                "The default is ",
+                str(UCIServer.listen_port),
+                ".\n\n",
+                "'--engines' is the number of instances of the chess ",
+                "engine to run.\nThe default is ",
+                str(UCIServer.engines),
+                ".\n\n",
+                "'--session-timeout' is the time a session stays ",
+                "active after it's\nmost recent request.  The default ",
+                "is ",
+                str(UCIServer.session_timeout),
+                " seconds.\n\n",
+                "'--stream-interval' is the minimum time between ",
+                "frames streamed\nduring a search.  The default is ",
+                str(UCIServer.stream_interval),
+                " seconds.\n\n",
+                "'--max-queue' is the number of requests allowed to ",
+                "wait for an engine\nbefore a busy reply is sent at ",
+                "once.  The default is ",
+                str(UCIServer.max_queue),
+                ", and 0 means\nno limit.\n\n",
+                "'--queue-timeout' is the time a request may wait for ",
+                "an engine before\na busy reply is sent.  The default ",
+                "is no limit.\n\n",
+                "'--metrics-port' is the port on localhost where ",
+                "metrics are available\nin Prometheus text format.  ",
+                "By default metrics are available only by\n",
+                "the 'stats' request.  Each worker process uses the ",
+                "next port.\n\n",
+                "'--workers' is the number of worker processes, each ",
+                "running it's own\nengines, sharing the listening port ",
+                "on Linux.  The default is ",
+                str(UCIServer.workers),
+                ".\n\n",
+                "'--idle-timeout' is the time a connection kept open ",
+                "by the client\nmay be idle before the server closes ",
+                "it.  The default is ",
+                str(UCIServer.idle_timeout),
+                " seconds.\n\n",
+                "'--cache-size' is the number of analysed positions ",
+                "kept for reuse.\nThe default is ",
+                str(UCIServer.cache_size),
+                ", no cache, unless '--speculate' is given.\n\n",
+                "'--speculate' is the number of moves of the principal ",
+                "variation in a\nreply whose positions are analysed ",
+                "while an engine is idle.  The default\nis ",
+                str(UCIServer.speculate),
+                ", no speculation.\n\n",
+                "'--trace-file' is the file where the time taken by ",
+                "each step of traced\nrequests is recorded.  By default ",
+                "requests are not traced.\n\n",
+                "'--transport' is how commands and replies pass ",
+                "between the server and\nit's engine driver processes: ",
+                "'",
+                QUEUE_TRANSPORT,
+                "' or '",
+                SHARED_MEMORY_TRANSPORT,
+                "', which needs\nPython 3.8 or later.  The default ",
+                "is '",
+                UCIServer.transport,
+                "'.\n\n",
+                "'--analysis-store' is a sqlite3 database where ",
+                "analysis is kept\nbehind the analysis cache, so it ",
+                "survives restarts of the server.\nBy default analysis ",
+                "is not kept.\n\n",
+            )
         )
     )
-    for i in uciok_item[1]:
-        if i.startswith(engine_name):
-            engine_name = i.split(None, 2)
-            if len(engine_name) == 3:
-                engine_name = engine_name[2].strip()
-                if uciok_item[1][-1] == CommandsFromEngine.uciok:
-                    break
-    else:
-        sys.stdout.write("Unexpected start-up response from chess engine.\n")
-        to_driver_queue.put(CommandsToEngine.quit_)
-        sys.exit()
+
+
+def serve(uciserver, program_file_name, args, reuse_port=False):
+    """Start chess engines and serve requests until interrupted.
+
+    reuse_port allows other processes to listen on the same port.
+
+    """
+    if not uciserver.start_engines(program_file_name, args):
+        uciserver.quit_engines()
+        return
 
     loop = asyncio.get_event_loop()
+    uciserver.attach_engines_to_loop(loop)
     coro = asyncio.start_server(
-        handle_client_uci_commands,
+        uciserver.handle_client_uci_commands,
         UCI_ENGINE_LISTEN_HOSTNAME,
         uciserver.listen_port,
-        loop=loop,
+        reuse_port=reuse_port or None,
+        limit=uciserver.request_size_limit,
     )
     server = loop.run_until_complete(coro)
+    if uciserver.metrics_port is not None:
+        metrics_server = loop.run_until_complete(
+            asyncio.start_server(
+                uciserver.handle_metrics_request,
+                METRICS_LISTEN_HOSTNAME,
+                uciserver.metrics_port,
+            )
+        )
+    else:
+        metrics_server = None
 
     # Serve requests until Ctrl+C is pressed or termination
     sys.stdout.write(
-        "Serving {} on {}\n".format(
-            engine_name, server.sockets[0].getsockname()
+        "Serving {} on {}{}\n".format(
+            uciserver.engine_name,
+            server.sockets[0].getsockname(),
+            (
+                ""
+                if uciserver.worker is None
+                else " in worker " + str(uciserver.worker)
+            ),
         )
     )
+    sys.stdout.flush()
     try:
         loop.run_forever()
     except (KeyboardInterrupt, SystemExit):
@@ -270,9 +1691,66 @@ if __name__ == "__main__":
     # Close the server
     server.close()
     loop.run_until_complete(server.wait_closed())
+    if metrics_server is not None:
+        metrics_server.close()
+        loop.run_until_complete(metrics_server.wait_closed())
     loop.close()
     sys.stdout.write("\nClosed\n")
 
     # Terminate the driver
-    driver.terminate()
-    driver.join(10)
+    uciserver.terminate_engines()
+    if uciserver.analysis_cache is not None:
+        uciserver.analysis_cache.close()
+
+
+# This side of "if __name__ == '__main__'" so multiprocessing.Process() target
+# reference works on Microsoft Windows.
+def run_worker(server_options, argv, worker):
+    """Serve requests in worker process sharing listening port."""
+    uciserver, program_file_name, args = make_server(server_options, argv)
+    uciserver.worker = worker
+    if uciserver.metrics_port is not None:
+        uciserver.metrics_port += worker
+    try:
+        serve(uciserver, program_file_name, args, reuse_port=True)
+    except KeyboardInterrupt:
+        pass
+
+
+def run_workers(server_options, argv, workers):
+    """Run workers processes sharing the listening port until interrupted."""
+    processes = [
+        multiprocessing.Process(
+            target=run_worker, args=(server_options, argv, worker)
+        )
+        for worker in range(workers)
+    ]
+    for process in processes:
+        process.start()
+    try:
+        for process in processes:
+            process.join()
+    except KeyboardInterrupt:
+        pass
+    for process in processes:
+        process.join(15)
+        if process.is_alive():
+            process.terminate()
+
+
+if __name__ == "__main__":
+
+    server_options, argv = split_server_options(sys.argv[1:])
+    server_args = make_server(server_options, argv)
+    if server_args is None:
+        write_usage()
+        sys.exit()
+    if server_args[0].workers > 1:
+        if not hasattr(socket, "SO_REUSEPORT"):
+            sys.stdout.write(
+                "Worker processes need SO_REUSEPORT sockets, as on Linux.\n"
+            )
+            sys.exit()
+        run_workers(server_options, argv, server_args[0].workers)
+    else:
+        serve(*server_args)
@@ -0,0 +1,198 @@
+# tracing.py
+# Copyright 2026 Roger Marsh
+# License: See LICENSE.TXT (BSD licence)
+
+"""Record timed spans of traced requests and show them as waterfalls.
+
+Usage:
+
+python -m uci_net.tracing [--trace=<trace id>] file [file ...]
+
+where each file contains spans recorded by tcp_client, tcp_server, and the
+run_driver processes.  A waterfall is shown for each trace in the files, or
+just the trace given.
+
+A client asks for a request to be traced by putting a trace identity in the
+request.  Each process the request passes through which has a trace file
+appends a span, as a line of JSON, to the file for each step it times.  A
+span has the trace identity, the process and step names, the process id,
+and the start and end times from time.time().  The files from different
+hosts can be merged by this tool, but the waterfall is only as accurate as
+the agreement between the host clocks.
+
+"""
+
+import sys
+import os
+import json
+import time
+from contextlib import contextmanager
+
+# Use the multiprocessing API for threading
+from multiprocessing import dummy
+
+# The first item of the tuple put on a run_driver process' command queue to
+# set the trace identity for the commands which follow.
+TRACE_COMMAND = "trace"
+
+# Width of the bars in a waterfall.
+WATERFALL_WIDTH = 50
+
+# Tracers by (file path, process name).
+_tracers = {}
+_tracers_lock = dummy.Lock()
+
+
+def new_trace_id():
+    """Return a new trace identity."""
+    return os.urandom(8).hex()
+
+
+class Tracer:
+    """Append spans for process to a file of JSON lines."""
+
+    def __init__(self, path, process):
+        """Initialise to append spans for process to file at path."""
+        self.path = path
+        self.process = process
+        self.pid = os.getpid()
+        self._lock = dummy.Lock()
+
+    def record(self, trace_id, span, start, end=None, **items):
+        """Append span of trace_id from start to end, default now, to file.
+
+        Nothing is recorded if trace_id is None.  items are added to the
+        span.
+
+        """
+        if trace_id is None:
+            return
+        if end is None:
+            end = time.time()
+        entry = {
+            "trace": trace_id,
+            "process": self.process,
+            "span": span,
+            "pid": self.pid,
+            "start": start,
+            "end": end,
+        }
+        entry.update(items)
+        line = json.dumps(entry) + "\n"
+
+        # Each span is written in one append so the spans from processes
+        # sharing the file are not interleaved.
+        with self._lock:
+            with open(self.path, "a", encoding="utf-8") as tracefile:
+                tracefile.write(line)
+
+    @contextmanager
+    def span(self, trace_id, span, **items):
+        """Record span of trace_id for the duration of a with statement."""
+        start = time.time()
+        try:
+            yield
+        finally:
+            self.record(trace_id, span, start, **items)
+
+
+def get_tracer(path, process):
+    """Return Tracer for process appending to path, or None if path is None.
+
+    One Tracer is created for each path and process.
+
+    """
+    if path is None:
+        return None
+    with _tracers_lock:
+        tracer = _tracers.get((path, process))
+        if tracer is None or tracer.pid != os.getpid():
+            tracer = Tracer(path, process)
+            _tracers[path, process] = tracer
+    return tracer
+
+
+def trace_command(trace_id, path):
+    """Return command telling a run_driver process to trace the next search.
+
+    The time the command is made is included so the time spent on the
+    command queue can be recorded.
+
+    """
+    return (TRACE_COMMAND, trace_id, path, time.time())
+
+
+def is_trace_command(command):
+    """Return True if command was made by trace_command()."""
+    return isinstance(command, tuple) and command[:1] == (TRACE_COMMAND,)
+
+
+def read_spans(paths):
+    """Return dict of trace id: list of spans, sorted by start, in paths."""
+    traces = {}
+    for path in paths:
+        with open(path, encoding="utf-8") as tracefile:
+            for line in tracefile:
+                try:
+                    span = json.loads(line)
+                except ValueError:
+                    continue
+                traces.setdefault(span["trace"], []).append(span)
+    for spans in traces.values():
+        spans.sort(key=lambda span: (span["start"], -span["end"]))
+    return traces
+
+
+def waterfall(trace_id, spans, width=WATERFALL_WIDTH):
+    """Return text waterfall of spans in trace_id.
+
+    Each line gives the span's start, relative to the earliest span, and
+    duration in milliseconds, it's process and name, and a bar showing when
+    the span happened.
+
+    """
+    origin = min(span["start"] for span in spans)
+    total = max(span["end"] for span in spans) - origin or 1
+    lines = [
+        "".join(
+            (
+                "trace ",
+                trace_id,
+                "  total ",
+                format(total * 1000, ".1f"),
+                " ms\n",
+            )
+        )
+    ]
+    for span in spans:
+        offset = span["start"] - origin
+        duration = span["end"] - span["start"]
+        begin = int(offset / total * width)
+        length = max(1, int(duration / total * width))
+        lines.append(
+            "{:>9.1f} {:>9.1f}  {:<24} |{}{}{}|\n".format(
+                offset * 1000,
+                duration * 1000,
+                " ".join((span["process"], span["span"]))[:24],
+                " " * begin,
+                "#" * min(length, width - begin),
+                " " * max(0, width - begin - length),
+            )
+        )
+    return "".join(lines)
+
+
+if __name__ == "__main__":
+
+    arguments = sys.argv[1:]
+    wanted = None
+    if arguments and arguments[0].startswith("--trace="):
+        wanted = arguments.pop(0).partition("=")[2]
+    if not arguments:
+        sys.stdout.write(__doc__)
+        sys.exit()
+    sys.stdout.write("    start  duration  span (ms)\n")
+    for trace, trace_spans in read_spans(arguments).items():
+        if wanted is None or trace == wanted:
+            sys.stdout.write(waterfall(trace, trace_spans))
+            sys.stdout.write("\n")
@@ -11,30 +11,55 @@ The chess engine must support the Universal Chess Interface (UCI).
 import subprocess
 from collections import deque
 import shlex
+import time
 
 # Use the multiprocessing API for threading
 from multiprocessing import dummy
 
 import sys
 
-from .engine import CommandsFromEngine, CommandsToEngine
+from .engine import CommandsFromEngine, CommandsToEngine, Engine
 
 _TERMINATE_PENDING = frozenset((CommandsToEngine.uci, CommandsToEngine.stop))
 
+# The command whose reply ends with each terminating response, for tracing.
+_TRACED_COMMANDS = {
+    CommandsFromEngine.bestmove: CommandsToEngine.go,
+    CommandsFromEngine.readyok: CommandsToEngine.isready,
+    CommandsFromEngine.uciok: CommandsToEngine.uci,
+}
+
 
 class UCIDriver:
     """Give commands to chess engine and collect UCI protocol responses."""
 
-    def __init__(self, to_ui_queue, ui_name):
-        """Initialize with queue for responses to named user interface."""
+    def __init__(
+        self, to_ui_queue, ui_name, stream_interval=None, parse=False
+    ):
+        """Initialize with queue for responses to named user interface.
+
+        If stream_interval is not None, responses received so far are put on
+        to_ui_queue when an info command arrives at least stream_interval
+        seconds after the previous put, rather than waiting for a
+        terminating command such as bestmove.
+
+        If parse is True the responses are parsed by an Engine instance in
+        this process, and an EngineResults summary is put on to_ui_queue
+        rather than the list of responses.  The user interface process then
+        does not spend time parsing info commands it will not display.
+
+        """
         self.to_ui_queue = to_ui_queue
         self.ui_name = ui_name
+        self.stream_interval = stream_interval
+        self.parser = Engine() if parse else None
         self.engine_process = None
         self.engine_process_responses = deque()
         self._engine_response_handler = None
         self._termination_handler = None
         self._command_done = dummy.Event()
         self._responses_collected = dummy.Event()
+        self._responses_lock = dummy.Lock()
 
         # Keep a note of each command in a batch so when the engine responses
         # appear futher short waits for responses can be done for optional
@@ -42,6 +67,11 @@ class UCIDriver:
         # to engines.
         self._commands_sent = deque()
 
+        # None, or (Tracer, trace identity) to record the time from sending
+        # a command to receiving the response which ends it's reply.
+        self.trace = None
+        self._trace_sent = {}
+
     def start_engine(self, path, args):
         """Start engine specified in path passing argsto engine.
 
@@ -85,7 +115,21 @@ class UCIDriver:
         else:
             args = [path]
         self.insert_remote_hostname_port(args)
-        self.engine_process = subprocess.Popen(
+        self.engine_process = self.open_engine_process(args, startupinfo)
+        self._engine_response_handler.start()
+        self._termination_handler.start()
+
+        return True
+
+    def open_engine_process(self, args, startupinfo):
+        """Return subprocess.Popen instance running command line in args.
+
+        See uci_driver_over_tcp for a version of this method which may return
+        an object with the subset of the subprocess.Popen interface used by
+        UCIDriver rather than start a process.
+
+        """
+        return subprocess.Popen(
             args,
             stdin=subprocess.PIPE,
             stdout=subprocess.PIPE,
@@ -93,10 +137,6 @@ class UCIDriver:
             universal_newlines=True,
             startupinfo=startupinfo,
         )
-        self._engine_response_handler.start()
-        self._termination_handler.start()
-
-        return True
 
     def insert_remote_hostname_port(self, args):
         """Assume args contains a valid command line and do nothing.
@@ -139,6 +179,9 @@ class UCIDriver:
         eng = self.engine_process
         epr = self.engine_process_responses
         cfet = CommandsFromEngine.terminators
+        info = CommandsFromEngine.info
+        stream_interval = self.stream_interval
+        streamed = time.monotonic()
         while eng.poll() is None:
 
             # On Windows 10 Ctrl C while waiting for a response from the UCI
@@ -149,10 +192,17 @@ class UCIDriver:
             if not response:
                 continue
             epr.append(response)
-            if epr[-1].split(maxsplit=1)[0] in cfet:
+            command = epr[-1].split(maxsplit=1)[0]
+            if command in cfet:
                 self._command_done.set()
                 self._responses_collected.wait()
                 self._responses_collected.clear()
+                streamed = time.monotonic()
+            elif stream_interval is not None and command == info:
+                now = time.monotonic()
+                if now - streamed >= stream_interval:
+                    self._put_responses()
+                    streamed = now
 
     def _process_response_terminations(self):
         """Process chess engine responses."""
@@ -162,23 +212,74 @@ class UCIDriver:
         while True:
             self.wait_for_responses()
             response = []
+
+            # A 'bestmove' is the reply expected to 'stop' so there is no need
+            # to wait for more replies.
+            bestmove = (
+                epr[-1].split(maxsplit=1)[0] == CommandsFromEngine.bestmove
+            )
+
             while len(cst):
                 command_sent = cst.popleft()
                 if command_sent in _TERMINATE_PENDING:
+                    if bestmove and command_sent == CommandsToEngine.stop:
+                        continue
                     self.collect_more_responses()
                     self.wait_for_responses_timeout(timeout=0.5)
+            with self._responses_lock:
+                while len(epr):
+                    response.append(epr.popleft())
+                self.collect_more_responses()
+                tuq.put(self._reply(response))
+            if self.trace is not None and response:
+                self._record_trace(response[-1])
+
+    def _record_trace(self, response):
+        """Record span for command whose reply is ended by response."""
+        command = _TRACED_COMMANDS.get(response.split(maxsplit=1)[0])
+        start = self._trace_sent.pop(command, None)
+        if start is not None:
+            self.trace[0].record(self.trace[1], command, start)
+
+    def _put_responses(self):
+        """Put responses collected so far on to_ui_queue."""
+        epr = self.engine_process_responses
+        with self._responses_lock:
+            response = []
             while len(epr):
                 response.append(epr.popleft())
-            self.collect_more_responses()
-            tuq.put((self.ui_name, response))
+            if response:
+                self.to_ui_queue.put(self._reply(response))
+
+    def _reply(self, response):
+        """Return item to put on to_ui_queue for response.
+
+        The caller must hold _responses_lock when parse is True so the
+        responses reach the parser in order.
+
+        """
+        if self.parser is None:
+            return self.ui_name, response
+        return self.ui_name, self.parser.engine_results(response)
 
     def send_to_engine(self, command):
         """Write command to engine's stdin and note for reply processing."""
         eps = self.engine_process.stdin
+        word = command.split(None, maxsplit=1)[0]
+
+        # Noted before the write because the reply may arrive before the
+        # write returns.
+        if self.trace is not None:
+            self._trace_sent.setdefault(word, time.time())
         eps.write(command)
         eps.write("\n")
         eps.flush()
-        self._commands_sent.append(command.split(None, maxsplit=1)[0])
+        self._commands_sent.append(word)
+
+    def set_trace(self, trace):
+        """Set trace, None or (Tracer, trace identity), for later commands."""
+        self.trace = trace
+        self._trace_sent = {}
 
     def wait_for_responses(self):
         """Wait for responses from chess engines."""
@@ -5,14 +5,62 @@
 """Universal Chess Interface (UCI) communication with chess engine driver."""
 
 import sys
+import subprocess
+import time
 from urllib.parse import urlsplit
 
+# Use the multiprocessing API for threading
+from multiprocessing import dummy
+
 from .uci_driver import UCIDriver
+from .tcp_client import (
+    CommandBatcher,
+    ConnectionPool,
+    ServerList,
+    server_addresses,
+    request_options,
+    ignored_options_text,
+    is_keepalive,
+    trace_file,
+)
+from .tcp_protocol import encode_request, failure_lines, reply_lines
+from .tracing import get_tracer, new_trace_id
 
 
 class UCIDriverOverTCP(UCIDriver):
     """Implement communication with chess engine processes."""
 
+    def __init__(
+        self,
+        to_ui_queue,
+        ui_name,
+        stream_interval=None,
+        in_process=False,
+        parse=False,
+    ):
+        """Initialize with queue for responses to named user interface.
+
+        If in_process is True remote engines are used over a socket from this
+        process rather than by a tcp_client process.
+
+        """
+        super().__init__(
+            to_ui_queue, ui_name, stream_interval=stream_interval, parse=parse
+        )
+        self.in_process = in_process
+
+    def open_engine_process(self, args, startupinfo):
+        """Return TCPEngineConnection for remote engine if in_process is True.
+
+        Otherwise return subprocess.Popen instance running command line in
+        args.
+
+        """
+        if self.in_process:
+            if server_addresses(urlsplit(args[0])):
+                return TCPEngineConnection(args[0])
+        return super().open_engine_process(args, startupinfo)
+
     def insert_remote_hostname_port(self, args):
         """Prepend args with tcp_client command if hostname or port in args[0].
 
@@ -23,9 +71,13 @@ class UCIDriverOverTCP(UCIDriver):
 
         Otherwise the UCI chess engine on localhost is used directly.
 
+        Nothing is done if in_process is True because no tcp_client process
+        is needed.
+
         """
-        url = urlsplit(args[0])
-        if url.port or url.hostname:
+        if self.in_process:
+            return
+        if server_addresses(urlsplit(args[0])):
             args.insert(0, "uci_net.tcp_client")
             args.insert(0, "-m")
             args.insert(
@@ -41,3 +93,131 @@ class UCIDriverOverTCP(UCIDriver):
                     )
                 ),
             )
+
+
+class TCPEngineConnection:
+    """Use a remote engine over TCP like a subprocess.Popen running tcp_client.
+
+    Commands written to stdin are collected into batches, as tcp_client does,
+    and each batch is sent to the server by a thread in this process.  Lines
+    in the replies are read from stdout.  The connection is kept open between
+    batches if the url asks for keepalive.
+
+    The stdin and stdout attributes are the instance itself, providing the
+    write, flush, and readline methods used by UCIDriver.
+
+    """
+
+    def __init__(self, url):
+        """Initialise connection to the engine at url."""
+        self.url = url
+        split_url = urlsplit(url)
+        self.options, ignored = request_options(split_url)
+        if ignored:
+            sys.stderr.write(url + "\n" + ignored_options_text(ignored))
+        self.pool = ConnectionPool() if is_keepalive(split_url) else None
+        self.servers = ServerList(server_addresses(split_url), pool=self.pool)
+        self.batcher = CommandBatcher(url)
+        self.tracer = get_tracer(trace_file(split_url), "tcp_client")
+        self.returncode = None
+        self.stdin = self
+        self.stdout = self
+        self._text = ""
+        self._batches = dummy.Queue()
+        self._lines = dummy.Queue()
+        self._sender = dummy.Process(target=self._send_batches)
+        self._sender.daemon = True
+        self._sender.start()
+
+    def _send_batches(self):
+        """Send batches to server one at a time and queue the reply lines."""
+        while True:
+            commands = self._batches.get()
+            if commands is None:
+                break
+            trace_id = new_trace_id() if self.tracer else None
+            message = encode_request(commands, trace=trace_id, **self.options)
+            start = time.time()
+            first = True
+            last_line = ""
+            try:
+                for item in self.servers.iter_reply(message):
+                    if first and self.tracer:
+                        self.tracer.record(trace_id, "first_reply", start)
+                    first = False
+                    for line in reply_lines(item):
+                        self._lines.put(line + "\n")
+                        last_line = line
+                if self.tracer:
+                    self.tracer.record(trace_id, "request", start)
+            except Exception as exc:
+                sys.stderr.write(
+                    "".join(
+                        (
+                            "A problem has occurred with the UCI chess ",
+                            "engine at ",
+                            self.url,
+                            ": ",
+                            str(exc),
+                            "\n",
+                        )
+                    )
+                )
+
+                # The reply may have stopped part way, so the line awaited by
+                # the user interface is added unless it has arrived.
+                lines = failure_lines(commands, str(exc))
+                awaited = lines[-1].split()[0]
+                if len(lines) > 1 and last_line.split()[:1] == [awaited]:
+                    lines.pop()
+                for line in lines:
+                    self._lines.put(line + "\n")
+        if self.pool:
+            self.pool.close()
+
+    def write(self, text):
+        """Add text to batch being collected and queue completed batches."""
+        lines = (self._text + text).split("\n")
+        self._text = lines.pop()
+        for line in lines:
+            commands = self.batcher.add(line)
+            if commands:
+                self._batches.put(commands)
+
+    def flush(self):
+        """Do nothing because complete lines are processed by write."""
+
+    def readline(self):
+        """Return next line from server, or '' after the connection ends."""
+        if self.returncode is not None:
+            return ""
+        return self._lines.get()
+
+    def poll(self):
+        """Return None while the connection is open, like Popen.poll()."""
+        return self.returncode
+
+    def communicate(self, input=None, timeout=None):
+        """Close the connection, like Popen.communicate(), and return ('', '').
+
+        input is ignored because the server does not accept quit.
+
+        """
+        del input
+        if self.returncode is None:
+            self._close(0)
+            self._sender.join(timeout)
+            if self._sender.is_alive():
+                raise subprocess.TimeoutExpired(self.url, timeout)
+        return "", ""
+
+    def kill(self):
+        """Close the connection without waiting for the current batch."""
+        self._close(-9)
+
+    def _close(self, returncode):
+        """Stop sending batches and wake readline."""
+        if self.returncode is None:
+            self.returncode = returncode
+            self._batches.put(None)
+            self._lines.put("")